@@ -80,6 +80,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Conexiones persistentes: el proceso watch_documents reutiliza la misma conexión
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -145,6 +148,27 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MONITORED_FOLDER = os.path.expanduser('~/Documents/Main/WorkFolder')
 MAIN_FOLDER = MEDIA_ROOT  # Ahora Main es el MEDIA_ROOT
 
+# Recorrido de la carpeta de monitoreo
+MONITORED_FOLDER_RECURSIVE = False  # True para entrar en subcarpetas (p. ej. una por día)
+MONITORED_FOLDER_INCLUDE = ['*.pdf']
+MONITORED_FOLDER_EXCLUDE = []
+
+# Bitácora de importación para reanudar corridas interrumpidas
+# (None = WorkFolder/processed/.ingest_journal.jsonl)
+INGESTION_JOURNAL_PATH = None
+
+# Archivos que el escáner aún está escribiendo se difieren hasta que estén completos:
+# cierre reportado por inotify, o tamaño/fecha sin cambios durante INGEST_STABLE_SECONDS,
+# y en ambos casos el trailer %%EOF presente
+INGEST_STABILITY_CHECK = True
+INGEST_STABLE_SECONDS = 5
+INGEST_TRAILER_GRACE_SECONDS = 600  # Después de esto se importa aunque falte %%EOF
+
+# Estrategia para colocar copias de PDFs (processed/, Pending/, Organized/)
+# Opciones: 'auto', 'hardlink', 'reflink', 'copy_file_range', 'copy'
+# 'auto' usa la más barata que soporte el sistema de archivos
+FILE_PLACEMENT_STRATEGY = 'auto'
+
 # Crear las carpetas si no existen
 os.makedirs(MONITORED_FOLDER, exist_ok=True)
 os.makedirs(MAIN_FOLDER, exist_ok=True)
@@ -168,6 +192,130 @@ USAGE_CONFIG = {
 }
 
 # Celery settings
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+
+# Modo 'eager': las tareas se ejecutan en el mismo proceso (pruebas, sin broker)
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER') == '1'
+CELERY_TASK_EAGER_PROPAGATES = True
+
+# Broker local sin Redis: CELERY_BROKER_URL='filesystem://'
+if CELERY_BROKER_URL.startswith('filesystem://'):
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        'data_folder_in': str(BASE_DIR / '.celery' / 'queue'),
+        'data_folder_out': str(BASE_DIR / '.celery' / 'queue'),
+        'processed_folder': str(BASE_DIR / '.celery' / 'processed'),
+        'control_folder': str(BASE_DIR / '.celery' / 'control'),
+    }
+    for _folder in CELERY_BROKER_TRANSPORT_OPTIONS.values():
+        os.makedirs(_folder, exist_ok=True)
+
+# Colas: 'ingest' es el único escritor de la BD y debe correr con concurrencia 1
+#   celery -A doctrac worker -Q ingest -c 1
+#   celery -A doctrac worker -Q pipeline -c 4
+CELERY_TASK_ROUTES = {
+    'documents.tasks.ingest_chunk': {'queue': 'ingest'},
+    'documents.tasks.process_upload': {'queue': 'ingest'},
+    'documents.tasks.process_document': {'queue': 'ingest'},
+    # OCR: celery -A doctrac worker -Q ocr -c 1
+    'documents.tasks.ocr_pages': {'queue': 'ocr'},
+}
+CELERY_TASK_DEFAULT_QUEUE = 'pipeline'
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Importación asíncrona: sync_documents --async y subidas manuales vía Celery
+DOCUMENT_INGESTION_ASYNC = False
+INGEST_CHUNK_SIZE = 100  # Archivos por tarea
+INGEST_GROUP_SIZE = 20  # Tareas por grupo despachado
+INGEST_TASK_RATE_LIMIT = '60/m'  # Máximo de lotes por minuto por worker
+
+# Etapas posteriores a la importación (miniaturas, texto, etc.), fuera del proceso que importa:
+# 'queue' (tabla drenada por process_pipeline), 'celery' (cola 'pipeline') o 'inline' (mismo proceso)
+DOCUMENT_PIPELINE = 'queue'
+PIPELINE_CLAIM_TIMEOUT = 3600  # Segundos tras los que un lote reclamado por un worker caído se reintenta
+PIPELINE_MAX_ATTEMPTS = 3  # Intentos por documento antes de dejarlo en la cola sin procesar
+
+# Miniaturas de las primeras páginas (caché en disco con desalojo LRU)
+THUMBNAIL_CACHE_DIR = BASE_DIR / 'cache' / 'thumbnails'
+THUMBNAIL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+THUMBNAIL_PAGES = 1  # Páginas con miniatura generada al importar
+THUMBNAIL_SIZES = {'small': 160, 'preview': 900}  # Ancho en píxeles
+THUMBNAIL_FORMAT = 'JPEG'  # JPEG codifica mucho más rápido que WEBP
+THUMBNAIL_QUALITY = 80
+
+# Páginas individuales (/documents/<pk>/page/<n>/) como PDF o imagen (caché en disco con desalojo LRU)
+PAGE_CACHE_DIR = BASE_DIR / 'cache' / 'pages'
+PAGE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+PAGE_IMAGE_WIDTH = 1275  # Ancho en píxeles de las páginas como imagen (carta a 150 dpi)
+PAGE_IMAGE_QUALITY = 85
+PAGE_PREVIEW_MIN_PAGES = 20  # Desde cuántas páginas la vista de detalle muestra una página a la vez
+
+# Marca de agua (usuario y fecha) en los PDFs, páginas e imágenes que se entregan a usuarios sin acceso total.
+# Se genera una vez por archivo, usuario y día, y se guarda en una caché en disco con desalojo LRU.
+# Un PDF con contraseña de apertura no se puede marcar: esos usuarios reciben 403
+WATERMARK_PDFS = True
+WATERMARK_TEXT = '{username} · {date}'  # También disponible: {name}
+WATERMARK_CACHE_DIR = BASE_DIR / 'cache' / 'watermarked'
+WATERMARK_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+WATERMARK_MIN_IMAGE_SIZE = 400  # Miniaturas más chicas (lado mayor, en píxeles) se entregan sin marca
+
+# Entrega de los PDFs: 'django' (streaming desde el worker), 'x-accel' (nginx), 'x-sendfile'
+# (Apache/lighttpd) o 'signed' (redirección a una URL firmada con HMAC que valida el servidor estático)
+DOCUMENT_DELIVERY = 'django'
+# Carpeta servible → prefijo de URL en el servidor frontal (en nginx, una location 'internal' con alias)
+DOCUMENT_DELIVERY_LOCATIONS = {
+    MEDIA_ROOT: '/protected/media/',
+    WATERMARK_CACHE_DIR: '/protected/watermarked/',
+}
+DOCUMENT_SIGNING_KEY = None  # Clave compartida con el servidor estático (por defecto, SECRET_KEY)
+DOCUMENT_SIGNED_URL_TTL = 300  # Segundos de validez de una URL firmada
+
+# Clasificador local (TF-IDF + Naive Bayes) que sugiere categoría, tipo y entidad
+CLASSIFIER_MODEL_PATH = BASE_DIR / 'cache' / 'classifier.json'  # Se regenera con train_classifier --full
+CLASSIFIER_MIN_CONFIDENCE = 0.6  # Por debajo no se preselecciona en el dashboard
+
+# Fechas detectadas en el texto del PDF (fecha del documento y vencimiento)
+DATE_EXTRACTION_DAY_FIRST = True  # 03/04/2024 = 3 de abril (salvo etiqueta en inglés)
+DATE_EXTRACTION_MIN_CONFIDENCE = 0.5  # Mínimo para completar la fecha del documento
+
+# Casi duplicados (firmas MinHash del texto con índice LSH): el dashboard marca los pendientes
+# que parecen duplicar un documento ya revisado. Recalcular con: python manage.py index_near_duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8  # Similitud de Jaccard mínima (trigramas de palabras)
+
+# Documentos relacionados (índice TF-IDF disperso con vecinos precalculados). Se actualiza al
+# importar y con: python manage.py index_related_documents (--full recalcula las frecuencias de
+# documento, que se guardan en la base de datos junto con los vectores)
+RELATED_DOCUMENTS_COUNT = 8  # Vecinos guardados por documento
+
+# Derivado optimizado de cada PDF (linealizado e imágenes recomprimidas) que serve_document
+# entrega en lugar del original; también con: python manage.py optimize_documents
+PDF_OPTIMIZE = False  # Etapa opcional del pipeline al importar
+PDF_OPTIMIZE_QUALITY = 75  # Calidad JPEG: más alta = mejor imagen, archivos más grandes
+PDF_OPTIMIZE_MAX_DPI = 150  # Resolución máxima de las páginas escaneadas
+
+# Derivado sin páginas en blanco (reversos de escaneos dúplex); el optimizado se genera sobre él.
+# También con: python manage.py remove_blank_pages
+BLANK_PAGE_REMOVAL = False  # Etapa opcional del pipeline al importar
+BLANK_PAGE_THRESHOLD = 0.001  # Fracción máxima de tinta de una página en blanco
+
+# División de lotes escaneados (varios documentos en un PDF) en documentos separados;
+# también con: python manage.py split_batches
+SCAN_SPLIT_MODE = None  # None (desactivado), 'blank', 'marker' o 'pages'
+SCAN_SPLIT_FOLDER = ''  # Subcarpeta de la carpeta de monitoreo con los lotes ('' = todos los PDFs importados)
+SCAN_SPLIT_PAGES = 1  # Modo 'pages': páginas por documento
+SCAN_SPLIT_MARKER = 'DOCTRAC-SEPARADOR'  # Modo 'marker': texto de la hoja separadora
+SCAN_SPLIT_BLANK_THRESHOLD = 0.001  # Modo 'blank': fracción máxima de tinta de una página en blanco
+
+# OCR local (tesseract) de las páginas escaneadas sin capa de texto; también con:
+# python manage.py ocr_documents
+OCR_ENABLED = False  # Etapa opcional del pipeline al importar
+OCR_TESSERACT_CMD = 'tesseract'
+OCR_LANGUAGE = 'spa+eng'  # Idiomas instalados de tesseract
+OCR_DPI = 300  # Resolución a la que se renderiza cada página
+OCR_MIN_PAGE_CHARS = 20  # Una página con menos texto que esto se considera escaneada
+OCR_PAGE_TIMEOUT = 120  # Segundos máximos por página
+OCR_WORKERS = 2  # Procesos de ocr_documents
+OCR_NICE = 10  # Prioridad reducida de los procesos de OCR (no quitarle CPU al servidor web)
+OCR_PAGES_PER_MINUTE = 60  # Ritmo máximo (0 = sin límite)
+OCR_TASK_RATE_LIMIT = '30/m'  # Tareas de OCR por minuto por worker de Celery
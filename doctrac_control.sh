@@ -5,6 +5,7 @@
 SCRIPT_DIR="/Users/ricardovazquez/Documents/GitHub/DocTrac"
 LOG_FILE="/tmp/doctrac_sync.log"
 PID_FILE="/tmp/doctrac_sync.pid"
+PIPELINE_PID_FILE="/tmp/doctrac_pipeline.pid"
 
 case "$1" in
     start)
@@ -56,6 +57,42 @@ case "$1" in
         "$SCRIPT_DIR/sync_documents.sh"
         ;;
     
+    watch-start)
+        echo "👀 Iniciando vigilancia continua de WorkFolder (sin cron)..."
+        if [ -f "$PID_FILE" ] && kill -0 "$(cat "$PID_FILE")" 2>/dev/null; then
+            echo "ℹ️ Ya está en ejecución (PID $(cat "$PID_FILE"))"
+        else
+            cd "$SCRIPT_DIR"
+            nohup .venv/bin/python manage.py watch_documents --workers 4 >> "$LOG_FILE" 2>&1 &
+            echo $! > "$PID_FILE"
+            echo "✅ Vigilancia iniciada (PID $(cat "$PID_FILE"))"
+        fi
+        # Las miniaturas, el texto, etc. se generan en otro proceso para no frenar la importación
+        if [ -f "$PIPELINE_PID_FILE" ] && kill -0 "$(cat "$PIPELINE_PID_FILE")" 2>/dev/null; then
+            echo "ℹ️ El pipeline ya está en ejecución (PID $(cat "$PIPELINE_PID_FILE"))"
+        else
+            cd "$SCRIPT_DIR"
+            nohup .venv/bin/python manage.py process_pipeline >> "$LOG_FILE" 2>&1 &
+            echo $! > "$PIPELINE_PID_FILE"
+            echo "✅ Pipeline iniciado (PID $(cat "$PIPELINE_PID_FILE"))"
+        fi
+        ;;
+    
+    watch-stop)
+        echo "🛑 Deteniendo vigilancia continua..."
+        if [ -f "$PID_FILE" ] && kill "$(cat "$PID_FILE")" 2>/dev/null; then
+            rm -f "$PID_FILE"
+            echo "✅ Vigilancia detenida"
+        else
+            rm -f "$PID_FILE"
+            echo "ℹ️ La vigilancia no estaba en ejecución"
+        fi
+        if [ -f "$PIPELINE_PID_FILE" ] && kill "$(cat "$PIPELINE_PID_FILE")" 2>/dev/null; then
+            echo "✅ Pipeline detenido"
+        fi
+        rm -f "$PIPELINE_PID_FILE"
+        ;;
+    
     monitor)
         echo "👀 MONITOREO EN TIEMPO REAL (Ctrl+C para salir)"
         echo "=" * 50
@@ -80,7 +117,7 @@ print(Document.objects.filter(status='pending').count())
     *)
         echo "🔧 CONTROL DE AUTOMATIZACIÓN DOCTRAC"
         echo "=" * 40
-        echo "Uso: $0 {start|stop|status|logs|test|monitor}"
+        echo "Uso: $0 {start|stop|status|logs|test|monitor|watch-start|watch-stop}"
         echo ""
         echo "Comandos disponibles:"
         echo "  start   - Activar automatización (cada 5 minutos)"
@@ -89,6 +126,8 @@ print(Document.objects.filter(status='pending').count())
         echo "  logs    - Ver logs recientes"
         echo "  test    - Ejecutar sincronización manual"
         echo "  monitor - Monitorear en tiempo real"
+        echo "  watch-start - Importar al instante con un proceso continuo (reemplaza el cron)"
+        echo "  watch-stop  - Detener el proceso continuo"
         echo ""
         echo "Ejemplos:"
         echo "  $0 start     # Activar automático"
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Category, Entity, DocumentType, Document, DocumentHistory
+from .models import (
+    Category, Entity, DocumentType, Document, DocumentDerivative, DocumentHistory, DocumentSuggestion, IngestionJob,
+    PipelineQueueEntry,
+)
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -34,7 +37,10 @@ class DocumentAdmin(admin.ModelAdmin):
     list_filter = ('status', 'category', 'document_type', 'payment_status', 'created_at')
     search_fields = ('title', 'entity__name', 'notes')
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'updated_at', 'file_size')
+    readonly_fields = (
+        'created_at', 'updated_at', 'file_size', 'page_count', 'pdf_version',
+        'pdf_producer', 'is_encrypted', 'content_hash', 'source_batch', 'source_pages',
+    )
     filter_horizontal = ('assigned_users',)
     inlines = [DocumentHistoryInline]
     
@@ -58,7 +64,10 @@ class DocumentAdmin(admin.ModelAdmin):
             'fields': ('notes', 'tags')
         }),
         ('Metadatos', {
-            'fields': ('created_at', 'updated_at', 'file_size'),
+            'fields': (
+                'created_at', 'updated_at', 'file_size', 'page_count', 'pdf_version',
+                'pdf_producer', 'is_encrypted', 'content_hash', 'source_batch', 'source_pages',
+            ),
             'classes': ('collapse',)
         })
     )
@@ -75,3 +84,36 @@ class DocumentHistoryAdmin(admin.ModelAdmin):
     search_fields = ('document__title',)
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'total', 'processed', 'skipped', 'failed', 'created_at')
+    list_filter = ('kind', 'status', 'created_at')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(PipelineQueueEntry)
+class PipelineQueueEntryAdmin(admin.ModelAdmin):
+    list_display = ('document', 'queued_at', 'claimed_at', 'attempts')
+    list_filter = ('attempts',)
+    search_fields = ('document__title',)
+    ordering = ('queued_at',)
+    readonly_fields = ('queued_at',)
+
+@admin.register(DocumentSuggestion)
+class DocumentSuggestionAdmin(admin.ModelAdmin):
+    list_display = (
+        'document', 'category', 'category_confidence', 'document_type', 'entity', 'entity_confidence',
+        'document_date', 'due_date', 'suggested_at',
+    )
+    search_fields = ('document__title',)
+    ordering = ('-suggested_at',)
+    readonly_fields = ('suggested_at',)
+
+@admin.register(DocumentDerivative)
+class DocumentDerivativeAdmin(admin.ModelAdmin):
+    list_display = ('document', 'kind', 'original_size', 'size', 'saved_percent', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('document__title',)
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at',)
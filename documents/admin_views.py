@@ -3,11 +3,14 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.forms import ModelForm
-from django.core.management import call_command
 from django.conf import settings
+from django.urls import reverse
+from itertools import chain, islice
 from pathlib import Path
 import os
+from documents.ingestion import FolderIngestor, IngestionStats
 from documents.models import Entity, Category, DocumentType
+from documents.scanner import iter_pdfs, count_pdfs, scan_options
 
 class EntityForm(ModelForm):
     class Meta:
@@ -296,11 +299,11 @@ def sync_workfolder(request):
                 messages.error(request, f'La carpeta WorkFolder no existe en: {monitored_folder}')
                 return JsonResponse({'success': False, 'error': 'Carpeta no encontrada'})
             
-            # Contar archivos PDF pendientes antes de la sincronización
-            pdf_files = list(monitored_folder.glob('*.pdf'))
-            pending_count = len(pdf_files)
+            # Un solo recorrido de la carpeta: el importador cuenta lo que procesa
+            pdf_files = iter_pdfs(monitored_folder, **scan_options())
+            first_file = next(pdf_files, None)
             
-            if pending_count == 0:
+            if first_file is None:
                 messages.info(request, 'No hay documentos PDF pendientes en la carpeta WorkFolder.')
                 return JsonResponse({
                     'success': True, 
@@ -308,14 +311,31 @@ def sync_workfolder(request):
                     'processed': 0,
                     'pending': 0
                 })
+            pdf_files = chain([first_file], pdf_files)
             
-            # Ejecutar el comando de sincronización
-            call_command('sync_documents')
+            # En modo asíncrono se encola la importación y la interfaz consulta el progreso
+            if getattr(settings, 'DOCUMENT_INGESTION_ASYNC', False):
+                from documents.tasks import dispatch_folder_ingestion
+                job = dispatch_folder_ingestion(pdf_files, user=request.user)
+                return JsonResponse({
+                    'success': True,
+                    'message': 'Sincronización encolada',
+                    'job_id': job.pk,
+                    'job_url': reverse('documents:ingestion_job_status', args=[job.pk]),
+                    'pending_count': job.total,
+                })
+            
+            # Lo mismo que sync_documents, pero con las estadísticas de la corrida
+            ingestor = FolderIngestor(monitored_folder=monitored_folder)
+            if not ingestor.prepare():
+                messages.error(request, 'No se encontraron usuarios en el sistema. Crea al menos un usuario.')
+                return JsonResponse({'success': False, 'error': 'Sin usuario por defecto'})
+            stats = ingestor.recover(IngestionStats())
+            stats = ingestor.ingest(pdf_files, stats)
             
-            # Verificar cuántos archivos quedaron después de la sincronización
-            remaining_pdf_files = list(monitored_folder.glob('*.pdf'))
-            remaining_count = len(remaining_pdf_files)
-            processed_count = pending_count - remaining_count
+            processed_count = stats.processed
+            # Duplicados, errores y archivos aún en escritura siguen en la carpeta
+            remaining_count = stats.skipped + stats.failed + stats.deferred
             
             if processed_count > 0:
                 messages.success(request, 
@@ -343,22 +363,26 @@ def sync_workfolder(request):
     try:
         monitored_folder = Path(settings.MONITORED_FOLDER)
         if monitored_folder.exists():
-            pdf_files = list(monitored_folder.glob('*.pdf'))
-            pending_count = len(pdf_files)
+            pending_count = count_pdfs(monitored_folder, **scan_options())
             
             # Información sobre la carpeta processed
             processed_folder = monitored_folder / 'processed'
             processed_count = 0
             if processed_folder.exists():
-                processed_files = list(processed_folder.glob('*.*'))
-                processed_count = len(processed_files)
+                with os.scandir(processed_folder) as entries:
+                    # Solo los PDFs: la carpeta también guarda la bitácora y el estado de estabilidad
+                    processed_count = sum(
+                        1 for entry in entries if entry.name.lower().endswith('.pdf') and entry.is_file()
+                    )
             
             context = {
                 'monitored_folder': str(monitored_folder),
                 'pending_count': pending_count,
                 'processed_count': processed_count,
                 'folder_exists': True,
-                'pending_files': [f.name for f in pdf_files[:10]]  # Mostrar hasta 10 archivos
+                'pending_files': [  # Mostrar hasta 10 archivos
+                    f.name for f in islice(iter_pdfs(monitored_folder, **scan_options()), 10)
+                ]
             }
         else:
             context = {
@@ -0,0 +1,126 @@
+"""Caché en disco con tamaño máximo y desalojo LRU.
+
+Cada entrada es un archivo dentro de ``root`` (repartido en subcarpetas
+por los dos primeros caracteres de la clave). La fecha de modificación de
+cada archivo hace de "último uso": se actualiza en cada acierto, y cuando
+el total supera ``max_bytes`` se borran los archivos menos usados hasta
+quedar por debajo del 90 %. Varios procesos (web y workers) pueden
+compartir la misma carpeta: las escrituras son atómicas (archivo temporal
+más ``os.replace``) y el desalojo vuelve a medir el disco antes de borrar.
+"""
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Al desalojar se baja hasta esta fracción del máximo para no hacerlo en cada escritura
+LOW_WATER_MARK = 0.9
+
+# No se actualiza la fecha de uso de una entrada más de una vez en este intervalo
+TOUCH_INTERVAL = 60
+
+
+class BoundedFileCache:
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._size = None
+
+    def path_for(self, key):
+        return self.root / key[:2] / key
+
+    def get(self, key):
+        """Retorna la ruta de la entrada (marcándola como usada) o None si no existe"""
+        path = self.path_for(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - stat.st_mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                # Otro proceso la desalojó entre el stat y el utime
+                return None
+        return path
+
+    def put(self, key, data):
+        """Guarda ``data`` (bytes) bajo ``key`` y retorna la ruta final"""
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._measure()[0]
+            else:
+                self._size += len(data)
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+        return path
+
+    def _measure(self):
+        """Recorre la caché y retorna (bytes totales, [(mtime, tamaño, ruta)])"""
+        total = 0
+        entries = []
+        try:
+            shards = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0, []
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            with os.scandir(shard.path) as files:
+                for entry in files:
+                    if entry.name.startswith('.tmp-'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    total += stat.st_size
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return total, entries
+
+    def evict(self):
+        """Borra las entradas menos usadas hasta quedar bajo la marca baja; retorna los bytes liberados"""
+        with self._lock:
+            total, entries = self._measure()
+            target = self.max_bytes * LOW_WATER_MARK
+            freed = 0
+            if total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total - freed <= target:
+                        break
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    freed += size
+            self._size = total - freed
+            return freed
+
+    def delete(self, key):
+        try:
+            size = self.path_for(key).stat().st_size
+            self.path_for(key).unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
@@ -0,0 +1,390 @@
+"""Clasificador local (TF-IDF + Naive Bayes multinomial) para sugerir categoría, tipo y entidad.
+
+Se entrena con los documentos ya revisados (estado distinto de
+``pending``) usando el texto extraído del PDF y el nombre original del
+archivo. Los conteos de Naive Bayes son aditivos, así que el reentrenamiento
+incremental solo suma (o corrige) los documentos nuevos o recategorizados.
+Restar un documento solo es exacto con las mismas frecuencias que se
+sumaron: el modelo guarda una huella de ellas y, si el texto cambió desde
+entonces (p. ej. el OCR reemplazó la capa de texto), reentrena desde cero.
+
+El modelo se guarda como JSON en ``CLASSIFIER_MODEL_PATH`` con un índice
+invertido ``token → {etiqueta: peso}``: puntuar un documento cuesta lo que
+sus tokens distintos, no tokens × etiquetas. Sin red ni GPU.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Category, Document, DocumentSuggestion, DocumentType, Entity
+from .scanner import iter_batches
+
+FIELDS = ('category', 'document_type', 'entity')
+FIELD_MODELS = {'category': Category, 'document_type': DocumentType, 'entity': Entity}
+
+# Suavizado de Laplace
+ALPHA = 1.0
+# Texto leído por documento (el principio del PDF es lo que más identifica al emisor)
+MAX_TEXT_CHARS = 20_000
+DEFAULT_BATCH_SIZE = 500
+
+_TOKEN_RE = re.compile(r'[^\W\d_]{2,}', re.UNICODE)
+_FILENAME_SPLIT_RE = re.compile(r'[\s_\-.]+')
+
+
+def model_path():
+    return Path(getattr(settings, 'CLASSIFIER_MODEL_PATH', Path(settings.BASE_DIR) / 'cache' / 'classifier.json'))
+
+
+def min_confidence():
+    return getattr(settings, 'CLASSIFIER_MIN_CONFIDENCE', 0.6)
+
+
+def _strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(_strip_accents((text or '').lower()))
+
+
+def document_features(filename, text):
+    """Frecuencias de términos del texto y del nombre de archivo (con prefijo ``f:``)"""
+    counts = Counter(tokenize((text or '')[:MAX_TEXT_CHARS]))
+    stem = os.path.splitext(os.path.basename(filename or ''))[0]
+    for token in tokenize(' '.join(_FILENAME_SPLIT_RE.split(stem))):
+        counts['f:' + token] += 1
+    return counts
+
+
+def training_labels(category_id, document_type_id, entity_id, scanned_category_id=None):
+    """Etiquetas de un documento revisado (la categoría por defecto de los escaneos no enseña nada)"""
+    return [
+        str(category_id) if category_id and category_id != scanned_category_id else None,
+        str(document_type_id) if document_type_id else None,
+        str(entity_id) if entity_id else None,
+    ]
+
+
+def features_digest(counts):
+    """Huella de las frecuencias de un documento (independiente del orden)"""
+    payload = json.dumps(sorted(counts.items()), ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+class StaleFeatures(Exception):
+    """Las frecuencias actuales de un documento no son las que se aprendieron"""
+
+
+class NaiveBayesClassifier:
+    """Naive Bayes multinomial con pesos TF-IDF en la consulta, entrenable por incrementos"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.n_docs = state.get('n_docs', 0)
+        self.doc_freq = Counter(state.get('doc_freq', {}))
+        self.fields = {
+            name: {
+                'class_docs': Counter(field.get('class_docs', {})),
+                'totals': Counter(field.get('totals', {})),
+                'tokens': {token: Counter(labels) for token, labels in field.get('tokens', {}).items()},
+            }
+            for name, field in state.get('fields', {}).items()
+        }
+        for name in FIELDS:
+            self.fields.setdefault(name, {'class_docs': Counter(), 'totals': Counter(), 'tokens': {}})
+        # id del documento → etiquetas y huella de las frecuencias con las que se aprendió
+        self.trained = state.get('trained', {})
+        self.learned_features = state.get('learned_features', {})
+
+    @classmethod
+    def load(cls, path=None):
+        path = Path(path or model_path())
+        try:
+            with open(path, encoding='utf-8') as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls()
+
+    def save(self, path=None):
+        path = Path(path or model_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            'n_docs': self.n_docs,
+            'doc_freq': self.doc_freq,
+            'fields': {
+                name: {
+                    'class_docs': field['class_docs'],
+                    'totals': field['totals'],
+                    'tokens': {token: labels for token, labels in field['tokens'].items() if labels},
+                }
+                for name, field in self.fields.items()
+            },
+            'trained': self.trained,
+            'learned_features': self.learned_features,
+        }
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    @property
+    def is_trained(self):
+        return any(field['class_docs'] for field in self.fields.values())
+
+    def _update(self, counts, labels, sign):
+        # TF sublineal: una palabra repetida 50 veces no pesa 50 veces más
+        weights = {token: 1 + math.log(tf) for token, tf in counts.items()}
+        self.n_docs += sign
+        for token in weights:
+            self.doc_freq[token] += sign
+            if self.doc_freq[token] <= 0:
+                del self.doc_freq[token]
+        for name, label in zip(FIELDS, labels):
+            if label is None:
+                continue
+            field = self.fields[name]
+            field['class_docs'][label] += sign
+            for token, weight in weights.items():
+                by_label = field['tokens'].setdefault(token, Counter())
+                by_label[label] = max(by_label[label] + sign * weight, 0)
+                field['totals'][label] = max(field['totals'][label] + sign * weight, 0)
+                if not by_label[label]:
+                    del by_label[label]
+            if field['class_docs'][label] <= 0:
+                del field['class_docs'][label]
+                field['totals'].pop(label, None)
+
+    def _check_features(self, key, counts):
+        """Falla si ``counts`` no son las frecuencias que se sumaron para el documento"""
+        if self.learned_features.get(key) != features_digest(counts):
+            raise StaleFeatures(key)
+
+    def learn(self, document_id, counts, labels):
+        """Suma un documento; si ya se había aprendido con otras etiquetas, lo corrige.
+
+        Lanza ``StaleFeatures`` si hay que restar el documento y su texto ya
+        no es el que se aprendió.
+        """
+        key = str(document_id)
+        previous = self.trained.get(key)
+        if previous == labels:
+            return False
+        if previous is not None:
+            self._check_features(key, counts)
+            self._update(counts, previous, -1)
+        self._update(counts, labels, +1)
+        self.trained[key] = labels
+        self.learned_features[key] = features_digest(counts)
+        return True
+
+    def forget(self, document_id, counts):
+        """Resta un documento aprendido (p. ej. que volvió a quedar pendiente); ver ``learn``"""
+        key = str(document_id)
+        previous = self.trained.get(key)
+        if previous is None:
+            return False
+        self._check_features(key, counts)
+        self._update(counts, previous, -1)
+        del self.trained[key]
+        self.learned_features.pop(key, None)
+        return True
+
+    def _weights(self, counts):
+        """Vector TF-IDF normalizado (L2) con los términos del vocabulario"""
+        weights = {}
+        for token, tf in counts.items():
+            df = self.doc_freq.get(token)
+            if df:
+                weights[token] = (1 + math.log(tf)) * (math.log((1 + self.n_docs) / (1 + df)) + 1)
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        # Naive Bayes suma evidencia como si los términos fueran independientes y
+        # exagera la confianza; escalar a n^(1/4) deja la confianza comparable
+        # con el umbral del dashboard sin cambiar qué etiqueta gana
+        scale = len(weights) ** 0.25 / norm
+        return {token: w * scale for token, w in weights.items()}
+
+    def predict(self, counts_list):
+        """Para cada documento retorna ``{campo: (etiqueta, confianza)}`` (solo campos con modelo)"""
+        vocabulary = max(len(self.doc_freq), 1)
+        log_alpha = math.log(ALPHA)
+        classes = {}
+        for name, field in self.fields.items():
+            total_docs = sum(field['class_docs'].values())
+            if total_docs:
+                classes[name] = [
+                    (label, math.log(n / total_docs), math.log(field['totals'][label] + ALPHA * vocabulary))
+                    for label, n in field['class_docs'].items()
+                ]
+
+        predictions = []
+        for counts in counts_list:
+            weights = self._weights(counts)
+            mass = sum(weights.values())
+            result = {}
+            for name, labels in classes.items():
+                # log P(c) + Σ w·log(n_ct + α) - W·log(N_c + αV); en el índice
+                # invertido solo se recorren los n_ct distintos de cero
+                scores = {label: prior + mass * (log_alpha - denominator) for label, prior, denominator in labels}
+                tokens = self.fields[name]['tokens']
+                for token, weight in weights.items():
+                    for label, n in tokens.get(token, {}).items():
+                        scores[label] += weight * (math.log(n + ALPHA) - log_alpha)
+                best = max(scores, key=scores.get)
+                # Probabilidad posterior (softmax estable)
+                top = scores[best]
+                confidence = 1.0 / sum(math.exp(score - top) for score in scores.values())
+                result[name] = (best, confidence)
+            predictions.append(result)
+        return predictions
+
+
+_loaded = {'mtime': None, 'classifier': None}
+
+
+def get_classifier():
+    """Modelo guardado (recargado solo si el archivo cambió), o None si aún no se entrena"""
+    path = model_path()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _loaded['mtime'] != mtime:
+        _loaded['classifier'] = NaiveBayesClassifier.load(path)
+        _loaded['mtime'] = mtime
+    return _loaded['classifier']
+
+
+def _features_rows(queryset):
+    return queryset.values_list('id', 'original_filename', 'title', 'text__text')
+
+
+def train(full=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Entrena con los documentos revisados. Retorna ``(clasificador, documentos aprendidos)``.
+
+    Sin ``full`` se parte del modelo guardado y solo se lee el texto de los
+    documentos nuevos o cuyas etiquetas cambiaron desde el último entrenamiento.
+    Si hay que restar un documento cuyo texto cambió desde que se aprendió,
+    restar sus frecuencias actuales desviaría el modelo: se reentrena desde cero.
+    """
+    if not full:
+        try:
+            return _train(NaiveBayesClassifier.load(), batch_size)
+        except StaleFeatures:
+            pass
+    classifier, learned = _train(NaiveBayesClassifier(), batch_size)
+    classifier.save()
+    return classifier, learned
+
+
+def _train(classifier, batch_size):
+    """Suma y resta en ``classifier`` los documentos que cambiaron; lo guarda si aprendió algo"""
+    scanned_id = Category.objects.filter(name=Category.SCANNED_NAME).values_list('id', flat=True).first()
+    reviewed = Document.objects.exclude(status='pending').filter(
+        Q(category__isnull=False) | Q(document_type__isnull=False) | Q(entity__isnull=False)
+    )
+
+    # Primero solo ids y etiquetas (barato); el texto se lee por lotes para los que cambiaron
+    changed = []
+    current = set()
+    for document_id, category_id, document_type_id, entity_id in reviewed.values_list(
+        'id', 'category_id', 'document_type_id', 'entity_id'
+    ).iterator():
+        labels = training_labels(category_id, document_type_id, entity_id, scanned_id)
+        if not any(labels):
+            continue
+        current.add(str(document_id))
+        if classifier.trained.get(str(document_id)) != labels:
+            changed.append((document_id, labels))
+
+    learned = 0
+    for batch in iter_batches(changed, batch_size):
+        labels_by_id = dict(batch)
+        for document_id, filename, title, text in _features_rows(Document.objects.filter(id__in=labels_by_id)):
+            learned += classifier.learn(document_id, document_features(filename or title, text), labels_by_id[document_id])
+
+    # Documentos aprendidos que ya no están revisados; los borrados no se pueden
+    # restar (su texto ya no existe) y solo salen del modelo con ``full``
+    stale = [int(key) for key in classifier.trained if key not in current]
+    for batch in iter_batches(stale, batch_size):
+        for document_id, filename, title, text in _features_rows(Document.objects.filter(id__in=batch)):
+            learned += classifier.forget(document_id, document_features(filename or title, text))
+
+    if learned:
+        classifier.save()
+    return classifier, learned
+
+
+def suggest(document_ids=None, batch_size=DEFAULT_BATCH_SIZE, classifier=None):
+    """Puntúa los documentos pendientes por lotes y guarda sus sugerencias.
+
+    Cada lote es una consulta, una pasada del modelo y un INSERT masivo.
+    Retorna el número de documentos con sugerencia.
+    """
+    classifier = classifier or get_classifier()
+    if classifier is None or not classifier.is_trained:
+        return 0
+
+    queryset = Document.objects.filter(status='pending')
+    if document_ids is not None:
+        queryset = queryset.filter(id__in=list(document_ids))
+
+    # Las etiquetas del modelo pueden referirse a registros ya borrados
+    valid = {name: set(model.objects.values_list('id', flat=True)) for name, model in FIELD_MODELS.items()}
+    type_categories = dict(DocumentType.objects.values_list('id', 'category_id'))
+
+    saved = 0
+    last_id = 0
+    while True:
+        rows = list(_features_rows(queryset.filter(id__gt=last_id).order_by('id'))[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        predictions = classifier.predict([document_features(filename or title, text) for _, filename, title, text in rows])
+        suggestions = []
+        for row, prediction in zip(rows, predictions):
+            values = {}
+            for name, (label, confidence) in prediction.items():
+                if int(label) in valid[name]:
+                    values[name] = (int(label), confidence)
+            _reconcile_type_and_category(values, type_categories)
+            suggestion = DocumentSuggestion(document_id=row[0])
+            for name, (value_id, confidence) in values.items():
+                setattr(suggestion, f'{name}_id', value_id)
+                setattr(suggestion, f'{name}_confidence', confidence)
+            suggestions.append(suggestion)
+
+        DocumentSuggestion.objects.bulk_create(
+            suggestions,
+            update_conflicts=True,
+            unique_fields=['document'],
+            update_fields=[
+                'category', 'category_confidence', 'document_type', 'document_type_confidence',
+                'entity', 'entity_confidence', 'suggested_at',
+            ],
+        )
+        saved += len(suggestions)
+    return saved
+
+
+def _reconcile_type_and_category(values, type_categories):
+    """Cada tipo pertenece a una categoría: si no coinciden, manda la sugerencia más segura"""
+    if 'document_type' not in values:
+        return
+    type_id, type_confidence = values['document_type']
+    category = values.get('category')
+    if category and category[0] == type_categories.get(type_id):
+        return
+    if category is None or type_confidence > category[1]:
+        values['category'] = (type_categories[type_id], type_confidence)
+    else:
+        del values['document_type']
@@ -0,0 +1,221 @@
+"""Extracción de la fecha del documento y la fecha de vencimiento desde el texto del PDF.
+
+Reconoce fechas numéricas (``15/01/2024``, ``2024-01-15``, ``15.01.24``) y
+con el mes en letras en español o inglés (``15 de enero de 2024``,
+``January 15, 2024``, ``15 Jan 2024``). Cada fecha se clasifica según la
+etiqueta que la precede en la misma zona del texto ('Fecha', 'Vence',
+'Fecha de vencimiento', 'Due date'...) y recibe una confianza entre 0 y 1.
+
+El análisis no importa modelos de Django, así que puede ejecutarse en un
+pool de procesos (ver ``workers.extract_dates``); ``save_extracted_dates``
+es la única función que toca la base de datos.
+"""
+import re
+import unicodedata
+from datetime import date, timedelta
+
+from django.conf import settings
+
+# Solo se analiza el principio del texto: las fechas de una factura están en la primera página
+SCAN_CHARS = 10_000
+
+MONTHS = {
+    'enero': 1, 'ene': 1, 'january': 1, 'jan': 1,
+    'febrero': 2, 'feb': 2, 'february': 2,
+    'marzo': 3, 'mar': 3, 'march': 3,
+    'abril': 4, 'abr': 4, 'april': 4, 'apr': 4,
+    'mayo': 5, 'may': 5,
+    'junio': 6, 'jun': 6, 'june': 6,
+    'julio': 7, 'jul': 7, 'july': 7,
+    'agosto': 8, 'ago': 8, 'august': 8, 'aug': 8,
+    'septiembre': 9, 'setiembre': 9, 'sept': 9, 'sep': 9, 'set': 9, 'september': 9,
+    'octubre': 10, 'oct': 10, 'october': 10,
+    'noviembre': 11, 'nov': 11, 'november': 11,
+    'diciembre': 12, 'dic': 12, 'december': 12, 'dec': 12,
+}
+_MONTH = '|'.join(sorted(MONTHS, key=len, reverse=True))
+
+_NUMERIC_RE = re.compile(r'(?<![\d/.\-])(\d{4}|\d{1,2})([/\-.])(\d{1,2})\2(\d{2,4})(?![\d/.\-]*\d)')
+_DAY_MONTH_RE = re.compile(
+    rf'\b(\d{{1,2}})(?:o|st|nd|rd|th)?\s*(?:de\s+|-)?({_MONTH})\.?,?\s*(?:de(?:l)?\s+|-)?(\d{{4}})\b'
+)
+_MONTH_DAY_RE = re.compile(rf'\b({_MONTH})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b')
+
+# Etiquetas (ya sin acentos y en minúsculas). Si ambas coinciden gana la que
+# termina más cerca de la fecha ('fecha de vencimiento' es vencimiento, no
+# 'fecha'); en un empate gana el vencimiento ('due date')
+_DUE_LABEL_RE = re.compile(
+    r'\b(?:fecha\s+(?:de\s+vencimiento|limite(?:\s+de\s+pago)?)|vencimiento|vence(?:\s+el)?'
+    r'|pag(?:ar|ue)\s+antes\s+del?|(?:payment\s+)?due(?:\s+date|\s+by)?|pay\s+by)\b'
+)
+_DOCUMENT_LABEL_RE = re.compile(
+    r'\b(?:fecha(?:\s+(?:de|del)\s+(?:emision|factura|expedicion|documento|corte|estado))?|emitid[oa](?:\s+el)?'
+    r'|emision|(?:invoice|statement|issue|bill(?:ing)?)\s+date|date\s+issued|issued(?:\s+on)?|date)\b'
+)
+_ENGLISH_LABEL_RE = re.compile(r'\b(?:date|due|by|issued|on)\b')
+# Entre la etiqueta y la fecha solo puede haber separadores o palabras cortas (sin dígitos)
+_LABEL_GAP_RE = re.compile(r'[^\d]{0,25}')
+LABEL_WINDOW = 60
+
+LABELED_CONFIDENCE = 0.9
+UNLABELED_CONFIDENCE = 0.4
+
+
+def _fold(text):
+    """Minúsculas sin acentos, conservando la longitud (las posiciones siguen valiendo)"""
+    return ''.join(unicodedata.normalize('NFKD', c)[0] if c.isalpha() else c for c in text.lower())
+
+
+def _year(value):
+    """Año de cuatro cifras; los de dos se resuelven como ``%y`` de strptime (69-99 → 1969-1999)"""
+    year = int(value)
+    if year >= 100:
+        return year
+    return year + 1900 if year >= 69 else year + 2000
+
+
+def _build(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _read_numeric(first, second, third, english, day_first):
+    """Lee ``a/b/c`` como fecha. Retorna ``(fecha o None, factor de confianza)``"""
+    if len(first) == 4:
+        return _build(int(first), int(second), int(third)), 1.0
+    year = _year(third)
+    factor = 0.9 if len(third) == 2 else 1.0
+    a, b = int(first), int(second)
+    if a > 12 or a == b:
+        return _build(year, b, a), factor
+    if b > 12:
+        return _build(year, a, b), factor
+    # 03/04/2024 puede ser 3 de abril o 4 de marzo: se elige según el idioma de la etiqueta
+    if day_first and not english:
+        return _build(year, b, a), factor * 0.8
+    return _build(year, a, b), factor * 0.8
+
+
+def find_dates(text, day_first=True):
+    """Todas las fechas del texto como ``(posición, fecha, factor)`` ordenadas por posición"""
+    folded = _fold(text[:SCAN_CHARS])
+    found = []
+    for match in _NUMERIC_RE.finditer(folded):
+        english = bool(_ENGLISH_LABEL_RE.search(_label_context(folded, match.start())))
+        value, factor = _read_numeric(match.group(1), match.group(3), match.group(4), english, day_first)
+        if value:
+            found.append((match.start(), value, factor))
+    for match in _DAY_MONTH_RE.finditer(folded):
+        value = _build(int(match.group(3)), MONTHS[match.group(2)], int(match.group(1)))
+        if value:
+            found.append((match.start(), value, 1.0))
+    for match in _MONTH_DAY_RE.finditer(folded):
+        value = _build(int(match.group(3)), MONTHS[match.group(1)], int(match.group(2)))
+        if value:
+            found.append((match.start(), value, 1.0))
+    found.sort(key=lambda item: item[0])
+    return folded, found
+
+
+def _label_context(folded, position):
+    return folded[max(0, position - LABEL_WINDOW):position]
+
+
+def _label_for(folded, position):
+    """'due', 'document' o None según la etiqueta que precede inmediatamente a la fecha"""
+    context = _label_context(folded, position)
+    best = None
+    for kind, regex in (('due', _DUE_LABEL_RE), ('document', _DOCUMENT_LABEL_RE)):
+        for match in regex.finditer(context):
+            if not _LABEL_GAP_RE.fullmatch(context[match.end():]):
+                continue
+            if best is None or match.end() > best[1]:
+                best = (kind, match.end())
+    return best[0] if best else None
+
+
+def extract_dates(text, day_first=None, today=None):
+    """Fecha del documento y de vencimiento con su confianza.
+
+    Retorna ``{'document_date': (fecha, confianza) | None, 'due_date': ...}``.
+    Una fecha con etiqueta tiene confianza alta; si no hay etiqueta de
+    fecha se propone la primera fecha del texto con confianza baja.
+    """
+    if day_first is None:
+        day_first = getattr(settings, 'DATE_EXTRACTION_DAY_FIRST', True)
+    today = today or date.today()
+    folded, found = find_dates(text or '', day_first=day_first)
+
+    result = {'document_date': None, 'due_date': None}
+    first_plausible = None
+    for position, value, factor in found:
+        if not 1990 <= value.year <= today.year + 3:
+            continue
+        kind = _label_for(folded, position)
+        if kind == 'due':
+            if result['due_date'] is None:
+                result['due_date'] = (value, LABELED_CONFIDENCE * factor)
+        else:
+            # Una fecha de emisión en el futuro es sospechosa
+            plausible = value <= today + timedelta(days=31)
+            confidence = factor * (1.0 if plausible else 0.5)
+            if kind == 'document' and result['document_date'] is None:
+                result['document_date'] = (value, LABELED_CONFIDENCE * confidence)
+            elif kind is None and first_plausible is None and plausible:
+                first_plausible = (value, UNLABELED_CONFIDENCE * confidence)
+
+    if result['document_date'] is None:
+        result['document_date'] = first_plausible
+    document_date, due_date = result['document_date'], result['due_date']
+    if document_date and due_date and due_date[0] < document_date[0]:
+        # Un vencimiento anterior a la emisión indica que alguna de las dos se leyó mal
+        result['due_date'] = (due_date[0], due_date[1] * 0.5)
+    return {name: (value[0], round(value[1], 3)) if value else None for name, value in result.items()}
+
+
+def min_confidence():
+    return getattr(settings, 'DATE_EXTRACTION_MIN_CONFIDENCE', 0.5)
+
+
+def save_extracted_dates(results):
+    """Guarda ``[(document_id, extract_dates(...))]``: sugerencia con su confianza y, si
+    el documento aún no tiene fecha y la confianza alcanza el umbral, la fecha misma.
+
+    Un SELECT, un UPDATE masivo y un INSERT masivo por lote. Retorna cuántos
+    documentos recibieron alguna fecha.
+    """
+    from .models import Document, DocumentSuggestion
+
+    results = dict(results)
+    if not results:
+        return 0
+    threshold = min_confidence()
+    suggestions = []
+    changed = []
+    for document in Document.objects.filter(id__in=results).only('id', 'document_date', 'due_date'):
+        extracted = results[document.id]
+        suggestion = DocumentSuggestion(document_id=document.id)
+        updated = False
+        for field in ('document_date', 'due_date'):
+            if not extracted.get(field):
+                continue
+            value, confidence = extracted[field]
+            setattr(suggestion, field, value)
+            setattr(suggestion, f'{field}_confidence', confidence)
+            if getattr(document, field) is None and confidence >= threshold:
+                setattr(document, field, value)
+                updated = True
+        suggestions.append(suggestion)
+        if updated:
+            changed.append(document)
+
+    DocumentSuggestion.objects.bulk_create(
+        suggestions,
+        update_conflicts=True,
+        unique_fields=['document'],
+        update_fields=['document_date', 'document_date_confidence', 'due_date', 'due_date_confidence'],
+    )
+    Document.objects.bulk_update(changed, ['document_date', 'due_date'])
+    return len(changed)
@@ -0,0 +1,111 @@
+"""Entrega de archivos delegada al servidor web frontal.
+
+Con ``DOCUMENT_DELIVERY = 'django'`` (por defecto) los bytes del PDF pasan
+por el worker de Python (ver ``streaming``). Los otros modos dejan a Django
+solo la verificación de permisos:
+
+- ``'x-accel'``: la respuesta lleva ``X-Accel-Redirect`` con una ruta interna
+  y nginx entrega el archivo (con ``Range``, ``sendfile`` y sin ocupar un
+  worker de la aplicación).
+- ``'x-sendfile'``: igual, con ``X-Sendfile`` y la ruta absoluta del archivo
+  (Apache con mod_xsendfile, lighttpd, Caddy).
+- ``'signed'``: redirección a una URL firmada con HMAC que vence en
+  ``DOCUMENT_SIGNED_URL_TTL`` segundos; un servidor estático o una CDN la
+  valida (ver ``verify_signed_url``) sin consultar a Django.
+
+``DOCUMENT_DELIVERY_LOCATIONS`` relaciona cada carpeta servible (archivos,
+caché de marcas de agua) con su prefijo de URL en el servidor frontal. Un
+archivo fuera de esas carpetas se sigue entregando desde Django.
+"""
+import base64
+import hashlib
+import hmac
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect
+
+DELIVERY_MODES = ('django', 'x-accel', 'x-sendfile', 'signed')
+
+
+def delivery_mode():
+    mode = getattr(settings, 'DOCUMENT_DELIVERY', 'django')
+    if mode not in DELIVERY_MODES:
+        raise ValueError(f'Modo de entrega desconocido: {mode}')
+    return mode
+
+
+def delivery_locations():
+    """``[(carpeta, prefijo de URL)]``, de la carpeta más específica a la más general"""
+    locations = getattr(settings, 'DOCUMENT_DELIVERY_LOCATIONS', None) or {settings.MEDIA_ROOT: '/protected/media/'}
+    resolved = [(Path(root).resolve(), prefix.rstrip('/') + '/') for root, prefix in locations.items()]
+    return sorted(resolved, key=lambda item: -len(item[0].parts))
+
+
+def location_url(path):
+    """URL (codificada) de ``path`` bajo su prefijo del servidor frontal, o None si no está en ninguna carpeta"""
+    path = Path(path).resolve()
+    for root, prefix in delivery_locations():
+        if path.is_relative_to(root):
+            return prefix + quote(path.relative_to(root).as_posix())
+    return None
+
+
+def _signing_key():
+    return (getattr(settings, 'DOCUMENT_SIGNING_KEY', None) or settings.SECRET_KEY).encode()
+
+
+def sign(url_path, expires):
+    """Firma HMAC-SHA256 (base64 URL, sin relleno) de la ruta y su vencimiento"""
+    digest = hmac.new(_signing_key(), f'{expires}:{url_path}'.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def signed_url(url_path, ttl=None, now=None):
+    """``url_path`` con ``expires`` y ``signature`` en la consulta"""
+    ttl = getattr(settings, 'DOCUMENT_SIGNED_URL_TTL', 300) if ttl is None else ttl
+    expires = int(now if now is not None else time.time()) + ttl
+    return f'{url_path}?{urlencode({"expires": expires, "signature": sign(url_path, expires)})}'
+
+
+def verify_signed_url(url, now=None):
+    """Ruta (decodificada) de una URL firmada si la firma es válida y no venció; si no, None.
+
+    Es la verificación que debe hacer el servidor estático o la CDN.
+    """
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    try:
+        expires = int(query['expires'][0])
+        signature = query['signature'][0]
+    except (KeyError, ValueError):
+        return None
+    if expires < (now if now is not None else time.time()):
+        return None
+    if not hmac.compare_digest(signature, sign(parts.path, expires)):
+        return None
+    return unquote(parts.path)
+
+
+def offloaded_response(path, mode=None):
+    """Respuesta que delega la entrega de ``path`` al servidor frontal, o None si se entrega desde Django"""
+    mode = mode or delivery_mode()
+    if mode == 'django':
+        return None
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type='application/pdf')
+        response['X-Sendfile'] = str(Path(path).resolve())
+        return response
+    url_path = location_url(path)
+    if url_path is None:
+        return None
+    if mode == 'signed':
+        response = HttpResponseRedirect(signed_url(url_path))
+        # La URL vence: ni el navegador ni un caché intermedio deben reutilizar la redirección
+        response['Cache-Control'] = 'private, no-store'
+        return response
+    response = HttpResponse(content_type='application/pdf')
+    response['X-Accel-Redirect'] = url_path
+    return response
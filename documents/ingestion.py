@@ -0,0 +1,570 @@
+"""Lógica compartida para importar documentos desde la carpeta de monitoreo"""
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+
+from . import journal as stages
+from .journal import IngestionJournal
+from .models import Document, DocumentHistory, Category
+from .pdf_tools import read_metadata
+from .placement import copy_file, move_file
+from .scanner import iter_batches
+from .stability import StabilityGate
+from .tasks import dispatch_post_ingest
+
+logger = logging.getLogger(__name__)
+
+
+def unique_pending_name(filename, when=None):
+    """Genera un nombre único para la copia en Pending.
+
+    El prefijo incluye microsegundos y un sufijo aleatorio corto para que
+    varios archivos importados en el mismo segundo (o por varios workers a
+    la vez) no colisionen.
+    """
+    when = when or datetime.now()
+    return f"{when.strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:6]}_{filename}"
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Archivos por lote: una consulta de duplicados y una transacción de inserción
+# por lote (también respeta el límite de variables de SQLite)
+DEFAULT_BATCH_SIZE = 500
+
+
+def compute_file_hash(path, chunk_size=HASH_CHUNK_SIZE):
+    """Calcula el SHA-256 de un archivo leyéndolo por bloques.
+
+    Reutiliza un único buffer, así que la memoria usada no depende del
+    tamaño del PDF.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb') as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+
+def compute_upload_hash(uploaded_file):
+    """Calcula el SHA-256 de un archivo subido sin cargarlo completo en memoria"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def _safe_hash(path):
+    try:
+        return compute_file_hash(path)
+    except OSError:
+        return None
+
+
+def _safe_metadata(path):
+    """Metadatos del PDF, o None si no se pudo leer (el archivo se importa igual)"""
+    try:
+        return read_metadata(path)
+    except Exception as e:
+        logger.warning(f'No se pudieron leer los metadatos de {path}: {e}')
+        return None
+
+
+@dataclass
+class PlacedFile:
+    """Resultado del trabajo de archivos para un PDF (sin tocar la base de datos)"""
+    source: Path
+    original_name: str = None
+    content_hash: str = None
+    processed_path: Path = None
+    pending_path: Path = None
+    size: int = 0
+    metadata: dict = None
+    placement: str = None
+    error: str = None
+
+
+@dataclass
+class IngestionStats:
+    """Contadores y rendimiento de una corrida de importación"""
+    processed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    deferred: int = 0
+    bytes_processed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self):
+        return max(time.monotonic() - self.started_at, 1e-6)
+
+    @property
+    def files_per_second(self):
+        return self.processed / self.elapsed
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_processed / 1024 / 1024 / self.elapsed
+
+    def summary(self):
+        return (
+            f'{self.processed} archivos en {self.elapsed:.2f}s '
+            f'({self.files_per_second:.2f} archivos/s, {self.mb_per_second:.2f} MB/s)'
+        )
+
+
+def place_pdf(pdf_file, processed_folder, pending_folder, content_hash=None, original_name=None,
+              journal=None):
+    """Mueve el PDF a 'processed' y crea su copia en 'Pending'.
+
+    Solo hace trabajo de archivos, por lo que es seguro ejecutarla desde un
+    pool de hilos; las escrituras a la base de datos quedan en el hilo principal.
+    Si se pasa una bitácora, cada paso completado queda registrado en ella.
+    """
+    pdf_file = Path(pdf_file)
+    original_name = original_name or pdf_file.name
+    result = PlacedFile(source=pdf_file, original_name=original_name, content_hash=content_hash)
+    try:
+        result.size = pdf_file.stat().st_size
+
+        # Mover archivo original a 'processed' (conservando la subcarpeta, si la hay)
+        result.processed_path = Path(processed_folder) / original_name
+        if original_name != pdf_file.name:
+            result.processed_path.parent.mkdir(parents=True, exist_ok=True)
+        move_file(pdf_file, result.processed_path)
+    except Exception as e:
+        result.error = str(e)
+        if journal:
+            # El archivo sigue en la carpeta de monitoreo; el próximo escaneo lo reintenta
+            journal.record(original_name, stages.ABANDONED, error=result.error)
+        return result
+
+    result.metadata = _safe_metadata(result.processed_path)
+    if journal:
+        journal.record(
+            original_name, stages.MOVED,
+            source=str(pdf_file), processed_path=str(result.processed_path),
+            content_hash=content_hash, size=result.size,
+        )
+    return copy_to_pending(result, pending_folder, journal)
+
+
+def copy_to_pending(result, pending_folder, journal=None):
+    """Crea la copia en 'Pending' de un archivo que ya está en 'processed'"""
+    try:
+        result.pending_path = Path(pending_folder) / unique_pending_name(result.processed_path.name)
+        result.placement = copy_file(result.processed_path, result.pending_path)
+    except Exception as e:
+        result.error = str(e)
+        return result
+
+    if journal:
+        journal.record(result.original_name, stages.COPIED, pending_path=str(result.pending_path))
+    return result
+
+
+class FolderIngestor:
+    """Importa PDFs de la carpeta de monitoreo como documentos pendientes.
+
+    El trabajo de archivos (mover, copiar) puede repartirse en un pool de
+    ``workers`` hilos; la creación de registros se hace siempre desde un solo
+    escritor para no competir por el bloqueo de SQLite.
+    """
+
+    def __init__(self, monitored_folder=None, workers=1, dry_run=False, log=None,
+                 batch_size=DEFAULT_BATCH_SIZE, use_journal=True, stability_gate=None):
+        self.monitored_folder = Path(monitored_folder or settings.MONITORED_FOLDER)
+        self.processed_folder = self.monitored_folder / 'processed'
+        # La carpeta Pending (con mayúscula) dentro de Main (que es MEDIA_ROOT)
+        self.pending_folder = Path(settings.MEDIA_ROOT) / 'Pending'
+        self.workers = max(int(workers or 1), 1)
+        self.batch_size = max(int(batch_size or DEFAULT_BATCH_SIZE), 1)
+        self.dry_run = dry_run
+        self.log = log or (lambda level, message: None)
+        self.default_category = None
+        self.default_user = None
+        self._executor = None
+
+        # Bitácora para reanudar corridas interrumpidas (no aplica en modo dry-run)
+        self.journal = None
+        if use_journal and not dry_run:
+            journal_path = getattr(settings, 'INGESTION_JOURNAL_PATH', None)
+            self.journal = IngestionJournal(journal_path or self.processed_folder / '.ingest_journal.jsonl')
+
+        # Archivos que el escáner sigue escribiendo se difieren (False para desactivar)
+        self.gate = stability_gate
+        if stability_gate is None and getattr(settings, 'INGEST_STABILITY_CHECK', True):
+            self.gate = StabilityGate.from_settings(
+                state_path=None if dry_run else self.processed_folder / '.ingest_stability.json',
+                log=self.log,
+            )
+
+    def prepare(self):
+        """Obtiene categoría y usuario por defecto; retorna False si no se puede importar"""
+        # Obtener categoría por defecto para documentos escaneados
+        self.default_category, created = Category.objects.get_or_create(
+            name=Category.SCANNED_NAME,
+            defaults={'description': 'Documentos importados automáticamente desde la carpeta de monitoreo'}
+        )
+        if created:
+            self.log('success', f'Creada categoría: {self.default_category.name}')
+
+        # Obtener el primer usuario como propietario por defecto (podríamos mejorarlo)
+        self.default_user = get_user_model().objects.first()
+        if not self.default_user:
+            self.log('error', 'No se encontraron usuarios en el sistema. Crea al menos un usuario.')
+            return False
+
+        if not self.dry_run:
+            self.processed_folder.mkdir(exist_ok=True)
+            self.pending_folder.mkdir(parents=True, exist_ok=True)
+        return True
+
+    def map(self, func, items):
+        """Aplica func a cada elemento usando el pool de hilos si está activo"""
+        if self._executor is not None and len(items) > 1:
+            return list(self._executor.map(func, items))
+        return [func(item) for item in items]
+
+    def original_name(self, pdf_file):
+        """Nombre original a registrar: ruta relativa para archivos en subcarpetas"""
+        try:
+            return pdf_file.relative_to(self.monitored_folder).as_posix()
+        except ValueError:
+            return pdf_file.name
+
+    def filter_new(self, pdf_files, stats):
+        """Descarta los archivos ya importados: ``[(archivo, nombre, hash)]`` de los nuevos.
+
+        Un archivo es duplicado si coincide el nombre original o el hash de
+        contenido (así se detectan también los re-escaneos renombrados).
+        Primero se descartan los nombres conocidos con una consulta barata y
+        solo se hashean los archivos restantes; luego una segunda consulta
+        descarta los hashes ya importados.
+        """
+        names = [self.original_name(f) for f in pdf_files]
+        seen_names = set(Document.objects.filter(original_filename__in=names).values_list('original_filename', flat=True))
+
+        candidates = []
+        for pdf_file, name in zip(pdf_files, names):
+            if name in seen_names:
+                self.log('warning', f'Documento ya existe: {name}')
+                stats.skipped += 1
+                continue
+            candidates.append((pdf_file, name))
+
+        hashes = self.map(_safe_hash, [pdf_file for pdf_file, _ in candidates])
+        seen_hashes = set(Document.objects.filter(
+            content_hash__in=[h for h in hashes if h]
+        ).values_list('content_hash', flat=True))
+
+        new_files = []
+        for (pdf_file, name), content_hash in zip(candidates, hashes):
+            if name in seen_names or (content_hash and content_hash in seen_hashes):
+                self.log('warning', f'Documento ya existe: {name}')
+                stats.skipped += 1
+                continue
+            # Evitar también duplicados dentro del mismo lote
+            seen_names.add(name)
+            if content_hash:
+                seen_hashes.add(content_hash)
+            new_files.append((pdf_file, name, content_hash))
+        return new_files
+
+    def ingest(self, pdf_files, stats=None):
+        """Importa los archivos (cualquier iterable, p. ej. un escáner) y retorna las estadísticas.
+
+        El iterable se consume por lotes de ``batch_size``, así que el primer
+        lote se procesa sin esperar a que termine el listado completo.
+        """
+        stats = stats or IngestionStats()
+        if self.workers > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for batch in iter_batches(pdf_files, self.batch_size):
+                self.ingest_batch([Path(p) for p in batch], stats)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self.journal:
+                self.journal.compact()
+            if self.gate:
+                self.gate.save()
+        return stats
+
+    def ingest_batch(self, pdf_files, stats):
+        """Descarta duplicados, coloca y registra un lote de archivos"""
+        if self.gate:
+            pdf_files, deferred = self.gate.split(pdf_files, self.map)
+            if deferred:
+                stats.deferred += len(deferred)
+                self.log('warning', f'⏳ {len(deferred)} archivos aún en escritura; se revisarán en el próximo escaneo')
+            if not pdf_files:
+                return
+
+        new_files = self.filter_new(pdf_files, stats)
+
+        if self.dry_run:
+            for _, name, _ in new_files:
+                self.log('success', f'[DRY RUN] Procesaría: {name}')
+                stats.processed += 1
+            return
+
+        if self.journal:
+            self.journal.record_many([
+                {'key': name, 'stage': stages.SEEN, 'source': str(pdf_file), 'content_hash': content_hash}
+                for pdf_file, name, content_hash in new_files
+            ], sync=True)
+
+        placed_files = self.map(
+            lambda item: place_pdf(
+                item[0], self.processed_folder, self.pending_folder, item[2], item[1], self.journal
+            ),
+            new_files
+        )
+        self.commit_batch(placed_files, stats)
+
+    def recover(self, stats=None):
+        """Reanuda las entradas incompletas de la bitácora.
+
+        Solo se leen las entradas pendientes (la bitácora se compacta al
+        final de cada corrida) y se hace una única consulta a la BD para
+        saber cuáles llegaron a guardarse antes de la interrupción.
+        Retorna las estadísticas de los archivos recuperados.
+        """
+        stats = stats or IngestionStats()
+        if not self.journal:
+            return stats
+        entries = self.journal.pending()
+        if not entries:
+            return stats
+        self.log('warning', f'🔁 Reanudando {len(entries)} archivos incompletos de la bitácora')
+
+        # Documentos que sí se guardaron pero cuya etapa 'committed' no quedó registrada
+        hashes = [e['content_hash'] for e in entries if e.get('content_hash')]
+        committed_names = {}
+        committed_hashes = {}
+        existing = Document.objects.filter(
+            Q(content_hash__in=hashes) | Q(original_filename__in=[e['key'] for e in entries])
+        ).values_list('original_filename', 'content_hash', 'id')
+        for name, content_hash, document_id in existing:
+            committed_names[name] = document_id
+            if content_hash:
+                committed_hashes[content_hash] = document_id
+
+        to_commit = []
+        reingest = []
+        closed = []
+        for entry in entries:
+            key = entry['key']
+            document_id = committed_names.get(key)
+            if not document_id and entry.get('content_hash'):
+                document_id = committed_hashes.get(entry['content_hash'])
+            if document_id:
+                closed.append({'key': key, 'stage': stages.COMMITTED, 'document_id': document_id})
+                continue
+
+            processed_path = Path(entry.get('processed_path') or self.processed_folder / key)
+            pending_path = Path(entry['pending_path']) if entry.get('pending_path') else None
+            source = Path(entry.get('source') or self.monitored_folder / key)
+
+            if entry['stage'] == stages.SEEN and source.exists():
+                # Nunca se movió: se vuelve a importar desde el principio
+                closed.append({'key': key, 'stage': stages.ABANDONED})
+                reingest.append(source)
+                continue
+            if not processed_path.exists():
+                self.log('error', f'❌ No se puede recuperar {key}: el archivo ya no existe')
+                closed.append({'key': key, 'stage': stages.ABANDONED})
+                stats.failed += 1
+                continue
+
+            placed = PlacedFile(
+                source=source,
+                original_name=key,
+                content_hash=entry.get('content_hash'),
+                processed_path=processed_path,
+                size=entry.get('size') or processed_path.stat().st_size,
+                metadata=_safe_metadata(processed_path),
+            )
+            if pending_path and pending_path.exists():
+                placed.pending_path = pending_path
+            else:
+                copy_to_pending(placed, self.pending_folder, self.journal)
+            to_commit.append(placed)
+
+        self.journal.record_many(closed, sync=True)
+        for batch in iter_batches(to_commit, self.batch_size):
+            self.commit_batch(batch, stats)
+        if reingest:
+            return self.ingest(reingest, stats)
+        self.journal.compact()
+        return stats
+
+    def build_document(self, placed):
+        """Construye (sin guardar) el documento para un archivo ya colocado en Pending"""
+        document = Document(
+            title=placed.source.stem,  # Nombre sin extensión
+            notes=f'Documento escaneado importado automáticamente el {datetime.now().strftime("%Y-%m-%d %H:%M")}',
+            category=self.default_category,
+            created_by=self.default_user,
+            original_filename=placed.original_name,
+            content_hash=placed.content_hash,
+            imported_from_folder=True,
+            status='pending',
+            # El archivo se asigna antes del primer INSERT para evitar un segundo save()
+            file=str(placed.pending_path.relative_to(settings.MEDIA_ROOT)),
+            file_size_bytes=placed.size,
+        )
+        if placed.metadata:
+            document.apply_pdf_metadata(placed.metadata)
+        return document
+
+    def commit_batch(self, placed_files, stats):
+        """Registra un lote de archivos con un INSERT masivo en una sola transacción.
+
+        ``bulk_create`` no dispara las señales de ``Document``, así que la
+        entrada inicial del historial (la que crearía ``post_save``) se
+        inserta también en bloque. Si el lote falla se reintenta documento
+        por documento para aislar el archivo problemático.
+        """
+        ready = []
+        for placed in placed_files:
+            if placed.error:
+                self.log('error', f'❌ Error procesando {placed.original_name}: {placed.error}')
+                stats.failed += 1
+            else:
+                ready.append(placed)
+        if not ready:
+            return []
+
+        try:
+            with transaction.atomic():
+                documents = Document.objects.bulk_create([self.build_document(p) for p in ready])
+                DocumentHistory.objects.bulk_create([
+                    DocumentHistory(
+                        document=document,
+                        previous_status=None,
+                        new_status=document.status,
+                        changed_by=document.created_by,
+                        change_reason='Documento creado'
+                    )
+                    for document in documents
+                ])
+        except Exception as e:
+            self.log('warning', f'Lote de {len(ready)} documentos falló ({e}); reintentando uno por uno')
+            documents = [d for d in (self.commit(placed, stats) for placed in ready) if d]
+            dispatch_post_ingest(document.id for document in documents)
+            return documents
+
+        self.record_committed(zip(ready, documents))
+        for placed, document in zip(ready, documents):
+            self.report(placed, document, stats)
+        dispatch_post_ingest(document.id for document in documents)
+        return documents
+
+    def commit(self, placed, stats):
+        """Crea el registro de un solo documento (las señales crean su historial)"""
+        if placed.error:
+            self.log('error', f'❌ Error procesando {placed.original_name}: {placed.error}')
+            stats.failed += 1
+            return None
+
+        try:
+            with transaction.atomic():
+                document = self.build_document(placed)
+                document.save()
+        except Exception as e:
+            self.log('error', f'❌ Error procesando {placed.original_name}: {str(e)}')
+            stats.failed += 1
+            return None
+
+        self.record_committed([(placed, document)])
+        self.report(placed, document, stats)
+        return document
+
+    def record_committed(self, pairs):
+        if self.journal:
+            self.journal.record_many([
+                {'key': placed.original_name, 'stage': stages.COMMITTED, 'document_id': document.id}
+                for placed, document in pairs
+            ], sync=True)
+
+    def report(self, placed, document, stats):
+        self.log('success', f'✅ Procesado: {placed.original_name} -> ID: {document.id}')
+        self.log('success', f'📁 Original en: {placed.processed_path}')
+        self.log('success', f'📋 Copia en: {placed.pending_path}')
+
+        stats.processed += 1
+        stats.bytes_processed += placed.size
+
+
+def place_uploaded_document(document):
+    """Mueve un PDF subido manualmente a 'processed' y apunta el documento a su copia en 'Pending'"""
+    if not document.file:
+        return
+
+    monitored_folder = Path(settings.MONITORED_FOLDER)
+    if not monitored_folder.exists():
+        monitored_folder.mkdir(parents=True, exist_ok=True)
+
+    # Crear subcarpeta 'processed' para los originales
+    processed_folder = monitored_folder / 'processed'
+    processed_folder.mkdir(exist_ok=True)
+
+    try:
+        # Crear carpeta 'Pending' dentro de MEDIA_ROOT (Main)
+        pending_folder = Path(settings.MEDIA_ROOT) / 'Pending'
+        pending_folder.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        logger.error(f"Error al crear la carpeta 'Pending': {e}")
+        raise
+
+    # Un reintento después de guardar el documento solo vuelve a programar las etapas
+    source_path = Path(document.file.path)
+    if source_path.parent == pending_folder:
+        dispatch_post_ingest([document.pk])
+        return
+
+    # Generar nombre único basado en timestamp y nombre original
+    original_name = document.file.name.split('/')[-1]  # Solo el nombre del archivo
+    new_name = unique_pending_name(original_name)
+
+    # Mover archivo original a 'processed' (un reintento puede encontrarlo ya movido)
+    processed_path = processed_folder / original_name
+    if source_path.exists() or not processed_path.exists():
+        move_file(source_path, processed_path)
+
+    # Crear copia en 'Pending' (enlace duro/reflink si el sistema de archivos lo permite)
+    pending_path = pending_folder / new_name
+    copy_file(processed_path, pending_path)
+
+    # Actualizar el campo file del documento con la ruta relativa
+    relative_path = pending_path.relative_to(settings.MEDIA_ROOT)
+    document.file = str(relative_path)
+    document.original_filename = original_name
+    document.imported_from_folder = False  # False porque fue subido manualmente
+    update_fields = ['file', 'original_filename', 'imported_from_folder']
+    metadata = _safe_metadata(pending_path)
+    if metadata:
+        document.apply_pdf_metadata(metadata)
+        update_fields += Document.PDF_METADATA_FIELDS
+    document.save(update_fields=update_fields)
+    dispatch_post_ingest([document.pk])
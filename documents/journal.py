@@ -0,0 +1,96 @@
+"""Bitácora de importación (append-only) para poder reanudar corridas interrumpidas.
+
+Cada archivo avanza por las etapas ``seen`` → ``moved`` → ``copied`` →
+``committed``. Cada cambio de etapa se agrega como una línea JSON; al
+terminar una corrida la bitácora se compacta dejando solo las entradas
+incompletas, de modo que leerla al arrancar cuesta O(pendientes) y no
+O(historial).
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+SEEN = 'seen'
+MOVED = 'moved'
+COPIED = 'copied'
+COMMITTED = 'committed'
+ABANDONED = 'abandoned'
+
+STAGES = (SEEN, MOVED, COPIED, COMMITTED)
+FINAL_STAGES = {COMMITTED, ABANDONED}
+
+
+class IngestionJournal:
+    """Archivo JSON Lines con la última etapa conocida de cada archivo"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def load(self):
+        """Lee la bitácora y retorna ``{clave: entrada}`` con la etapa más reciente"""
+        entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Línea truncada por una caída a mitad de escritura
+                        continue
+                    entry = entries.setdefault(record['key'], {})
+                    entry.update(record)
+        except FileNotFoundError:
+            pass
+        self._entries = entries
+        return entries
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self.load()
+        return self._entries
+
+    def pending(self):
+        """Entradas que no llegaron a una etapa final"""
+        return [entry for entry in self.entries.values() if entry.get('stage') not in FINAL_STAGES]
+
+    def record(self, key, stage, sync=False, **data):
+        self.record_many([dict(data, key=key, stage=stage)], sync=sync)
+
+    def record_many(self, records, sync=False):
+        """Agrega varias líneas con una sola escritura (y un fsync opcional)"""
+        if not records:
+            return
+        payload = ''.join(json.dumps(r, ensure_ascii=False, default=str) + '\n' for r in records)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+            if self._entries is not None:
+                for r in records:
+                    self._entries.setdefault(r['key'], {}).update(r)
+
+    def compact(self):
+        """Reescribe la bitácora dejando solo las entradas incompletas"""
+        with self._lock:
+            pending = [e for e in self.entries.values() if e.get('stage') not in FINAL_STAGES]
+            if not pending:
+                try:
+                    self.path.unlink()
+                except FileNotFoundError:
+                    pass
+            else:
+                tmp_path = self.path.with_suffix('.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for entry in pending:
+                        f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            self._entries = {e['key']: e for e in pending}
@@ -0,0 +1,67 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from documents.models import Document
+from documents.workers import read_metadata
+
+class Command(BaseCommand):
+    help = 'Guarda tamaño, páginas, versión, productor y cifrado de los PDFs que aún no los tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de procesos para leer los PDFs en paralelo',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Documentos por lote (un UPDATE masivo por lote)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Volver a leer los metadatos de todos los documentos, no solo de los que no los tienen',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        batch_size = max(options['batch_size'], 1)
+
+        queryset = Document.objects.exclude(file='')
+        if not options['all']:
+            queryset = queryset.filter(file_size_bytes__isnull=True)
+        total = queryset.count()
+        self.stdout.write(f'📏 Documentos sin metadatos: {total}')
+
+        updated = 0
+        failed = 0
+        last_id = 0
+        # Procesos y no hilos: PDFium no es seguro entre hilos
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(queryset.filter(id__gt=last_id).order_by('id').only('id', 'file')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                documents = {d.id: d for d in batch}
+                items = [(d.id, str(Path(settings.MEDIA_ROOT) / d.file.name)) for d in batch]
+                to_update = []
+                for document_id, metadata, error in executor.map(read_metadata, items, chunksize=16):
+                    if metadata is None:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'No se pudo leer el documento {document_id}: {error}'))
+                        continue
+                    document = documents[document_id]
+                    document.apply_pdf_metadata(metadata)
+                    to_update.append(document)
+
+                Document.objects.bulk_update(to_update, Document.PDF_METADATA_FIELDS)
+                updated += len(to_update)
+                self.stdout.write(f'  … {updated}/{total} actualizados')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Metadatos guardados para {updated} documentos ({failed} con error)'))
@@ -0,0 +1,265 @@
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test.utils import CaptureQueriesContext, override_settings
+from documents.ingestion import FolderIngestor, IngestionStats
+from documents.stability import StabilityGate
+from documents.workers import generate_sample_pdf
+
+# Modos de importación a comparar: (workers, tamaño de lote)
+MODES = {
+    'sequential': lambda workers: {'workers': 1, 'batch_size': 1},
+    'batched': lambda workers: {'workers': 1, 'batch_size': 500},
+    'parallel': lambda workers: {'workers': workers, 'batch_size': 500},
+}
+
+def peak_rss_mb():
+    """Memoria residente máxima del proceso (ru_maxrss está en KB en Linux y en bytes en macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def current_rss_mb():
+    """Memoria residente actual del proceso, o None si el sistema no expone ``/proc/self/statm``"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class RssSampler:
+    """Pico de memoria residente durante un bloque, muestreando la RSS actual en un hilo.
+
+    ``ru_maxrss`` es el máximo de toda la vida del proceso y nunca baja: el
+    segundo modo heredaría el pico del primero. Aquí se mide la RSS al entrar
+    (``baseline``) y el máximo visto hasta salir, así cada modo reporta su
+    propio pico. Sin ``/proc`` se recurre a ``ru_maxrss`` (solo es exacto
+    para el primer modo).
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        gc.collect()
+        self.baseline = current_rss_mb()
+        if self.baseline is None:
+            self.peak = peak_rss_mb()
+            return self
+        self.peak = self.baseline
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb() or 0)
+
+    def __exit__(self, *exc_info):
+        if self._thread is None:
+            self.peak = peak_rss_mb()
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb() or 0)
+
+    def report(self):
+        return {
+            'rss_before_mb': round(self.baseline, 1) if self.baseline is not None else None,
+            'peak_rss_mb': round(self.peak, 1),
+            'peak_rss_delta_mb': round(self.peak - self.baseline, 1) if self.baseline is not None else None,
+        }
+
+
+@contextmanager
+def throwaway_database(path):
+    """Apunta la conexión 'default' de este hilo a un SQLite nuevo en ``path`` con las migraciones aplicadas.
+
+    Se crea con la misma maquinaria que la BD de pruebas de Django y se
+    elimina al salir: la BD real no recibe escrituras ni queda bloqueada
+    mientras dura la medición.
+    """
+    original = connections[DEFAULT_DB_ALIAS]
+    original_name = settings.DATABASES[DEFAULT_DB_ALIAS]['NAME']
+    database = connections.configure_settings({
+        DEFAULT_DB_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path), 'TEST': {'NAME': str(path)}},
+    })[DEFAULT_DB_ALIAS]
+    throwaway = DatabaseWrapper(database, alias=DEFAULT_DB_ALIAS)
+    connections[DEFAULT_DB_ALIAS] = throwaway
+    try:
+        throwaway.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        yield
+    finally:
+        # create_test_db también cambia settings.DATABASES: se restaura el nombre original
+        throwaway.creation.destroy_test_db(original_name, verbosity=0)
+        connections[DEFAULT_DB_ALIAS] = original
+
+
+class Command(BaseCommand):
+    help = 'Mide el rendimiento de la importación con un corpus sintético de PDFs y reporta JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=1000, help='Número de PDFs del corpus')
+        parser.add_argument('--min-pages', type=int, default=1, help='Páginas mínimas por PDF')
+        parser.add_argument('--max-pages', type=int, default=50, help='Páginas máximas por PDF')
+        parser.add_argument(
+            '--image-pages',
+            action='store_true',
+            help='Usar páginas con imagen (simula escaneos, archivos más pesados)',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Semilla para reproducir el corpus')
+        parser.add_argument(
+            '--corpus-dir',
+            help='Carpeta donde guardar/reutilizar el corpus (por defecto uno temporal)',
+        )
+        parser.add_argument(
+            '--modes',
+            default='sequential,batched,parallel',
+            help=f'Modos a medir, separados por coma ({", ".join(MODES)})',
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Hilos para el modo parallel')
+        parser.add_argument(
+            '--pipeline',
+            action='store_true',
+            help='Incluir en la medición las etapas posteriores (miniaturas, etc.) en el mismo proceso',
+        )
+        parser.add_argument('--output', help='Archivo donde escribir el JSON (por defecto stdout)')
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f'Modos desconocidos: {", ".join(sorted(unknown))}')
+
+        work_dir = Path(tempfile.mkdtemp(prefix='doctrac_bench_'))
+        corpus_dir = Path(options['corpus_dir']) if options['corpus_dir'] else work_dir / 'corpus'
+        try:
+            corpus = self.build_corpus(corpus_dir, options)
+            report = {
+                'corpus': {
+                    'files': len(corpus),
+                    'bytes': sum(p.stat().st_size for p in corpus),
+                    'min_pages': options['min_pages'],
+                    'max_pages': options['max_pages'],
+                    'image_pages': options['image_pages'],
+                    'seed': options['seed'],
+                },
+                'runs': [
+                    self.run_mode(mode, corpus, work_dir, options['workers'], options['pipeline'])
+                    for mode in modes
+                ],
+            }
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output + '\n', encoding='utf-8')
+            self.stderr.write(f'📊 Resultados guardados en {options["output"]}')
+        else:
+            self.stdout.write(output)
+
+    def build_corpus(self, corpus_dir, options):
+        """Genera el corpus en paralelo, o reutiliza uno existente con la misma cantidad de archivos"""
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+        existing = sorted(corpus_dir.glob('*.pdf'))
+        if len(existing) == options['files']:
+            self.stderr.write(f'♻️  Reutilizando corpus en {corpus_dir}')
+            return existing
+
+        rng = random.Random(options['seed'])
+        jobs = [
+            (
+                corpus_dir / f'bench_{i:06d}.pdf',
+                rng.randint(options['min_pages'], max(options['min_pages'], options['max_pages'])),
+                options['image_pages'],
+                rng.getrandbits(32),
+            )
+            for i in range(options['files'])
+        ]
+        self.stderr.write(f'🏭 Generando {len(jobs)} PDFs en {corpus_dir}...')
+        started = time.monotonic()
+        # Procesos aparte: la generación no infla la memoria máxima del proceso medido
+        with ProcessPoolExecutor() as executor:
+            list(executor.map(generate_sample_pdf, jobs, chunksize=16))
+        self.stderr.write(f'   listo en {time.monotonic() - started:.1f}s')
+        return [path for path, _, _, _ in jobs]
+
+    def run_mode(self, mode, corpus, work_dir, workers, pipeline=False):
+        """Importa una copia del corpus con la configuración del modo sobre una BD desechable"""
+        media_root = work_dir / mode / 'Main'
+        monitored_folder = media_root / 'WorkFolder'
+        monitored_folder.mkdir(parents=True)
+        # Enlaces duros si el corpus está en el mismo volumen: preparar cada modo no cuesta E/S
+        link = os.link if corpus and corpus[0].stat().st_dev == monitored_folder.stat().st_dev else shutil.copy2
+        for path in corpus:
+            link(path, monitored_folder / path.name)
+
+        config = MODES[mode](workers)
+        self.stderr.write(f'⏱️  Modo {mode}: {config}')
+
+        with override_settings(
+            MEDIA_ROOT=str(media_root),
+            MAIN_FOLDER=str(media_root),
+            MONITORED_FOLDER=str(monitored_folder),
+            INGESTION_JOURNAL_PATH=None,
+            # Ninguna etapa escribe en las cachés de producción
+            THUMBNAIL_CACHE_DIR=work_dir / mode / 'cache' / 'thumbnails',
+            PAGE_CACHE_DIR=work_dir / mode / 'cache' / 'pages',
+            WATERMARK_CACHE_DIR=work_dir / mode / 'cache' / 'watermarked',
+            # Por defecto las etapas solo se encolan (filas de la BD desechable):
+            # se mide la importación tal como corre en producción
+            DOCUMENT_PIPELINE='inline' if pipeline else 'queue',
+        ):
+            # El benchmark nunca escribe en la base de datos real
+            with throwaway_database(work_dir / mode / 'benchmark.sqlite3'):
+                get_user_model().objects.create_user('benchmark')
+
+                # Sin reposo: el corpus recién generado está completo, pero se mide la revisión del trailer
+                ingestor = FolderIngestor(
+                    monitored_folder=monitored_folder,
+                    stability_gate=StabilityGate(quiescence=0),
+                    **config
+                )
+                ingestor.prepare()
+                with CaptureQueriesContext(connection) as queries, RssSampler() as memory:
+                    stats = ingestor.ingest(sorted(monitored_folder.glob('*.pdf')), IngestionStats())
+                # Se cuentan antes de salir: fuera del bloque ``connection`` vuelve a ser la BD real
+                query_count = len(queries)
+
+        shutil.rmtree(work_dir / mode, ignore_errors=True)
+        return {
+            'mode': mode,
+            'pipeline': pipeline,
+            'workers': config['workers'],
+            'batch_size': config['batch_size'],
+            'files': stats.processed,
+            'failed': stats.failed,
+            'seconds': round(stats.elapsed, 3),
+            'files_per_second': round(stats.files_per_second, 2),
+            'mb_per_second': round(stats.mb_per_second, 2),
+            'queries': query_count,
+            'queries_per_file': round(query_count / max(stats.processed, 1), 2),
+            **memory.report(),
+        }
@@ -0,0 +1,81 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Substr
+from documents.dates import SCAN_CHARS, save_extracted_dates
+from documents.models import Document
+from documents.workers import extract_dates
+
+class Command(BaseCommand):
+    help = 'Detecta la fecha del documento y la de vencimiento en el texto de los PDFs pendientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de procesos para analizar los documentos en paralelo',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Documentos por lote (una consulta y una escritura masiva por lote)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Analizar todos los pendientes, no solo los que no tienen fecha o vencimiento',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        batch_size = max(options['batch_size'], 1)
+        day_first = getattr(settings, 'DATE_EXTRACTION_DAY_FIRST', True)
+        today = date.today()
+
+        queryset = Document.objects.filter(status='pending').exclude(file='')
+        if not options['all']:
+            queryset = queryset.filter(Q(document_date__isnull=True) | Q(due_date__isnull=True))
+        total = queryset.count()
+        self.stdout.write(f'📅 Documentos por analizar: {total}')
+
+        analyzed = 0
+        filled = 0
+        failed = 0
+        last_id = 0
+        # Procesos y no hilos: el análisis con expresiones regulares no libera el GIL
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                # Solo el principio del texto guardado; sin texto, el worker lee el PDF
+                batch = list(
+                    queryset.filter(id__gt=last_id).order_by('id')
+                    .annotate(head=Substr('text__text', 1, SCAN_CHARS))
+                    .values_list('id', 'file', 'head')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+
+                items = [
+                    (document_id, head, str(Path(settings.MEDIA_ROOT) / file), day_first, today)
+                    for document_id, file, head in batch
+                ]
+                results = []
+                for document_id, extracted, error in executor.map(extract_dates, items, chunksize=16):
+                    if extracted is None:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'No se pudo analizar el documento {document_id}: {error}'))
+                    else:
+                        results.append((document_id, extracted))
+
+                filled += save_extracted_dates(results)
+                analyzed += len(results)
+                self.stdout.write(f'  … {analyzed}/{total} analizados')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {analyzed} documentos analizados, {filled} con fecha completada ({failed} con error)'
+        ))
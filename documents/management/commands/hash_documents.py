@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from documents.models import Document
+from documents.ingestion import compute_file_hash
+
+class Command(BaseCommand):
+    help = 'Calcula el hash SHA-256 de los documentos existentes que aún no lo tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de hilos para leer y hashear archivos en paralelo',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Documentos por lote (una consulta de duplicados y un UPDATE masivo por lote)',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        batch_size = max(options['batch_size'], 1)
+
+        queryset = Document.objects.filter(content_hash__isnull=True).exclude(file='')
+        total = queryset.count()
+        self.stdout.write(f'🔐 Documentos sin hash: {total}')
+
+        updated = 0
+        duplicates = 0
+        missing = 0
+        last_id = 0
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(
+                    queryset.filter(id__gt=last_id).order_by('id').only('id', 'file', 'title')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                hashes = list(executor.map(self.hash_document, batch))
+
+                # Una sola consulta por lote para detectar hashes ya registrados
+                taken = set(
+                    Document.objects.filter(content_hash__in=[h for h in hashes if h])
+                    .values_list('content_hash', flat=True)
+                )
+
+                to_update = []
+                for document, content_hash in zip(batch, hashes):
+                    if content_hash is None:
+                        missing += 1
+                        self.stdout.write(self.style.WARNING(f'Archivo no encontrado: {document.file.name} (ID {document.id})'))
+                    elif content_hash in taken:
+                        duplicates += 1
+                        self.stdout.write(self.style.WARNING(f'Duplicado por contenido: "{document.title}" (ID {document.id})'))
+                    else:
+                        taken.add(content_hash)
+                        document.content_hash = content_hash
+                        to_update.append(document)
+
+                Document.objects.bulk_update(to_update, ['content_hash'])
+                updated += len(to_update)
+                self.stdout.write(f'  … {updated}/{total} hasheados')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Hash calculado para {updated} documentos '
+            f'({duplicates} duplicados, {missing} sin archivo)'
+        ))
+
+    def hash_document(self, document):
+        """Retorna el hash del archivo del documento, o None si no existe"""
+        try:
+            return compute_file_hash(Path(settings.MEDIA_ROOT) / document.file.name)
+        except OSError:
+            return None
@@ -0,0 +1,68 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Substr
+from documents.models import Document
+from documents.near_duplicates import MAX_TEXT_CHARS, near_duplicates, reviewed_documents, save_signatures
+from documents.workers import minhash_signature
+
+class Command(BaseCommand):
+    help = 'Calcula las firmas MinHash del texto de los documentos e informa los pendientes que parecen duplicados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de procesos para calcular firmas en paralelo',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Documentos por lote (un INSERT masivo por lote)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recalcular también las firmas existentes',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        batch_size = max(options['batch_size'], 1)
+
+        queryset = Document.objects.filter(text__isnull=False)
+        if not options['all']:
+            queryset = queryset.filter(signature__isnull=True)
+        total = queryset.count()
+        self.stdout.write(f'🧬 Documentos por firmar: {total}')
+
+        done = 0
+        signed = 0
+        last_id = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(
+                    queryset.filter(id__gt=last_id).order_by('id')
+                    .annotate(sample=Substr('text__text', 1, MAX_TEXT_CHARS))
+                    .values_list('id', 'sample')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+
+                signed += save_signatures(executor.map(minhash_signature, batch, chunksize=16))
+                done += len(batch)
+                self.stdout.write(f'  … {done}/{total} procesados')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {signed} firmas guardadas ({done - signed} con texto insuficiente)'))
+
+        pending = Document.objects.filter(status='pending').values_list('id', flat=True)
+        duplicates = near_duplicates(pending, candidates=reviewed_documents())
+        if duplicates:
+            self.stdout.write(self.style.WARNING(f'📑 {len(duplicates)} documentos pendientes parecen duplicados:'))
+            ids = set(duplicates) | {other_id for found in duplicates.values() for other_id, _ in found}
+            titles = dict(Document.objects.filter(id__in=ids).values_list('id', 'title'))
+            for document_id, found in duplicates.items():
+                other_id, score = found[0]
+                self.stdout.write(f'  {titles[document_id]} ≈ {titles[other_id]} ({score:.0%})')
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from documents.models import RelatedDocument
+from documents.related import DEFAULT_BATCH_SIZE, index_documents
+
+class Command(BaseCommand):
+    help = 'Actualiza (de forma incremental) el índice TF-IDF y los documentos relacionados precalculados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Reconstruir desde cero, recalculando las frecuencias de documento',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Documentos por lote al leer texto y al buscar vecinos',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        indexed = index_documents(full=options['full'], batch_size=max(options['batch_size'], 1))
+        with_related = RelatedDocument.objects.values('document').annotate(n=Count('id')).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'🔗 {len(indexed)} documentos indexados ({time.monotonic() - started:.2f}s), '
+            f'{with_related} con documentos relacionados'
+        ))
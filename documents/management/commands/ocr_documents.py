@@ -0,0 +1,122 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from documents.models import Document
+from documents.ocr import (
+    RateLimiter, finalize, ocr_available, ocr_candidates, ocr_settings, remaining_pages, save_page_texts,
+)
+from documents.tasks import extract_dates, index_near_duplicates, suggest_classification
+from documents.workers import lower_priority, ocr_pages
+
+class Command(BaseCommand):
+    help = 'OCR de las páginas escaneadas sin capa de texto (reanudable: continúa donde quedó la corrida anterior)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'document_ids',
+            nargs='*',
+            type=int,
+            help='Documentos a procesar (por defecto, todos los que no tienen texto suficiente)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'OCR_WORKERS', 2),
+            help='Número de procesos de OCR (cada uno ejecuta tesseract con un solo hilo)',
+        )
+        parser.add_argument(
+            '--pages-per-minute',
+            type=int,
+            default=getattr(settings, 'OCR_PAGES_PER_MINUTE', 60),
+            help='Ritmo máximo de páginas enviadas al OCR (0 = sin límite)',
+        )
+        parser.add_argument(
+            '--chunk-pages',
+            type=int,
+            default=10,
+            help='Páginas por tarea del pool (se guardan al terminar cada tarea)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Documentos por lote',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        chunk_pages = max(options['chunk_pages'], 1)
+        batch_size = max(options['batch_size'], 1)
+        ocr_options = ocr_settings()
+        if not ocr_available(ocr_options['command']):
+            self.stdout.write(self.style.WARNING(
+                f"No se encontró {ocr_options['command']}: solo se guardará el texto de las páginas que ya lo tienen"
+            ))
+
+        queryset = Document.objects.all()
+        if options['document_ids']:
+            queryset = queryset.filter(id__in=options['document_ids']).exclude(file='')
+        else:
+            queryset = ocr_candidates(queryset)
+        total = queryset.count()
+        self.stdout.write(f'🔠 Documentos por procesar: {total} ({workers} procesos, {options["pages_per_minute"]} páginas/min)')
+
+        limiter = RateLimiter(options['pages_per_minute'])
+        outstanding = {}
+        completed = []
+        self.pages = 0
+        self.failed = 0
+        last_id = 0
+        # Pocos procesos con prioridad reducida y a lo sumo dos tareas en cola por proceso
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=lower_priority, initargs=(getattr(settings, 'OCR_NICE', 10),)
+        ) as executor:
+            running = set()
+            while True:
+                batch = list(queryset.filter(id__gt=last_id).order_by('id').only('id', 'file', 'page_count')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                for document, pages in remaining_pages(batch):
+                    path = str(Path(settings.MEDIA_ROOT) / document.file.name)
+                    chunks = [pages[i:i + chunk_pages] for i in range(0, len(pages), chunk_pages)]
+                    outstanding[document.id] = len(chunks)
+                    if not chunks:
+                        # Ya se había reconocido todo en una corrida anterior
+                        completed += finalize([document.id])
+                    for chunk in chunks:
+                        while len(running) >= workers * 2:
+                            done, running = wait(running, return_when=FIRST_COMPLETED)
+                            completed += self.collect(done, outstanding)
+                        limiter.wait(len(chunk))
+                        running.add(executor.submit(ocr_pages, (document.id, path, chunk, ocr_options)))
+
+                self.stdout.write(f'  … {len(completed)}/{total} documentos completos, {self.pages} páginas')
+
+            completed += self.collect(wait(running).done, outstanding)
+
+        if completed:
+            # El texto nuevo alimenta también las fechas, las sugerencias y los casi duplicados
+            extract_dates(completed)
+            suggest_classification(completed)
+            index_near_duplicates(completed)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {len(completed)} documentos con texto, {self.pages} páginas procesadas ({self.failed} con error)'
+        ))
+
+    def collect(self, futures, outstanding):
+        """Guarda las páginas de las tareas terminadas; retorna los documentos completados"""
+        completed = []
+        for future in futures:
+            document_id, results, error = future.result()
+            save_page_texts(document_id, results)
+            self.pages += len(results)
+            if error:
+                self.failed += 1
+                self.stdout.write(self.style.WARNING(f'OCR incompleto del documento {document_id}: {error}'))
+            outstanding[document_id] -= 1
+            if not outstanding[document_id]:
+                completed += finalize([document_id])
+        return completed
@@ -0,0 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db.models import Count, Sum
+from documents.models import Document, DocumentDerivative
+from documents.optimize import derivative_name, optimize_settings, save_derivatives
+from documents.workers import optimize_pdf
+
+class Command(BaseCommand):
+    help = 'Genera la versión linealizada y con imágenes recomprimidas de los PDFs e informa los bytes ahorrados'
+
+    def add_arguments(self, parser):
+        defaults = optimize_settings()
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de procesos para optimizar en paralelo',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Documentos por lote (un INSERT masivo por lote)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Volver a optimizar también los documentos que ya tienen versión optimizada',
+        )
+        parser.add_argument(
+            '--quality',
+            type=int,
+            default=defaults['quality'],
+            help='Calidad JPEG de las imágenes recomprimidas (1-95; menos calidad, archivos más pequeños)',
+        )
+        parser.add_argument(
+            '--max-dpi',
+            type=int,
+            default=defaults['max_dpi'],
+            help='Resolución máxima de las imágenes (las de mayor resolución se reducen)',
+        )
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            help='Solo mostrar el ahorro acumulado de los documentos ya optimizados',
+        )
+
+    def handle(self, *args, **options):
+        if not options['report']:
+            self.optimize(options)
+        self.print_report()
+
+    def optimize(self, options):
+        workers = max(options['workers'], 1)
+        batch_size = max(options['batch_size'], 1)
+        quality = min(max(options['quality'], 1), 95)
+        max_dpi = max(options['max_dpi'], 36)
+
+        queryset = Document.objects.exclude(file='')
+        if not options['all']:
+            queryset = queryset.exclude(derivatives__kind='optimized')
+        total = queryset.count()
+        self.stdout.write(f'🗜️ Documentos por optimizar: {total} (calidad {quality}, máx. {max_dpi} dpi)')
+
+        done = 0
+        saved = 0
+        failed = 0
+        last_id = 0
+        # Procesos y no hilos: qpdf y la recodificación de imágenes son trabajo de CPU
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(
+                    queryset.filter(id__gt=last_id).order_by('id').only('id', 'file', 'content_hash')
+                    .prefetch_related('derivatives')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                names = {d.id: derivative_name(d, 'optimized') for d in batch}
+                items = [
+                    # Sobre el derivado sin páginas en blanco, si existe
+                    (d.id, d.derivative_source_path('optimized'),
+                     str(Path(settings.MEDIA_ROOT) / names[d.id]), quality, max_dpi)
+                    for d in batch
+                ]
+                results = []
+                for document_id, result, error in executor.map(optimize_pdf, items):
+                    if result is None:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'No se pudo optimizar el documento {document_id}: {error}'))
+                        continue
+                    result.update(quality=quality, max_dpi=max_dpi)
+                    results.append((document_id, names[document_id], result))
+
+                derivatives = save_derivatives(results)
+                done += len(results)
+                saved += sum(d.bytes_saved for d in derivatives)
+                self.stdout.write(f'  … {done}/{total} procesados, {saved / 1024 / 1024:.1f} MB ahorrados')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {done} documentos procesados ({failed} con error), {saved / 1024 / 1024:.1f} MB ahorrados en esta corrida'
+        ))
+
+    def print_report(self):
+        totals = DocumentDerivative.objects.filter(kind='optimized').aggregate(
+            count=Count('id'), original=Sum('original_size'), optimized=Sum('size')
+        )
+        if not totals['count']:
+            self.stdout.write('No hay documentos optimizados todavía')
+            return
+        saved = totals['original'] - totals['optimized']
+        self.stdout.write(self.style.SUCCESS(
+            f'📊 {totals["count"]} documentos optimizados: '
+            f'{totals["original"] / 1024 / 1024:.1f} MB → {totals["optimized"] / 1024 / 1024:.1f} MB '
+            f'({saved / 1024 / 1024:.1f} MB ahorrados, {saved * 100 / totals["original"]:.0f}%)'
+        ))
@@ -0,0 +1,57 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from documents.models import PipelineQueueEntry
+from documents.tasks import drain_post_ingest
+
+class Command(BaseCommand):
+    help = 'Proceso continuo que ejecuta las etapas posteriores a la importación (miniaturas, texto, etc.) de los documentos en cola'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Vaciar la cola y terminar (p. ej. desde cron, después de sync_documents)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Documentos por lote reclamado',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Segundos de espera cuando la cola está vacía',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        if not options['once']:
+            self.stdout.write(self.style.SUCCESS('⚙️  Procesando la cola del pipeline. Ctrl+C para salir.'))
+
+        total = 0
+        try:
+            while True:
+                # Descartar conexiones caídas o vencidas (CONN_MAX_AGE) entre lotes
+                close_old_connections()
+                started = time.monotonic()
+                processed = drain_post_ingest(batch_size)
+                if processed:
+                    total += processed
+                    self.stdout.write(f'  … {processed} documentos ({time.monotonic() - started:.2f}s)')
+                if options['once']:
+                    break
+                if not processed:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('🛑 Procesamiento detenido'))
+
+        exhausted = PipelineQueueEntry.objects.filter(attempts__gte=getattr(settings, 'PIPELINE_MAX_ATTEMPTS', 3)).count()
+        if exhausted:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  {exhausted} documentos agotaron sus intentos y siguen en la cola (ver PipelineQueueEntry)'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} documentos procesados'))
@@ -0,0 +1,81 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from documents.models import Document
+from documents.search import MAX_TEXT_CHARS, fts_available, rebuild_index, save_texts
+from documents.workers import extract_text
+
+class Command(BaseCommand):
+    help = 'Extrae el texto de los PDFs y reconstruye el índice de búsqueda de texto completo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de procesos para extraer texto en paralelo',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Documentos por lote (un INSERT masivo por lote)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Volver a extraer el texto de todos los documentos, no solo de los que no lo tienen',
+        )
+        parser.add_argument(
+            '--rebuild-only',
+            action='store_true',
+            help='No extraer texto; solo reconstruir y optimizar el índice desde la base de datos',
+        )
+
+    def handle(self, *args, **options):
+        if not options['rebuild_only']:
+            self.extract_texts(options)
+
+        if fts_available():
+            rebuild_index()
+            self.stdout.write(self.style.SUCCESS('✅ Índice de búsqueda reconstruido y optimizado'))
+        else:
+            self.stdout.write(self.style.WARNING('La base de datos no es SQLite: la búsqueda usa icontains'))
+
+    def extract_texts(self, options):
+        workers = max(options['workers'], 1)
+        batch_size = max(options['batch_size'], 1)
+
+        # El texto obtenido por OCR no está en la capa del PDF: se conserva (ver ocr_documents)
+        queryset = Document.objects.exclude(file='').exclude(text__source='ocr')
+        if not options['all']:
+            queryset = queryset.filter(text__isnull=True)
+        total = queryset.count()
+        self.stdout.write(f'🔎 Documentos por indexar: {total}')
+
+        indexed = 0
+        failed = 0
+        last_id = 0
+        # Procesos y no hilos: PDFium no es seguro entre hilos
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(queryset.filter(id__gt=last_id).order_by('id').only('id', 'file')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                items = [(d.id, str(Path(settings.MEDIA_ROOT) / d.file.name), MAX_TEXT_CHARS) for d in batch]
+                results = []
+                for document_id, text, pages in executor.map(extract_text, items, chunksize=8):
+                    if text is None:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'No se pudo leer el documento {document_id}: {pages}'))
+                    else:
+                        results.append((document_id, text, pages))
+
+                save_texts(results)
+                indexed += len(results)
+                self.stdout.write(f'  … {indexed}/{total} indexados')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Texto extraído de {indexed} documentos ({failed} con error)'))
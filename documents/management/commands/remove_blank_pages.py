@@ -0,0 +1,110 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db.models import Count, Sum
+from documents.models import Document, DocumentDerivative
+from documents.optimize import blank_page_threshold, derivative_name, discard_derivatives, save_derivatives
+from documents.workers import remove_blank_pages
+
+class Command(BaseCommand):
+    help = 'Genera la versión sin páginas en blanco de los PDFs e informa las páginas quitadas y los bytes ahorrados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de procesos para analizar los PDFs en paralelo',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Documentos por lote (un INSERT masivo por lote)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Volver a analizar también los documentos que ya tienen versión sin páginas en blanco',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=blank_page_threshold(),
+            help='Fracción máxima de tinta de una página en blanco',
+        )
+        parser.add_argument(
+            '--report',
+            action='store_true',
+            help='Solo mostrar las páginas quitadas y el ahorro acumulado',
+        )
+
+    def handle(self, *args, **options):
+        if not options['report']:
+            self.remove_blank_pages(options)
+        self.print_report()
+
+    def remove_blank_pages(self, options):
+        workers = max(options['workers'], 1)
+        batch_size = max(options['batch_size'], 1)
+        threshold = options['threshold']
+
+        queryset = Document.objects.exclude(file='').filter(is_encrypted=False)
+        if not options['all']:
+            queryset = queryset.exclude(derivatives__kind='blank_removed')
+        total = queryset.count()
+        self.stdout.write(f'📄 Documentos por analizar: {total}')
+
+        done = 0
+        pages = 0
+        saved = 0
+        failed = 0
+        last_id = 0
+        # Procesos y no hilos: PDFium no es seguro entre hilos
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(queryset.filter(id__gt=last_id).order_by('id').only('id', 'file', 'content_hash')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                names = {d.id: derivative_name(d, 'blank_removed') for d in batch}
+                items = [
+                    (d.id, str(Path(settings.MEDIA_ROOT) / d.file.name),
+                     str(Path(settings.MEDIA_ROOT) / names[d.id]), threshold)
+                    for d in batch
+                ]
+                results = []
+                for document_id, result, error in executor.map(remove_blank_pages, items):
+                    if error:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'No se pudo analizar el documento {document_id}: {error}'))
+                    elif result:
+                        results.append((document_id, names[document_id], result))
+
+                derivatives = save_derivatives(results, 'blank_removed')
+                # El optimizado anterior todavía tiene las páginas en blanco: optimize_documents lo regenera
+                discard_derivatives([d.document_id for d in derivatives], 'optimized')
+                done += len(batch)
+                pages += sum(len(d.details['pages_removed']) for d in derivatives)
+                saved += sum(d.bytes_saved for d in derivatives)
+                self.stdout.write(f'  … {done}/{total} analizados, {pages} páginas en blanco quitadas')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {done} documentos analizados ({failed} con error): {pages} páginas en blanco quitadas, '
+            f'{saved / 1024 / 1024:.1f} MB ahorrados en esta corrida'
+        ))
+
+    def print_report(self):
+        derivatives = DocumentDerivative.objects.filter(kind='blank_removed')
+        totals = derivatives.aggregate(count=Count('id'), original=Sum('original_size'), reduced=Sum('size'))
+        if not totals['count']:
+            self.stdout.write('No hay documentos con páginas en blanco quitadas todavía')
+            return
+        pages = sum(len(details.get('pages_removed', [])) for details in derivatives.values_list('details', flat=True))
+        saved = totals['original'] - totals['reduced']
+        self.stdout.write(self.style.SUCCESS(
+            f'📊 {totals["count"]} documentos sin páginas en blanco: {pages} páginas quitadas, '
+            f'{saved / 1024 / 1024:.1f} MB ahorrados ({saved * 100 / totals["original"]:.0f}%)'
+        ))
@@ -0,0 +1,127 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from documents.models import Document
+from documents.splitting import SPLIT_MODES, split_batch, split_settings
+from documents.workers import find_segments
+
+class Command(BaseCommand):
+    help = 'Divide los lotes escaneados (varios documentos en un PDF) en un documento por segmento'
+
+    def add_arguments(self, parser):
+        defaults = split_settings()
+        parser.add_argument(
+            'document_ids',
+            nargs='*',
+            type=int,
+            help='Documentos a dividir (por defecto, los pendientes importados desde SCAN_SPLIT_FOLDER)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=SPLIT_MODES,
+            default=defaults['mode'],
+            help='Cómo detectar el límite entre documentos: página en blanco, hoja separadora o cada N páginas',
+        )
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=defaults['pages'],
+            help="Páginas por documento (modo 'pages')",
+        )
+        parser.add_argument(
+            '--marker',
+            default=defaults['marker'],
+            help="Texto de la hoja separadora (modo 'marker')",
+        )
+        parser.add_argument(
+            '--blank-threshold',
+            type=float,
+            default=defaults['blank_threshold'],
+            help="Fracción máxima de tinta de una página en blanco (modo 'blank')",
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de procesos para analizar los lotes en paralelo',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Lotes por tanda',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar los segmentos detectados, sin crear documentos',
+        )
+
+    def handle(self, *args, **options):
+        if not options['mode']:
+            raise CommandError('Indica --mode o configura SCAN_SPLIT_MODE')
+        split_options = {
+            'mode': options['mode'],
+            'pages': max(options['pages'], 1),
+            'marker': options['marker'],
+            'blank_threshold': options['blank_threshold'],
+        }
+        workers = max(options['workers'], 1)
+        batch_size = max(options['batch_size'], 1)
+
+        queryset = Document.objects.exclude(file='').filter(source_batch__isnull=True, segments__isnull=True)
+        if options['document_ids']:
+            queryset = queryset.filter(id__in=options['document_ids'])
+        else:
+            queryset = queryset.filter(imported_from_folder=True, status='pending')
+            folder = getattr(settings, 'SCAN_SPLIT_FOLDER', '').strip('/')
+            if folder:
+                queryset = queryset.filter(original_filename__startswith=f'{folder}/')
+        total = queryset.count()
+        self.stdout.write(f"✂️ Lotes por analizar: {total} (modo '{split_options['mode']}')")
+
+        analyzed = 0
+        split = 0
+        created = 0
+        failed = 0
+        last_id = 0
+        # Procesos y no hilos: PDFium no es seguro entre hilos
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(queryset.filter(id__gt=last_id).order_by('id')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                documents = {d.id: d for d in batch}
+                items = [(d.id, str(Path(settings.MEDIA_ROOT) / d.file.name), split_options) for d in batch]
+                for document_id, segments, error in executor.map(find_segments, items):
+                    analyzed += 1
+                    if segments is None:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'No se pudo analizar el documento {document_id}: {error}'))
+                        continue
+                    if len(segments) < 2:
+                        continue
+                    ranges = ', '.join(f'{start + 1}-{end}' for start, end in segments)
+                    if options['dry_run']:
+                        self.stdout.write(f'[DRY RUN] {documents[document_id].title}: {len(segments)} documentos ({ranges})')
+                        continue
+                    try:
+                        children = split_batch(documents[document_id], segments)
+                    except Exception as e:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(f'❌ Error dividiendo el documento {document_id}: {e}'))
+                        continue
+                    split += 1
+                    created += len(children)
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✅ {documents[document_id].title}: {len(children)} documentos ({ranges})'
+                    ))
+
+                self.stdout.write(f'  … {analyzed}/{total} analizados')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {split} lotes divididos en {created} documentos ({failed} con error)'
+        ))
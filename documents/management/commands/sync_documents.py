@@ -1,13 +1,9 @@
-import os
-import shutil
-from datetime import datetime
+from itertools import chain
 from pathlib import Path
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from documents.models import Document, Category
-from django.contrib.auth import get_user_model
-
-User = get_user_model()
+from documents.ingestion import FolderIngestor, IngestionStats, DEFAULT_BATCH_SIZE
+from documents.scanner import iter_pdfs, scan_options
 
 class Command(BaseCommand):
     help = 'Sincroniza documentos desde la carpeta de monitoreo'
@@ -18,6 +14,45 @@ class Command(BaseCommand):
             action='store_true',
             help='Muestra qué archivos se procesarían sin realizar cambios',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Número de hilos para mover y copiar archivos en paralelo (la BD usa un solo escritor)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Documentos por lote (un INSERT masivo y una transacción por lote)',
+        )
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='async_mode',
+            help='Encolar la importación en Celery (lotes de INGEST_CHUNK_SIZE) en lugar de procesarla aquí',
+        )
+        parser.add_argument(
+            '--recover',
+            action='store_true',
+            help='Solo reanudar los archivos incompletos registrados en la bitácora de importación',
+        )
+        parser.add_argument(
+            '--recursive',
+            action='store_true',
+            default=None,
+            help='Recorrer también las subcarpetas (p. ej. carpetas por día del escáner)',
+        )
+        parser.add_argument(
+            '--include',
+            action='append',
+            help='Patrón de archivos a incluir (se puede repetir, por defecto *.pdf)',
+        )
+        parser.add_argument(
+            '--exclude',
+            action='append',
+            help='Patrón de archivos o carpetas a excluir (se puede repetir)',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -30,113 +65,76 @@ class Command(BaseCommand):
             )
             return
         
-        # Obtener archivos PDF en la carpeta de monitoreo
-        pdf_files = list(monitored_folder.glob('*.pdf'))
-        
-        if not pdf_files:
-            self.stdout.write(
-                self.style.SUCCESS('No se encontraron nuevos documentos PDF en la carpeta de monitoreo.')
+        if options['recover']:
+            ingestor = FolderIngestor(
+                monitored_folder=monitored_folder,
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                log=self.log,
             )
+            if ingestor.prepare():
+                stats = ingestor.recover()
+                self.stdout.write(
+                    self.style.SUCCESS(f'✅ Recuperados {stats.processed} documentos ({stats.failed} con error)')
+                )
             return
         
-        # Obtener categoría por defecto para documentos escaneados
-        default_category, created = Category.objects.get_or_create(
-            name='Documentos Escaneados',
-            defaults={'description': 'Documentos importados automáticamente desde la carpeta de monitoreo'}
-        )
+        # Recorrer la carpeta de forma incremental (sin construir el listado completo)
+        pdf_files = iter_pdfs(monitored_folder, **scan_options(
+            recursive=options['recursive'],
+            include=options['include'],
+            exclude=options['exclude'],
+        ))
+        first_file = next(pdf_files, None)
         
-        if created:
+        if first_file is None:
             self.stdout.write(
-                self.style.SUCCESS(f'Creada categoría: {default_category.name}')
+                self.style.SUCCESS('No se encontraron nuevos documentos PDF en la carpeta de monitoreo.')
             )
+            return
+        pdf_files = chain([first_file], pdf_files)
         
-        # Obtener el primer usuario como propietario por defecto (podríamos mejorarlo)
-        default_user = User.objects.first()
-        if not default_user:
+        if options['async_mode'] and not dry_run:
+            from documents.tasks import dispatch_folder_ingestion
+            job = dispatch_folder_ingestion(pdf_files)
             self.stdout.write(
-                self.style.ERROR('No se encontraron usuarios en el sistema. Crea al menos un usuario.')
+                self.style.SUCCESS(f'📨 Importación encolada: trabajo #{job.pk} con {job.total} archivos')
             )
             return
         
-        processed_count = 0
+        ingestor = FolderIngestor(
+            monitored_folder=monitored_folder,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            dry_run=dry_run,
+            log=self.log,
+        )
+        if not ingestor.prepare():
+            return
         
-        for pdf_file in pdf_files:
-            # Verificar si el documento ya existe en la base de datos
-            existing_doc = Document.objects.filter(
-                original_filename=pdf_file.name
-            ).first()
-            
-            if existing_doc:
-                self.stdout.write(
-                    self.style.WARNING(f'Documento ya existe: {pdf_file.name}')
-                )
-                continue
-            
-            if dry_run:
-                self.stdout.write(
-                    self.style.SUCCESS(f'[DRY RUN] Procesaría: {pdf_file.name}')
-                )
-                processed_count += 1
-                continue
-            
-            try:
-                # Crear carpetas necesarias
-                processed_folder = monitored_folder / 'processed'
-                processed_folder.mkdir(exist_ok=True)
-                
-                # La carpeta Pending (con mayúscula) dentro de Main (que es MEDIA_ROOT)
-                pending_folder = Path(settings.MEDIA_ROOT) / 'Pending'
-                pending_folder.mkdir(parents=True, exist_ok=True)
-                
-                # Generar timestamp único
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                
-                # Mover archivo original a 'processed'
-                processed_file = processed_folder / pdf_file.name
-                shutil.move(pdf_file, processed_file)
-                
-                # Crear copia en 'Pending'
-                pending_file = pending_folder / f"{timestamp}_{pdf_file.name}"
-                shutil.copy2(processed_file, pending_file)
-                
-                # Crear el documento en la base de datos apuntando al archivo en 'Pending'
-                document = Document.objects.create(
-                    title=pdf_file.stem,  # Nombre sin extensión
-                    notes=f'Documento escaneado importado automáticamente el {datetime.now().strftime("%Y-%m-%d %H:%M")}',
-                    category=default_category,
-                    created_by=default_user,
-                    original_filename=pdf_file.name,
-                    imported_from_folder=True,
-                    status='pending'
-                )
-                
-                # Actualizar el campo file del documento con la ruta relativa
-                relative_path = pending_file.relative_to(settings.MEDIA_ROOT)
-                document.file = str(relative_path)
-                document.save()
-                
-                self.stdout.write(
-                    self.style.SUCCESS(f'✅ Procesado: {pdf_file.name} -> ID: {document.id}')
-                )
-                self.stdout.write(
-                    self.style.SUCCESS(f'📁 Original en: {processed_file}')
-                )
-                self.stdout.write(
-                    self.style.SUCCESS(f'📋 Copia en: {pending_file}')
-                )
-                
-                processed_count += 1
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'❌ Error procesando {pdf_file.name}: {str(e)}')
-                )
+        # Terminar primero lo que haya quedado a medias en una corrida anterior
+        stats = ingestor.recover(IngestionStats())
+        stats = ingestor.ingest(pdf_files, stats)
         
         if dry_run:
             self.stdout.write(
-                self.style.SUCCESS(f'[DRY RUN] Se procesarían {processed_count} documentos')
+                self.style.SUCCESS(f'[DRY RUN] Se procesarían {stats.processed} documentos')
             )
         else:
             self.stdout.write(
-                self.style.SUCCESS(f'✅ Procesados {processed_count} documentos nuevos')
-            )
\ No newline at end of file
+                self.style.SUCCESS(f'✅ Procesados {stats.processed} documentos nuevos')
+            )
+            if stats.deferred:
+                self.stdout.write(
+                    self.style.WARNING(f'⏳ {stats.deferred} archivos diferidos: el escáner aún los está escribiendo')
+                )
+            self.stdout.write(f'⏱️  Rendimiento: {stats.summary()}')
+
+    def log(self, level, message):
+        """Escribe un mensaje del importador con el estilo correspondiente"""
+        style = {
+            'success': self.style.SUCCESS,
+            'warning': self.style.WARNING,
+            'error': self.style.ERROR,
+        }.get(level, str)
+        self.stdout.write(style(message))
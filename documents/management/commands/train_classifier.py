@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand
+from documents.classifier import DEFAULT_BATCH_SIZE, model_path, suggest, train
+
+class Command(BaseCommand):
+    help = 'Entrena (de forma incremental) el clasificador local y sugiere categoría, tipo y entidad para los pendientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Reentrenar desde cero en lugar de sumar solo los documentos nuevos o recategorizados',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Documentos por lote al leer texto y al guardar sugerencias',
+        )
+        parser.add_argument(
+            '--no-suggest',
+            action='store_true',
+            help='Solo entrenar, sin volver a puntuar los documentos pendientes',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+
+        started = time.monotonic()
+        classifier, learned = train(full=options['full'], batch_size=batch_size)
+        if not classifier.is_trained:
+            self.stdout.write(self.style.WARNING(
+                'No hay documentos revisados con categoría, tipo o entidad para entrenar'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'🧠 Modelo actualizado con {learned} documentos '
+            f'({len(classifier.trained)} en total, {time.monotonic() - started:.2f}s) → {model_path()}'
+        ))
+
+        if options['no_suggest']:
+            return
+        started = time.monotonic()
+        suggested = suggest(batch_size=batch_size, classifier=classifier)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Sugerencias guardadas para {suggested} documentos pendientes ({time.monotonic() - started:.2f}s)'
+        ))
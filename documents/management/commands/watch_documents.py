@@ -0,0 +1,137 @@
+import time
+from itertools import chain
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections
+from documents.ingestion import FolderIngestor, IngestionStats
+from documents.scanner import iter_pdfs, scan_options
+from documents.watcher import create_watcher
+
+class Command(BaseCommand):
+    help = 'Proceso continuo que importa los PDFs de la carpeta de monitoreo en cuanto aparecen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Número de hilos para mover y copiar archivos en paralelo',
+        )
+        parser.add_argument(
+            '--polling',
+            action='store_true',
+            help='Forzar el modo de sondeo aunque inotify esté disponible',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Segundos entre sondeos en modo polling',
+        )
+        parser.add_argument(
+            '--settle',
+            type=float,
+            default=1.0,
+            help='Segundos para agrupar eventos seguidos en un solo lote',
+        )
+        parser.add_argument(
+            '--rescan',
+            type=float,
+            default=300.0,
+            help='Segundos entre re-escaneos completos de respaldo (0 para desactivar)',
+        )
+
+    def handle(self, *args, **options):
+        monitored_folder = Path(settings.MONITORED_FOLDER)
+
+        if not monitored_folder.exists():
+            self.stdout.write(
+                self.style.ERROR(f'La carpeta de monitoreo no existe: {monitored_folder}')
+            )
+            return
+
+        self.ingestor = FolderIngestor(
+            monitored_folder=monitored_folder,
+            workers=options['workers'],
+            log=self.log,
+        )
+        if not self.ingestor.prepare():
+            return
+
+        watcher = create_watcher(
+            monitored_folder,
+            interval=options['interval'],
+            force_polling=options['polling'],
+            **scan_options(),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'👀 Vigilando {monitored_folder} (modo {watcher.name}). Ctrl+C para salir.')
+        )
+
+        rescan_every = options['rescan']
+        settle = options['settle']
+        gate = self.ingestor.gate
+
+        # Reanudar lo que quedó a medias e importar lo que ya estaba en la carpeta
+        self.ingestor.recover()
+        self.ingest(iter_pdfs(monitored_folder, **scan_options()))
+        last_rescan = time.monotonic()
+
+        try:
+            while True:
+                timeout = None
+                if rescan_every:
+                    timeout = max(rescan_every - (time.monotonic() - last_rescan), 0)
+                # Despertar también cuando toque revisar un archivo diferido (sin dormir por archivo)
+                recheck = gate.next_check() if gate else None
+                if recheck is not None:
+                    timeout = recheck if timeout is None else min(timeout, recheck)
+                pending = set(watcher.wait(timeout))
+
+                # Agrupar ráfagas de eventos (p. ej. un escáner soltando varias páginas)
+                while pending and settle:
+                    more = watcher.wait(settle)
+                    if not more:
+                        break
+                    pending.update(more)
+
+                # IN_CLOSE_WRITE / IN_MOVED_TO: el archivo ya se terminó de escribir
+                closed = watcher.take_closed()
+                if gate:
+                    gate.mark_closed(closed)
+                    pending.update(gate.due())
+
+                if getattr(watcher, 'overflowed', False) or (
+                        rescan_every and time.monotonic() - last_rescan >= rescan_every):
+                    watcher.overflowed = False
+                    pending.update(iter_pdfs(monitored_folder, **scan_options()))
+                    last_rescan = time.monotonic()
+
+                self.ingest(pending)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('🛑 Vigilancia detenida'))
+        finally:
+            watcher.close()
+
+    def ingest(self, paths):
+        """Importa los archivos que sigan en la carpeta reutilizando la conexión a la BD"""
+        paths = (p for p in paths if p.exists())
+        first_path = next(paths, None)
+        if first_path is None:
+            return
+
+        # Descartar conexiones caídas o vencidas (CONN_MAX_AGE) sin abrir una nueva por lote
+        close_old_connections()
+        stats = self.ingestor.ingest(chain([first_path], paths), IngestionStats())
+        if stats.processed or stats.failed:
+            self.stdout.write(f'⏱️  Lote: {stats.summary()}')
+
+    def log(self, level, message):
+        """Escribe un mensaje del importador con el estilo correspondiente"""
+        style = {
+            'success': self.style.SUCCESS,
+            'warning': self.style.WARNING,
+            'error': self.style.ERROR,
+        }.get(level, str)
+        self.stdout.write(style(message))
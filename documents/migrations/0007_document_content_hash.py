@@ -0,0 +1,23 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_remove_entity_address_remove_entity_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 del PDF, usado para detectar duplicados aunque cambie el nombre', max_length=64, null=True, unique=True, verbose_name='Hash de contenido'),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='original_filename',
+            field=models.CharField(blank=True, db_index=True, help_text='Nombre original del archivo antes de procesamiento', max_length=255, null=True, verbose_name='Nombre archivo original'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_document_content_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('folder', 'Carpeta de monitoreo'), ('upload', 'Subida manual')], default='folder', max_length=20, verbose_name='Tipo')),
+                ('status', models.CharField(choices=[('queued', 'En cola'), ('running', 'En proceso'), ('done', 'Completado'), ('failed', 'Con errores')], default='queued', max_length=20, verbose_name='Estado')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total de archivos')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Procesados')),
+                ('skipped', models.PositiveIntegerField(default=0, verbose_name='Omitidos')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Con error')),
+                ('bytes_processed', models.BigIntegerField(default=0, verbose_name='Bytes procesados')),
+                ('dispatched', models.BooleanField(default=False, help_text='Indica que ya se encolaron todos los lotes', verbose_name='Despachado')),
+                ('message', models.TextField(blank=True, null=True, verbose_name='Mensaje')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingestion_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Creado por')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Importación',
+                'verbose_name_plural': 'Trabajos de Importación',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._search_index import create_search_index, drop_search_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSearchIndex',
+            fields=[
+                ('document', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='documents.document')),
+                ('title', models.TextField()),
+                ('entity', models.TextField()),
+                ('notes', models.TextField()),
+                ('content', models.TextField()),
+                ('search', models.TextField(db_column='documents_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'documents_search',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='documents.document', verbose_name='Documento')),
+                ('text', models.TextField(blank=True, default='', verbose_name='Texto')),
+                ('source', models.CharField(choices=[('pdf', 'Capa de texto del PDF'), ('ocr', 'OCR')], default='pdf', max_length=10, verbose_name='Origen')),
+                ('page_count', models.PositiveIntegerField(default=0, verbose_name='Páginas')),
+                ('extracted_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de extracción')),
+            ],
+            options={
+                'verbose_name': 'Texto de Documento',
+                'verbose_name_plural': 'Textos de Documentos',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
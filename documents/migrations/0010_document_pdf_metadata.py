@@ -0,0 +1,43 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+from ._search_index import create_search_triggers, drop_search_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_document_text_search'),
+    ]
+
+    operations = [
+        # SQLite recrea documents_document al agregar columnas (ver _search_index)
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='document',
+            name='file_size_bytes',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Tamaño (bytes)'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='is_encrypted',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Cifrado'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Páginas'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='pdf_producer',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Programa o escáner que generó el PDF', max_length=255, verbose_name='Productor PDF'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='pdf_version',
+            field=models.CharField(blank=True, default='', editable=False, max_length=10, verbose_name='Versión PDF'),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_document_pdf_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSuggestion',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='suggestion', serialize=False, to='documents.document', verbose_name='Documento')),
+                ('category_confidence', models.FloatField(default=0, verbose_name='Confianza categoría')),
+                ('document_type_confidence', models.FloatField(default=0, verbose_name='Confianza tipo')),
+                ('entity_confidence', models.FloatField(default=0, verbose_name='Confianza entidad')),
+                ('suggested_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de sugerencia')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.category', verbose_name='Categoría sugerida')),
+                ('document_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.documenttype', verbose_name='Tipo sugerido')),
+                ('entity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.entity', verbose_name='Entidad sugerida')),
+            ],
+            options={
+                'verbose_name': 'Sugerencia de Clasificación',
+                'verbose_name_plural': 'Sugerencias de Clasificación',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_documentsuggestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentsuggestion',
+            name='document_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Fecha detectada'),
+        ),
+        migrations.AddField(
+            model_name='documentsuggestion',
+            name='document_date_confidence',
+            field=models.FloatField(default=0, verbose_name='Confianza fecha'),
+        ),
+        migrations.AddField(
+            model_name='documentsuggestion',
+            name='due_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Vencimiento detectado'),
+        ),
+        migrations.AddField(
+            model_name='documentsuggestion',
+            name='due_date_confidence',
+            field=models.FloatField(default=0, verbose_name='Confianza vencimiento'),
+        ),
+    ]
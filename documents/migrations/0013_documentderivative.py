@@ -0,0 +1,32 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_suggestion_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('optimized', 'Optimizado (linealizado, imágenes recomprimidas)')], max_length=20, verbose_name='Tipo')),
+                ('file', models.CharField(help_text='Ruta relativa a MEDIA_ROOT', max_length=500, verbose_name='Archivo')),
+                ('size', models.BigIntegerField(verbose_name='Tamaño (bytes)')),
+                ('original_size', models.BigIntegerField(verbose_name='Tamaño original (bytes)')),
+                ('details', models.JSONField(blank=True, default=dict, verbose_name='Detalles')),
+                ('created_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de creación')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='documents.document', verbose_name='Documento')),
+            ],
+            options={
+                'verbose_name': 'Derivado de Documento',
+                'verbose_name_plural': 'Derivados de Documentos',
+                'unique_together': {('document', 'kind')},
+            },
+        ),
+    ]
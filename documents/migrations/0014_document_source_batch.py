@@ -0,0 +1,29 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._search_index import create_search_triggers, drop_search_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_documentderivative'),
+    ]
+
+    operations = [
+        # SQLite recrea documents_document al agregar columnas (ver _search_index)
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='document',
+            name='source_batch',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='segments', to='documents.document', verbose_name='Lote de origen'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='source_pages',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Rango de páginas del lote de origen, p. ej. 1-3', max_length=20, verbose_name='Páginas del lote'),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.8 on 2026-10-18 08:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_document_source_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPageText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField(verbose_name='Página')),
+                ('text', models.TextField(blank=True, default='', verbose_name='Texto')),
+                ('source', models.CharField(choices=[('pdf', 'Capa de texto del PDF'), ('ocr', 'OCR')], default='ocr', max_length=10, verbose_name='Origen')),
+                ('extracted_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de extracción')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_texts', to='documents.document', verbose_name='Documento')),
+            ],
+            options={
+                'verbose_name': 'Texto de Página',
+                'verbose_name_plural': 'Textos de Páginas',
+                'ordering': ['document', 'page_number'],
+                'unique_together': {('document', 'page_number')},
+            },
+        ),
+    ]
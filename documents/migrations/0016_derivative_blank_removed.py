@@ -0,0 +1,18 @@
+# Generated by Django 5.0.8 on 2026-10-18 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_documentpagetext'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentderivative',
+            name='kind',
+            field=models.CharField(choices=[('optimized', 'Optimizado (linealizado, imágenes recomprimidas)'), ('blank_removed', 'Sin páginas en blanco')], max_length=20, verbose_name='Tipo'),
+        ),
+    ]
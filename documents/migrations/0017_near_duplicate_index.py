@@ -0,0 +1,42 @@
+# Generated by Django 5.0.8 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0016_derivative_blank_removed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSignature',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='documents.document', verbose_name='Documento')),
+                ('minhash', models.BinaryField(verbose_name='Firma MinHash')),
+                ('shingle_count', models.PositiveIntegerField(default=0, verbose_name='Trigramas')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de cálculo')),
+            ],
+            options={
+                'verbose_name': 'Firma de Documento',
+                'verbose_name_plural': 'Firmas de Documentos',
+            },
+        ),
+        migrations.CreateModel(
+            name='SignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField(verbose_name='Banda')),
+                ('bucket', models.BigIntegerField(verbose_name='Cubeta')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_bands', to='documents.document', verbose_name='Documento')),
+            ],
+            options={
+                'verbose_name': 'Banda de Firma',
+                'verbose_name_plural': 'Bandas de Firmas',
+                'indexes': [models.Index(fields=['bucket', 'band'], name='documents_s_bucket_6a2b5d_idx')],
+                'unique_together': {('document', 'band')},
+            },
+        ),
+    ]
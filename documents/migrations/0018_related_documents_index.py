@@ -0,0 +1,44 @@
+# Generated by Django 5.0.8 on 2026-10-18 09:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0017_near_duplicate_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Término')),
+                ('weight', models.FloatField(verbose_name='Peso')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='documents.document', verbose_name='Documento')),
+            ],
+            options={
+                'verbose_name': 'Término de Documento',
+                'verbose_name_plural': 'Términos de Documentos',
+                'indexes': [models.Index(fields=['term'], name='documents_d_term_c4eae4_idx')],
+                'unique_together': {('document', 'term')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Similitud')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_documents', to='documents.document', verbose_name='Documento')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='documents.document', verbose_name='Documento relacionado')),
+            ],
+            options={
+                'verbose_name': 'Documento Relacionado',
+                'verbose_name_plural': 'Documentos Relacionados',
+                'ordering': ['document', '-score'],
+                'unique_together': {('document', 'related')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.8 on 2026-10-18 09:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0018_related_documents_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineQueueEntry',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pipeline_entry', serialize=False, to='documents.document', verbose_name='Documento')),
+                ('queued_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de encolado')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='Reclamado el')),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=32, verbose_name='Reclamado por')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+            ],
+            options={
+                'verbose_name': 'Documento en Cola del Pipeline',
+                'verbose_name_plural': 'Documentos en Cola del Pipeline',
+                'ordering': ['queued_at'],
+                'indexes': [models.Index(fields=['claimed_by', 'queued_at'], name='documents_p_claimed_c45146_idx')],
+            },
+        ),
+    ]
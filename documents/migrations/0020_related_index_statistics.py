@@ -0,0 +1,36 @@
+# Generated by Django 5.0.8 on 2026-10-18 09:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0019_pipeline_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedIndexEntry',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='related_index', serialize=False, to='documents.document', verbose_name='Documento')),
+                ('stamp', models.DateTimeField(verbose_name='Versión indexada')),
+            ],
+            options={
+                'verbose_name': 'Documento Indexado',
+                'verbose_name_plural': 'Documentos Indexados',
+            },
+        ),
+        migrations.CreateModel(
+            name='TermDocumentFrequency',
+            fields=[
+                ('term', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Término')),
+                ('documents', models.PositiveIntegerField(default=0, verbose_name='Documentos')),
+            ],
+            options={
+                'verbose_name': 'Frecuencia de Término',
+                'verbose_name_plural': 'Frecuencias de Términos',
+            },
+        ),
+    ]
@@ -0,0 +1,100 @@
+"""SQL del índice FTS5 ``documents_search`` compartido por las migraciones.
+
+El cargador de migraciones ignora los módulos que empiezan con ``_``.
+En SQLite, agregar o modificar columnas de ``documents_document`` recrea
+la tabla y los triggers del índice dejan de compilar (``no such table``);
+las migraciones que lo hagan deben envolver sus operaciones con
+``drop_search_triggers`` / ``create_search_triggers``.
+"""
+
+# Fila del índice para los documentos que cumplan la condición {where}
+INDEX_ROWS = """
+    INSERT INTO documents_search(rowid, title, entity, notes, content)
+    SELECT d.id, d.title, coalesce(e.name, ''), coalesce(d.notes, ''), coalesce(t.text, '')
+    FROM documents_document d
+    LEFT JOIN documents_entity e ON e.id = d.entity_id
+    LEFT JOIN documents_documenttext t ON t.document_id = d.id
+    WHERE {where};
+"""
+
+TABLE_SQL = [
+    """
+    CREATE VIRTUAL TABLE documents_search USING fts5(
+        title, entity, notes, content,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '2 3'
+    )
+    """,
+    # Título y entidad pesan más que las notas y el contenido
+    "INSERT INTO documents_search(documents_search, rank) VALUES('rank', 'bm25(10.0, 5.0, 2.0, 1.0)')",
+]
+
+TRIGGER_SQL = [
+    "CREATE TRIGGER documents_search_doc_insert AFTER INSERT ON documents_document BEGIN"
+    + INDEX_ROWS.format(where='d.id = NEW.id') + "END",
+    """
+    CREATE TRIGGER documents_search_doc_update AFTER UPDATE OF title, notes, entity_id ON documents_document
+    WHEN OLD.title IS NOT NEW.title OR OLD.notes IS NOT NEW.notes OR OLD.entity_id IS NOT NEW.entity_id
+    BEGIN
+        DELETE FROM documents_search WHERE rowid = NEW.id;
+    """ + INDEX_ROWS.format(where='d.id = NEW.id') + "END",
+    """
+    CREATE TRIGGER documents_search_doc_delete AFTER DELETE ON documents_document BEGIN
+        DELETE FROM documents_search WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER documents_search_text_insert AFTER INSERT ON documents_documenttext BEGIN
+        DELETE FROM documents_search WHERE rowid = NEW.document_id;
+    """ + INDEX_ROWS.format(where='d.id = NEW.document_id') + "END",
+    """
+    CREATE TRIGGER documents_search_text_update AFTER UPDATE OF text ON documents_documenttext
+    WHEN OLD.text IS NOT NEW.text
+    BEGIN
+        DELETE FROM documents_search WHERE rowid = NEW.document_id;
+    """ + INDEX_ROWS.format(where='d.id = NEW.document_id') + "END",
+    """
+    CREATE TRIGGER documents_search_text_delete AFTER DELETE ON documents_documenttext BEGIN
+        DELETE FROM documents_search WHERE rowid = OLD.document_id;
+    """ + INDEX_ROWS.format(where='d.id = OLD.document_id') + "END",
+    """
+    CREATE TRIGGER documents_search_entity_update AFTER UPDATE OF name ON documents_entity
+    WHEN OLD.name IS NOT NEW.name
+    BEGIN
+        DELETE FROM documents_search WHERE rowid IN (SELECT id FROM documents_document WHERE entity_id = NEW.id);
+    """ + INDEX_ROWS.format(where='d.entity_id = NEW.id') + "END",
+]
+
+DROP_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS documents_search_doc_insert",
+    "DROP TRIGGER IF EXISTS documents_search_doc_update",
+    "DROP TRIGGER IF EXISTS documents_search_doc_delete",
+    "DROP TRIGGER IF EXISTS documents_search_text_insert",
+    "DROP TRIGGER IF EXISTS documents_search_text_update",
+    "DROP TRIGGER IF EXISTS documents_search_text_delete",
+    "DROP TRIGGER IF EXISTS documents_search_entity_update",
+]
+
+
+def _execute(schema_editor, statements):
+    """El índice FTS5 solo existe en SQLite; otros motores usan la búsqueda por icontains"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _execute(schema_editor, TABLE_SQL + TRIGGER_SQL + [INDEX_ROWS.format(where='1')])
+
+
+def drop_search_index(apps, schema_editor):
+    _execute(schema_editor, DROP_TRIGGERS_SQL + ["DROP TABLE IF EXISTS documents_search"])
+
+
+def create_search_triggers(apps, schema_editor):
+    _execute(schema_editor, TRIGGER_SQL)
+
+
+def drop_search_triggers(apps, schema_editor):
+    _execute(schema_editor, DROP_TRIGGERS_SQL)
@@ -7,6 +7,9 @@ User = get_user_model()
 
 class Category(models.Model):
     """Categorías de documentos"""
+    
+    # Categoría que reciben los PDFs importados desde la carpeta de monitoreo
+    SCANNED_NAME = 'Documentos Escaneados'
     name = models.CharField(
         max_length=100, 
         verbose_name='Nombre',
@@ -374,15 +377,71 @@ class Document(models.Model):
     original_filename = models.CharField(
         max_length=255,
         blank=True, null=True,
+        db_index=True,
         verbose_name='Nombre archivo original',
         help_text='Nombre original del archivo antes de procesamiento'
     )
+    content_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        blank=True, null=True,
+        editable=False,
+        verbose_name='Hash de contenido',
+        help_text='SHA-256 del PDF, usado para detectar duplicados aunque cambie el nombre'
+    )
+    # Metadatos del PDF, extraídos una sola vez al importar o subir el archivo
+    file_size_bytes = models.BigIntegerField(
+        null=True, blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Tamaño (bytes)'
+    )
+    page_count = models.PositiveIntegerField(
+        null=True, blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name='Páginas'
+    )
+    pdf_version = models.CharField(
+        max_length=10,
+        blank=True, default='',
+        editable=False,
+        verbose_name='Versión PDF'
+    )
+    pdf_producer = models.CharField(
+        max_length=255,
+        blank=True, default='',
+        editable=False,
+        verbose_name='Productor PDF',
+        help_text='Programa o escáner que generó el PDF'
+    )
+    is_encrypted = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Cifrado'
+    )
     imported_from_folder = models.BooleanField(
         default=False,
         verbose_name='Importado desde carpeta',
         help_text='Indica si fue importado automáticamente desde la carpeta de monitoreo'
     )
-    
+    # Documentos creados al dividir un lote escaneado (ver splitting.py)
+    source_batch = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        editable=False,
+        related_name='segments',
+        verbose_name='Lote de origen'
+    )
+    source_pages = models.CharField(
+        max_length=20,
+        blank=True, default='',
+        editable=False,
+        verbose_name='Páginas del lote',
+        help_text='Rango de páginas del lote de origen, p. ej. 1-3'
+    )
+
     # Fechas de sistema
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -410,13 +469,49 @@ class Document(models.Model):
         """Retorna solo el nombre del archivo"""
         return os.path.basename(self.file.name) if self.file else ''
     
+    # Campos que llena ``apply_pdf_metadata`` (ver ``pdf_tools.read_metadata``)
+    PDF_METADATA_FIELDS = ['file_size_bytes', 'page_count', 'pdf_version', 'pdf_producer', 'is_encrypted']
+
     @property
     def file_size(self):
-        """Retorna el tamaño del archivo en MB"""
-        try:
-            return round(self.file.size / 1024 / 1024, 2) if self.file else 0
-        except:
+        """Retorna el tamaño del archivo en MB (guardado al importar; no consulta el disco)"""
+        if not self.file_size_bytes:
             return 0
+        return round(self.file_size_bytes / 1024 / 1024, 2)
+
+    def served_file_path(self, original=False):
+        """Ruta del archivo a entregar: el mejor derivado disponible o el original"""
+        if not original:
+            return self.derivative_path(DocumentDerivative.SERVE_ORDER) or self.file.path
+        return self.file.path
+
+    def derivative_path(self, kinds):
+        """Ruta del primer derivado de ``kinds`` (en ese orden) cuyo archivo existe, o None.
+
+        Usa ``derivatives.all()`` para aprovechar un ``prefetch_related``.
+        """
+        derivatives = {d.kind: d for d in self.derivatives.all() if d.kind in kinds}
+        for kind in kinds:
+            if kind in derivatives and os.path.exists(derivatives[kind].path):
+                return derivatives[kind].path
+        return None
+
+    def derivative_source_path(self, kind):
+        """Archivo a partir del cual se genera el derivado ``kind``.
+
+        Los derivados se encadenan en el orden inverso de ``SERVE_ORDER``: el
+        optimizado se genera sobre el PDF sin páginas en blanco, si existe.
+        """
+        order = DocumentDerivative.SERVE_ORDER
+        return self.derivative_path(order[order.index(kind) + 1:]) or self.file.path
+
+    def apply_pdf_metadata(self, metadata):
+        """Asigna (sin guardar) el resultado de ``pdf_tools.read_metadata``"""
+        self.file_size_bytes = metadata['size']
+        self.page_count = metadata['page_count']
+        self.pdf_version = metadata['pdf_version']
+        self.pdf_producer = metadata['pdf_producer']
+        self.is_encrypted = metadata['is_encrypted']
     
     def get_structured_name(self):
         """Genera un nombre estructurado usando códigos cortos: Entidad_Categoría_TipoDocumento_Fecha"""
@@ -525,3 +620,436 @@ class DocumentHistory(models.Model):
     
     def __str__(self):
         return f"{self.document.title} - {self.new_status} ({self.created_at})"
+
+class IngestionJob(models.Model):
+    """Progreso de una importación asíncrona (consultado por la interfaz)"""
+    
+    KIND_CHOICES = [
+        ('folder', 'Carpeta de monitoreo'),
+        ('upload', 'Subida manual'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'En cola'),
+        ('running', 'En proceso'),
+        ('done', 'Completado'),
+        ('failed', 'Con errores'),
+    ]
+    
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        default='folder',
+        verbose_name='Tipo'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued',
+        verbose_name='Estado'
+    )
+    total = models.PositiveIntegerField(default=0, verbose_name='Total de archivos')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Procesados')
+    skipped = models.PositiveIntegerField(default=0, verbose_name='Omitidos')
+    failed = models.PositiveIntegerField(default=0, verbose_name='Con error')
+    bytes_processed = models.BigIntegerField(default=0, verbose_name='Bytes procesados')
+    dispatched = models.BooleanField(
+        default=False,
+        verbose_name='Despachado',
+        help_text='Indica que ya se encolaron todos los lotes'
+    )
+    message = models.TextField(blank=True, null=True, verbose_name='Mensaje')
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='ingestion_jobs',
+        verbose_name='Creado por'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')
+    
+    class Meta:
+        verbose_name = 'Trabajo de Importación'
+        verbose_name_plural = 'Trabajos de Importación'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+    
+    @property
+    def completed(self):
+        return self.processed + self.skipped + self.failed
+    
+    @property
+    def progress(self):
+        """Porcentaje completado (0-100)"""
+        if not self.total:
+            return 100 if self.dispatched else 0
+        return min(round(self.completed * 100 / self.total), 100)
+    
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'kind': self.kind,
+            'status': self.status,
+            'status_display': self.get_status_display(),
+            'total': self.total,
+            'processed': self.processed,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'progress': self.progress,
+            'message': self.message or '',
+            'finished': self.status in ('done', 'failed'),
+        }
+
+class PipelineQueueEntry(models.Model):
+    """Documento importado a la espera de las etapas posteriores (ver ``tasks.dispatch_post_ingest``).
+
+    La importación solo inserta la fila; ``process_pipeline`` la reclama,
+    ejecuta las etapas en su propio proceso y la borra al terminar.
+    """
+
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pipeline_entry',
+        verbose_name='Documento'
+    )
+    queued_at = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de encolado')
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='Reclamado el')
+    claimed_by = models.CharField(max_length=32, blank=True, default='', verbose_name='Reclamado por')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')
+
+    class Meta:
+        verbose_name = 'Documento en Cola del Pipeline'
+        verbose_name_plural = 'Documentos en Cola del Pipeline'
+        ordering = ['queued_at']
+        indexes = [models.Index(fields=['claimed_by', 'queued_at'])]
+
+    def __str__(self):
+        return f"Pipeline de {self.document_id}"
+
+class DocumentText(models.Model):
+    """Texto extraído del PDF (alimenta el índice de búsqueda de texto completo)"""
+    
+    SOURCE_CHOICES = [
+        ('pdf', 'Capa de texto del PDF'),
+        ('ocr', 'OCR'),
+    ]
+    
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='text',
+        verbose_name='Documento'
+    )
+    text = models.TextField(blank=True, default='', verbose_name='Texto')
+    source = models.CharField(
+        max_length=10,
+        choices=SOURCE_CHOICES,
+        default='pdf',
+        verbose_name='Origen'
+    )
+    page_count = models.PositiveIntegerField(default=0, verbose_name='Páginas')
+    extracted_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de extracción')
+    
+    class Meta:
+        verbose_name = 'Texto de Documento'
+        verbose_name_plural = 'Textos de Documentos'
+    
+    def __str__(self):
+        return f"Texto de {self.document_id} ({self.get_source_display()})"
+
+class DocumentPageText(models.Model):
+    """Texto de una página (capa de texto u OCR); el OCR se reanuda página por página"""
+
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='page_texts',
+        verbose_name='Documento'
+    )
+    page_number = models.PositiveIntegerField(verbose_name='Página')
+    text = models.TextField(blank=True, default='', verbose_name='Texto')
+    source = models.CharField(
+        max_length=10,
+        choices=DocumentText.SOURCE_CHOICES,
+        default='ocr',
+        verbose_name='Origen'
+    )
+    extracted_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de extracción')
+
+    class Meta:
+        verbose_name = 'Texto de Página'
+        verbose_name_plural = 'Textos de Páginas'
+        ordering = ['document', 'page_number']
+        unique_together = [['document', 'page_number']]
+
+    def __str__(self):
+        return f"Página {self.page_number} de {self.document_id} ({self.get_source_display()})"
+
+class DocumentSearchIndex(models.Model):
+    """Tabla virtual FTS5 ``documents_search`` (solo SQLite, la mantienen triggers).
+    
+    El ``rowid`` de cada fila es el id del documento. La columna oculta con
+    el nombre de la tabla admite ``MATCH`` y ``rank`` ordena por relevancia
+    (bm25 con más peso para título y entidad que para el contenido).
+    """
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index'
+    )
+    title = models.TextField()
+    entity = models.TextField()
+    notes = models.TextField()
+    content = models.TextField()
+    search = models.TextField(db_column='documents_search')
+    rank = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'documents_search'
+
+class DocumentDerivative(models.Model):
+    """Versión derivada de un PDF (optimizada, etc.); el original nunca se modifica"""
+    
+    KIND_CHOICES = [
+        ('optimized', 'Optimizado (linealizado, imágenes recomprimidas)'),
+        ('blank_removed', 'Sin páginas en blanco'),
+    ]
+    # Derivados que ``serve_document`` entrega en lugar del original, en orden de preferencia
+    SERVE_ORDER = ['optimized', 'blank_removed']
+    
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='derivatives',
+        verbose_name='Documento'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Tipo')
+    file = models.CharField(
+        max_length=500,
+        verbose_name='Archivo',
+        help_text='Ruta relativa a MEDIA_ROOT'
+    )
+    size = models.BigIntegerField(verbose_name='Tamaño (bytes)')
+    original_size = models.BigIntegerField(verbose_name='Tamaño original (bytes)')
+    details = models.JSONField(default=dict, blank=True, verbose_name='Detalles')
+    created_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de creación')
+    
+    class Meta:
+        verbose_name = 'Derivado de Documento'
+        verbose_name_plural = 'Derivados de Documentos'
+        unique_together = [['document', 'kind']]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} de {self.document_id}"
+    
+    @property
+    def path(self):
+        from django.conf import settings
+        
+        return os.path.join(settings.MEDIA_ROOT, self.file)
+    
+    @property
+    def bytes_saved(self):
+        return self.original_size - self.size
+    
+    @property
+    def saved_percent(self):
+        return round(self.bytes_saved * 100 / self.original_size) if self.original_size else 0
+    
+    @property
+    def size_mb(self):
+        return round(self.size / 1024 / 1024, 2)
+
+class DocumentSignature(models.Model):
+    """Firma MinHash del texto del documento para detectar casi duplicados (ver ``near_duplicates``)"""
+
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Documento'
+    )
+    minhash = models.BinaryField(verbose_name='Firma MinHash')
+    shingle_count = models.PositiveIntegerField(default=0, verbose_name='Trigramas')
+    computed_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de cálculo')
+
+    class Meta:
+        verbose_name = 'Firma de Documento'
+        verbose_name_plural = 'Firmas de Documentos'
+
+    def __str__(self):
+        return f"Firma de {self.document_id}"
+
+class SignatureBand(models.Model):
+    """Cubeta LSH de una banda de la firma: los documentos que comparten una cubeta son candidatos"""
+
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='signature_bands',
+        verbose_name='Documento'
+    )
+    band = models.PositiveSmallIntegerField(verbose_name='Banda')
+    bucket = models.BigIntegerField(verbose_name='Cubeta')
+
+    class Meta:
+        verbose_name = 'Banda de Firma'
+        verbose_name_plural = 'Bandas de Firmas'
+        unique_together = [['document', 'band']]
+        indexes = [models.Index(fields=['bucket', 'band'])]
+
+    def __str__(self):
+        return f"Banda {self.band} de {self.document_id}"
+
+class DocumentTerm(models.Model):
+    """Término con peso TF-IDF del vector disperso de un documento (ver ``related``)"""
+
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='terms',
+        verbose_name='Documento'
+    )
+    term = models.CharField(max_length=64, verbose_name='Término')
+    weight = models.FloatField(verbose_name='Peso')
+
+    class Meta:
+        verbose_name = 'Término de Documento'
+        verbose_name_plural = 'Términos de Documentos'
+        unique_together = [['document', 'term']]
+        indexes = [models.Index(fields=['term'])]
+
+    def __str__(self):
+        return f"{self.term} ({self.weight:.3f}) en {self.document_id}"
+
+class TermDocumentFrequency(models.Model):
+    """Cuántos documentos indexados contienen un término: el IDF del índice de relacionados (ver ``related``)"""
+
+    term = models.CharField(max_length=64, primary_key=True, verbose_name='Término')
+    documents = models.PositiveIntegerField(default=0, verbose_name='Documentos')
+
+    class Meta:
+        verbose_name = 'Frecuencia de Término'
+        verbose_name_plural = 'Frecuencias de Términos'
+
+    def __str__(self):
+        return f"{self.term} ({self.documents})"
+
+class RelatedIndexEntry(models.Model):
+    """Documento incluido en el índice de relacionados y la versión con la que se indexó"""
+
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='related_index',
+        verbose_name='Documento'
+    )
+    # Mayor fecha entre la actualización del documento y la extracción de su texto
+    stamp = models.DateTimeField(verbose_name='Versión indexada')
+
+    class Meta:
+        verbose_name = 'Documento Indexado'
+        verbose_name_plural = 'Documentos Indexados'
+
+    def __str__(self):
+        return f"Índice de {self.document_id}"
+
+class RelatedDocument(models.Model):
+    """Vecino precalculado de un documento por similitud coseno de sus vectores TF-IDF"""
+
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='related_documents',
+        verbose_name='Documento'
+    )
+    related = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Documento relacionado'
+    )
+    score = models.FloatField(verbose_name='Similitud')
+
+    class Meta:
+        verbose_name = 'Documento Relacionado'
+        verbose_name_plural = 'Documentos Relacionados'
+        unique_together = [['document', 'related']]
+        ordering = ['document', '-score']
+
+    def __str__(self):
+        return f"{self.document_id} ≈ {self.related_id} ({self.score:.2f})"
+
+class DocumentSuggestion(models.Model):
+    """Categoría, tipo y entidad sugeridos por el clasificador local (ver ``classifier``)
+    y fechas detectadas en el texto del PDF (ver ``dates``)"""
+    
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='suggestion',
+        verbose_name='Documento'
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+',
+        verbose_name='Categoría sugerida'
+    )
+    category_confidence = models.FloatField(default=0, verbose_name='Confianza categoría')
+    document_type = models.ForeignKey(
+        DocumentType,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+',
+        verbose_name='Tipo sugerido'
+    )
+    document_type_confidence = models.FloatField(default=0, verbose_name='Confianza tipo')
+    entity = models.ForeignKey(
+        Entity,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='+',
+        verbose_name='Entidad sugerida'
+    )
+    entity_confidence = models.FloatField(default=0, verbose_name='Confianza entidad')
+    # Fechas leídas del texto del PDF (ver ``dates``)
+    document_date = models.DateField(null=True, blank=True, verbose_name='Fecha detectada')
+    document_date_confidence = models.FloatField(default=0, verbose_name='Confianza fecha')
+    due_date = models.DateField(null=True, blank=True, verbose_name='Vencimiento detectado')
+    due_date_confidence = models.FloatField(default=0, verbose_name='Confianza vencimiento')
+    suggested_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de sugerencia')
+    
+    class Meta:
+        verbose_name = 'Sugerencia de Clasificación'
+        verbose_name_plural = 'Sugerencias de Clasificación'
+    
+    def __str__(self):
+        return f"Sugerencia para {self.document_id}"
+    
+    def as_dict(self, min_confidence=0):
+        """Sugerencias con confianza suficiente: ``{campo: {'id', 'name', 'confidence'}}``"""
+        data = {}
+        for field in ('category', 'document_type', 'entity'):
+            value_id = getattr(self, f'{field}_id')
+            confidence = getattr(self, f'{field}_confidence')
+            if value_id and confidence >= min_confidence:
+                data[field] = {
+                    'id': value_id,
+                    'name': getattr(self, field).name,
+                    'confidence': round(confidence, 3),
+                }
+        return data
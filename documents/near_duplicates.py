@@ -0,0 +1,174 @@
+"""Detección de casi duplicados con firmas MinHash e índice LSH.
+
+El hash de contenido solo detecta copias idénticas byte por byte; la misma
+factura escaneada dos veces nunca lo es. Aquí cada documento recibe una
+firma MinHash de ``NUM_PERM`` valores calculada sobre los trigramas de
+palabras de su texto (capa del PDF u OCR): la fracción de valores iguales
+entre dos firmas estima la similitud de Jaccard de sus textos.
+
+Para no comparar contra todo el archivo, la firma se divide en ``BANDS``
+bandas de ``ROWS`` valores y cada banda se guarda como una cubeta indexada
+(``SignatureBand``). Solo los documentos que comparten alguna cubeta son
+candidatos, y a esos se les verifica la similitud con la firma completa:
+con 20 bandas de 6 filas, un par con similitud 0.8 es candidato con
+probabilidad 0.998 y uno con 0.5, con 0.27. Se usan trigramas de palabras
+y un umbral de 0.8 para tolerar los errores de OCR de un re-escaneo (una
+palabra mal leída cambia tres trigramas).
+
+``signature`` no importa modelos de Django, así que puede ejecutarse en un
+pool de procesos (ver ``workers.minhash_signature``).
+"""
+import hashlib
+import random
+import re
+import zlib
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+# Con menos trigramas el texto no alcanza para comparar (p. ej. un escaneo sin OCR)
+MIN_SHINGLES = 10
+MAX_TEXT_CHARS = 20_000
+
+_PRIME = (1 << 61) - 1
+_MASK32 = 0xFFFFFFFF
+# Semilla fija: las firmas guardadas deben seguir siendo comparables entre corridas
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def threshold():
+    return getattr(settings, 'NEAR_DUPLICATE_THRESHOLD', 0.8)
+
+
+def shingles(text):
+    """Trigramas de palabras (en minúsculas) del texto, como enteros de 32 bits"""
+    words = _WORD_RE.findall((text or '')[:MAX_TEXT_CHARS].lower())
+    return {
+        zlib.crc32(' '.join(words[i:i + SHINGLE_WORDS]).encode())
+        for i in range(max(len(words) - SHINGLE_WORDS + 1, 0))
+    }
+
+
+def signature(text):
+    """Firma MinHash del texto: ``(array de NUM_PERM enteros, trigramas)``, o ``(None, trigramas)``
+    si el texto es demasiado corto para comparar"""
+    values = shingles(text)
+    if len(values) < MIN_SHINGLES:
+        return None, len(values)
+    return array('I', (
+        min((a * x + b) % _PRIME for x in values) & _MASK32
+        for a, b in _PERMUTATIONS
+    )), len(values)
+
+
+def band_buckets(minhash):
+    """Cubeta de cada banda: ``[(banda, cubeta)]`` con cubetas de 63 bits (caben en un BIGINT)"""
+    buckets = []
+    for band in range(BANDS):
+        rows = minhash[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(array('I', rows).tobytes(), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'big') >> 1))
+    return buckets
+
+
+def similarity(first, second):
+    """Similitud de Jaccard estimada: fracción de valores iguales entre dos firmas"""
+    return sum(a == b for a, b in zip(first, second)) / NUM_PERM
+
+
+def _unpack(data):
+    minhash = array('I')
+    minhash.frombytes(bytes(data))
+    return minhash
+
+
+def save_signatures(results):
+    """Guarda ``[(document_id, firma o None, trigramas)]`` y sus cubetas LSH.
+
+    Un documento sin firma (texto insuficiente) sale del índice. Retorna
+    cuántas firmas se guardaron.
+    """
+    from django.db import transaction
+
+    from .models import DocumentSignature, SignatureBand
+
+    results = list(results)
+    signed = [(document_id, minhash, count) for document_id, minhash, count in results if minhash is not None]
+    with transaction.atomic():
+        SignatureBand.objects.filter(document_id__in=[r[0] for r in results]).delete()
+        DocumentSignature.objects.filter(
+            document_id__in=[document_id for document_id, minhash, _ in results if minhash is None]
+        ).delete()
+        DocumentSignature.objects.bulk_create(
+            [
+                DocumentSignature(document_id=document_id, minhash=minhash.tobytes(), shingle_count=count)
+                for document_id, minhash, count in signed
+            ],
+            update_conflicts=True,
+            unique_fields=['document'],
+            update_fields=['minhash', 'shingle_count', 'computed_at'],
+        )
+        SignatureBand.objects.bulk_create([
+            SignatureBand(document_id=document_id, band=band, bucket=bucket)
+            for document_id, minhash, _ in signed
+            for band, bucket in band_buckets(minhash)
+        ])
+    return len(signed)
+
+
+def near_duplicates(document_ids, candidates=None, min_similarity=None):
+    """Casi duplicados de cada documento: ``{id: [(otro id, similitud)]}`` de mayor a menor.
+
+    ``candidates`` (un queryset de ``Document``) restringe con quiénes se
+    compara. Una consulta por el índice de cubetas y otra por las firmas,
+    sin importar el tamaño del archivo.
+    """
+    from .models import DocumentSignature, SignatureBand
+
+    document_ids = list(document_ids)
+    min_similarity = threshold() if min_similarity is None else min_similarity
+    own = defaultdict(set)
+    for document_id, band, bucket in SignatureBand.objects.filter(
+        document_id__in=document_ids
+    ).values_list('document_id', 'band', 'bucket'):
+        own[(band, bucket)].add(document_id)
+    if not own:
+        return {}
+
+    matches = SignatureBand.objects.filter(bucket__in={bucket for _, bucket in own})
+    if candidates is not None:
+        matches = matches.filter(document__in=candidates)
+    pairs = defaultdict(set)
+    for other_id, band, bucket in matches.values_list('document_id', 'band', 'bucket'):
+        for document_id in own.get((band, bucket), ()):
+            if other_id != document_id:
+                pairs[document_id].add(other_id)
+
+    involved = set(pairs).union(*pairs.values()) if pairs else set()
+    rows = DocumentSignature.objects.filter(document_id__in=involved).values_list('document_id', 'minhash')
+    signatures = {document_id: _unpack(data) for document_id, data in rows}
+    found = {}
+    for document_id, others in pairs.items():
+        scored = [
+            (other_id, round(similarity(signatures[document_id], signatures[other_id]), 3))
+            for other_id in others if document_id in signatures and other_id in signatures
+        ]
+        scored = sorted((item for item in scored if item[1] >= min_similarity), key=lambda item: -item[1])
+        if scored:
+            found[document_id] = scored
+    return found
+
+
+def reviewed_documents():
+    """Documentos ya revisados (con los que se comparan los pendientes)"""
+    from .models import Document
+
+    return Document.objects.exclude(status__in=['pending', 'scanned'])
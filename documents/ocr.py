@@ -0,0 +1,172 @@
+"""OCR local de las páginas escaneadas (solo imagen) con tesseract.
+
+Las páginas que ya tienen capa de texto no pasan por el OCR: se guarda su
+texto tal cual. El texto de cada página queda en ``DocumentPageText`` en
+cuanto se obtiene, así que una corrida interrumpida continúa donde quedó;
+cuando todas las páginas de un documento tienen texto se unen en
+``DocumentText`` (origen 'ocr'), que alimenta la búsqueda, el clasificador
+y la detección de fechas.
+
+tesseract se ejecuta como programa externo con un solo hilo
+(``OMP_THREAD_LIMIT=1``), desde un pool acotado de procesos con prioridad
+reducida y a un ritmo máximo de páginas por minuto, para no quitarle CPU
+al servidor web de la misma máquina. ``iter_ocr_pages`` no importa modelos
+de Django (ver ``workers.ocr_pages``).
+"""
+import io
+import os
+import shutil
+import subprocess
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .pdf_tools import normalize_text, open_pdf, page_text
+
+
+class OcrUnavailable(RuntimeError):
+    """No se encontró el programa de OCR"""
+
+
+def ocr_settings():
+    return {
+        'command': getattr(settings, 'OCR_TESSERACT_CMD', 'tesseract'),
+        'language': getattr(settings, 'OCR_LANGUAGE', 'spa+eng'),
+        'dpi': getattr(settings, 'OCR_DPI', 300),
+        'min_chars': getattr(settings, 'OCR_MIN_PAGE_CHARS', 20),
+        'timeout': getattr(settings, 'OCR_PAGE_TIMEOUT', 120),
+    }
+
+
+def ocr_available(command=None):
+    return shutil.which(command or ocr_settings()['command']) is not None
+
+
+def run_tesseract(image, command='tesseract', language='spa+eng', timeout=120):
+    """Texto reconocido en una imagen PIL (se pasa a tesseract por stdin, sin archivos temporales)"""
+    executable = shutil.which(command)
+    if not executable:
+        raise OcrUnavailable(f'No se encontró el programa de OCR: {command}')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    result = subprocess.run(
+        [executable, 'stdin', 'stdout', '-l', language],
+        input=buffer.getvalue(),
+        capture_output=True,
+        timeout=timeout,
+        env={**os.environ, 'OMP_THREAD_LIMIT': '1'},
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.decode('utf-8', errors='replace').strip()[-500:])
+    return result.stdout.decode('utf-8', errors='replace')
+
+
+def iter_ocr_pages(path, pages, command='tesseract', language='spa+eng', dpi=300, min_chars=20, timeout=120):
+    """Texto de las páginas ``pages`` (índices desde 0): ``(página desde 1, texto, origen)``.
+
+    Solo hay una página renderizada en memoria a la vez, y el candado de
+    PDFium se suelta mientras corre tesseract.
+    """
+    for index in pages:
+        image = None
+        with open_pdf(path) as pdf:
+            page = pdf[index]
+            try:
+                text = page_text(page)
+                if len(text.strip()) < min_chars:
+                    image = page.render(scale=dpi / 72, grayscale=True).to_pil()
+            finally:
+                page.close()
+        if image is None:
+            yield index + 1, normalize_text(text), 'pdf'
+        else:
+            yield index + 1, normalize_text(run_tesseract(image, command, language, timeout)), 'ocr'
+
+
+class RateLimiter:
+    """Espacia el trabajo a un máximo de ``per_minute`` unidades por minuto (0 = sin límite)"""
+
+    def __init__(self, per_minute):
+        self.interval = 60 / per_minute if per_minute else 0
+        self.next_at = time.monotonic()
+
+    def wait(self, units=1):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + units * self.interval
+
+
+def ocr_candidates(queryset=None):
+    """Documentos cuya capa de texto no alcanza ``OCR_MIN_PAGE_CHARS`` por página y aún sin OCR"""
+    from django.db.models import F, Q
+    from django.db.models.functions import Length
+
+    from .models import Document
+
+    queryset = Document.objects.all() if queryset is None else queryset
+    return queryset.exclude(file='').filter(is_encrypted=False, page_count__gt=0).annotate(
+        text_length=Length('text__text')
+    ).filter(
+        Q(text__isnull=True) |
+        Q(text__source='pdf', text_length__lt=F('page_count') * ocr_settings()['min_chars'])
+    )
+
+
+def remaining_pages(documents):
+    """``[(documento, [índices de página aún sin texto guardado])]`` con una sola consulta"""
+    from .models import DocumentPageText
+
+    done = defaultdict(set)
+    rows = DocumentPageText.objects.filter(document__in=documents).values_list('document_id', 'page_number')
+    for document_id, page_number in rows:
+        done[document_id].add(page_number)
+    return [
+        (document, [index for index in range(document.page_count or 0) if index + 1 not in done[document.id]])
+        for document in documents
+    ]
+
+
+def save_page_texts(document_id, results):
+    """Guarda ``[(página, texto, origen)]`` de un documento con un INSERT masivo"""
+    from .models import DocumentPageText
+
+    return DocumentPageText.objects.bulk_create(
+        [
+            DocumentPageText(document_id=document_id, page_number=number, text=text, source=source)
+            for number, text, source in results
+        ],
+        update_conflicts=True,
+        unique_fields=['document', 'page_number'],
+        update_fields=['text', 'source', 'extracted_at'],
+    )
+
+
+def finalize(document_ids):
+    """Une el texto de las páginas de los documentos que ya tienen todas en ``DocumentText``.
+
+    Retorna los ids de los documentos completados.
+    """
+    from .models import Document, DocumentPageText
+    from .search import MAX_TEXT_CHARS, save_texts
+
+    page_counts = dict(Document.objects.filter(id__in=document_ids).values_list('id', 'page_count'))
+    pages = defaultdict(list)
+    rows = DocumentPageText.objects.filter(document_id__in=page_counts).order_by('document_id', 'page_number')
+    for document_id, text, source in rows.values_list('document_id', 'text', 'source'):
+        pages[document_id].append((text, source))
+
+    by_source = defaultdict(list)
+    for document_id, page_count in page_counts.items():
+        if not page_count or len(pages[document_id]) < page_count:
+            continue
+        text = '\f'.join(text for text, _ in pages[document_id])[:MAX_TEXT_CHARS]
+        source = 'ocr' if any(source == 'ocr' for _, source in pages[document_id]) else 'pdf'
+        by_source[source].append((document_id, text, page_count))
+    for source, results in by_source.items():
+        save_texts(results, source=source)
+    return [document_id for results in by_source.values() for document_id, _, _ in results]
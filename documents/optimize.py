@@ -0,0 +1,214 @@
+"""Derivado optimizado de un PDF: imágenes recomprimidas y linealizado ("fast web view").
+
+Un PDF linealizado trae primero lo necesario para mostrar la primera página,
+así que el visor del dashboard la dibuja sin esperar a descargar el archivo
+completo. Las páginas escaneadas suelen ser imágenes sin pérdida a 300 dpi o
+más: se reducen a ``PDF_OPTIMIZE_MAX_DPI`` y se guardan en JPEG con calidad
+``PDF_OPTIMIZE_QUALITY``, solo cuando el resultado es más pequeño.
+
+También se genera aquí el derivado sin páginas en blanco (los reversos
+vacíos de un escaneo dúplex): pesa menos, se transfiere más rápido y no
+mete ruido en el texto. El optimizado se genera a partir de ese derivado
+cuando existe (ver ``Document.derivative_source_path``).
+
+El original nunca se modifica. Se usa pikepdf (qpdf), que sí sabe linealizar;
+como PDFium, se usa desde procesos y no hilos.
+"""
+import io
+import os
+from pathlib import Path
+
+import pikepdf
+from django.conf import settings
+from PIL import Image
+
+from .pdf_tools import find_separator_pages
+
+# Filtros que ya son compactos o que no vale la pena recodificar
+_SKIP_FILTERS = {'/JBIG2Decode', '/CCITTFaxDecode', '/JPXDecode'}
+# Solo se reemplaza una imagen si la nueva versión ahorra al menos esto
+MIN_IMAGE_SAVING = 0.1
+
+
+def optimize_settings():
+    return {
+        'quality': getattr(settings, 'PDF_OPTIMIZE_QUALITY', 75),
+        'max_dpi': getattr(settings, 'PDF_OPTIMIZE_MAX_DPI', 150),
+    }
+
+
+def _filters(image):
+    value = image.get('/Filter')
+    if value is None:
+        return []
+    return [str(f) for f in value] if isinstance(value, pikepdf.Array) else [str(value)]
+
+
+def _recompress_image(image, page_size_in, quality, max_dpi):
+    """Reemplaza el flujo de la imagen si la versión JPEG reducida es más pequeña.
+
+    Retorna los bytes ahorrados (0 si la imagen se deja como estaba).
+    """
+    if image.get('/ImageMask') or image.get('/Decode') is not None:
+        return 0
+    if int(image.get('/BitsPerComponent', 8)) != 8 or _SKIP_FILTERS.intersection(_filters(image)):
+        return 0
+    pdf_image = pikepdf.PdfImage(image)
+    if pdf_image.mode not in ('L', 'RGB'):
+        return 0
+
+    original_bytes = len(image.read_raw_bytes())
+    picture = pdf_image.as_pil_image()
+    # Resolución efectiva suponiendo que la imagen ocupa la página (el caso de un escaneo)
+    width_in, height_in = page_size_in
+    dpi = max(picture.width / max(width_in, 0.1), picture.height / max(height_in, 0.1))
+    if dpi > max_dpi:
+        scale = max_dpi / dpi
+        picture = picture.resize(
+            (max(int(picture.width * scale), 1), max(int(picture.height * scale), 1)), Image.LANCZOS
+        )
+
+    buffer = io.BytesIO()
+    picture.save(buffer, format='JPEG', quality=quality, optimize=True)
+    data = buffer.getvalue()
+    if len(data) > original_bytes * (1 - MIN_IMAGE_SAVING):
+        return 0
+
+    image.write(data, filter=pikepdf.Name.DCTDecode)
+    image.Width = picture.width
+    image.Height = picture.height
+    image.ColorSpace = pikepdf.Name.DeviceGray if picture.mode == 'L' else pikepdf.Name.DeviceRGB
+    image.BitsPerComponent = 8
+    if '/DecodeParms' in image:
+        del image['/DecodeParms']
+    return original_bytes - len(data)
+
+
+def optimize_pdf(source, destination, quality=75, max_dpi=150):
+    """Escribe en ``destination`` la versión linealizada y con imágenes recomprimidas.
+
+    Retorna un dict con ``original_size``, ``size`` e ``images`` (imágenes
+    recomprimidas). La escritura es atómica: un archivo a medias nunca queda
+    en ``destination``.
+    """
+    source = Path(source)
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    images = 0
+    with pikepdf.open(source) as pdf:
+        seen = set()
+        for page in pdf.pages:
+            box = page.mediabox
+            page_size_in = (abs(float(box[2]) - float(box[0])) / 72, abs(float(box[3]) - float(box[1])) / 72)
+            for image in page.images.values():
+                # La misma imagen puede repetirse en varias páginas
+                if image.objgen in seen:
+                    continue
+                seen.add(image.objgen)
+                try:
+                    images += _recompress_image(image, page_size_in, quality, max_dpi) > 0
+                except (pikepdf.PdfError, NotImplementedError, ValueError, OSError):
+                    continue
+        pdf.remove_unreferenced_resources()
+
+        tmp = destination.with_name(destination.name + '.tmp')
+        pdf.save(
+            tmp,
+            linearize=True,
+            compress_streams=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+        )
+    os.replace(tmp, destination)
+    return {
+        'original_size': source.stat().st_size,
+        'size': destination.stat().st_size,
+        'images': images,
+    }
+
+
+def blank_page_threshold():
+    return getattr(settings, 'BLANK_PAGE_THRESHOLD', 0.001)
+
+
+def remove_blank_pages(source, destination, blank_threshold=0.001):
+    """Escribe en ``destination`` el PDF sin sus páginas en blanco.
+
+    Las páginas se analizan de a una (ver ``pdf_tools.find_separator_pages``).
+    Retorna un dict con ``original_size``, ``size``, ``pages`` (páginas del
+    original) y ``pages_removed`` (números de página desde 1), o None si no
+    hay páginas en blanco o si todas lo son.
+    """
+    blank = find_separator_pages(source, blank_threshold=blank_threshold)
+    removed = [index for index, is_blank in enumerate(blank) if is_blank]
+    if not removed or len(removed) == len(blank):
+        return None
+
+    source = Path(source)
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with pikepdf.open(source) as pdf:
+        for index in reversed(removed):
+            del pdf.pages[index]
+        pdf.remove_unreferenced_resources()
+        tmp = destination.with_name(destination.name + '.tmp')
+        pdf.save(tmp, compress_streams=True, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+    os.replace(tmp, destination)
+    return {
+        'original_size': source.stat().st_size,
+        'size': destination.stat().st_size,
+        'pages': len(blank),
+        'pages_removed': [index + 1 for index in removed],
+    }
+
+
+def derivative_name(document, kind):
+    """Ruta relativa a MEDIA_ROOT del derivado; depende del contenido y no de
+    dónde esté el original (que pasa de Pending a Organized al categorizarse)"""
+    key = document.content_hash or f'doc{document.pk}'
+    return (Path('Derivatives') / key[:2] / f'{key}.{kind}.pdf').as_posix()
+
+
+def save_derivatives(results, kind='optimized'):
+    """Registra ``[(document_id, ruta relativa, resultado de optimize_pdf)]`` con un INSERT masivo.
+
+    Un derivado que no resultó más pequeño que el original no sirve: se
+    borra y se sigue entregando el original. Retorna los derivados guardados.
+    """
+    from .models import DocumentDerivative
+
+    derivatives = []
+    discarded = []
+    for document_id, name, result in results:
+        if result['size'] >= result['original_size']:
+            Path(settings.MEDIA_ROOT, name).unlink(missing_ok=True)
+            discarded.append(document_id)
+            continue
+        derivatives.append(DocumentDerivative(
+            document_id=document_id,
+            kind=kind,
+            file=name,
+            size=result['size'],
+            original_size=result['original_size'],
+            details={key: value for key, value in result.items() if key not in ('size', 'original_size')},
+        ))
+    DocumentDerivative.objects.filter(document_id__in=discarded, kind=kind).delete()
+    return DocumentDerivative.objects.bulk_create(
+        derivatives,
+        update_conflicts=True,
+        unique_fields=['document', 'kind'],
+        update_fields=['file', 'size', 'original_size', 'details', 'created_at'],
+    )
+
+
+def discard_derivatives(document_ids, kind):
+    """Borra los derivados ``kind`` (archivo y registro) de ``document_ids``.
+
+    Se usa para el optimizado que se generó antes de quitar las páginas en
+    blanco: ``optimize_documents`` lo vuelve a generar sobre el nuevo derivado.
+    """
+    from .models import DocumentDerivative
+
+    derivatives = DocumentDerivative.objects.filter(document_id__in=document_ids, kind=kind)
+    for derivative in derivatives:
+        Path(derivative.path).unlink(missing_ok=True)
+    return derivatives.delete()[0]
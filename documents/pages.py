@@ -0,0 +1,69 @@
+"""Páginas individuales de un documento, como PDF de una página o como imagen.
+
+Para consultar la página 1 de un estado de cuenta de 400 páginas no hace
+falta transferir el archivo completo: la vista ``document_page`` entrega
+solo esa página. El resultado se guarda en una caché LRU acotada con clave
+(hash de contenido, página, formato), así que volver a la misma página no
+vuelve a abrir el PDF.
+"""
+import io
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import BoundedFileCache
+from .pdf_tools import page_pdf, render_pages
+
+PAGE_FORMATS = {
+    'pdf': 'application/pdf',
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+
+_cache = None
+
+
+def page_cache():
+    """Caché compartida del proceso (se recrea si cambia la configuración)"""
+    global _cache
+    root = Path(getattr(settings, 'PAGE_CACHE_DIR', settings.BASE_DIR / 'cache' / 'pages'))
+    max_bytes = getattr(settings, 'PAGE_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+    if _cache is None or _cache.root != root or _cache.max_bytes != max_bytes:
+        _cache = BoundedFileCache(root, max_bytes)
+    return _cache
+
+
+def page_key(document, page, fmt):
+    """Clave de caché: hash de contenido (o id si aún no tiene), página y formato"""
+    identity = document.content_hash or f'doc{document.pk}'
+    return f'{identity}_p{page}.{fmt}'
+
+
+def _render(path, index, fmt):
+    if fmt == 'pdf':
+        return page_pdf(path, index)
+    images = render_pages(path, [index], getattr(settings, 'PAGE_IMAGE_WIDTH', 1275))
+    if not images:
+        return None
+    image = images[0][1]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=getattr(settings, 'PAGE_IMAGE_QUALITY', 85))
+    return buffer.getvalue()
+
+
+def get_page(document, page, fmt='pdf'):
+    """Ruta en caché de la página ``page`` (desde 1) en ``fmt``; None si la página no existe"""
+    if fmt not in PAGE_FORMATS:
+        raise ValueError(f'Formato de página desconocido: {fmt}')
+    cache = page_cache()
+    key = page_key(document, page, fmt)
+    path = cache.get(key)
+    if path is None and document.file:
+        data = _render(document.file.path, page - 1, fmt)
+        if data is None:
+            return None
+        path = cache.put(key, data)
+    return path
@@ -0,0 +1,211 @@
+"""Operaciones de bajo nivel sobre PDFs (render de páginas, texto, conteo de páginas).
+
+Se usa pypdfium2, que trae el motor PDFium compilado en la rueda y no
+requiere programas externos. PDFium no es seguro entre hilos: las
+funciones de este módulo abren el documento, trabajan y lo cierran, y se
+serializan con un candado a nivel de proceso. Para paralelizar se usan
+procesos, no hilos.
+"""
+import io
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+
+_pdfium_lock = threading.Lock()
+
+
+@contextmanager
+def open_pdf(path, password=None):
+    """Abre el PDF con PDFium y lo cierra al salir del bloque"""
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(str(path), password=password)
+        try:
+            yield pdf
+        finally:
+            pdf.close()
+
+
+def page_count(path):
+    with open_pdf(path) as pdf:
+        return len(pdf)
+
+
+def read_metadata(path):
+    """Metadatos básicos del PDF sin renderizar nada.
+
+    Retorna un dict con ``size``, ``page_count``, ``pdf_version``,
+    ``pdf_producer`` e ``is_encrypted``. Un PDF protegido con contraseña de
+    apertura no se puede leer: se marca como cifrado y sin conteo de páginas.
+    """
+    metadata = {
+        'size': os.path.getsize(path),
+        'page_count': None,
+        'pdf_version': '',
+        'pdf_producer': '',
+        'is_encrypted': False,
+    }
+    try:
+        with open_pdf(path) as pdf:
+            version = pdf.get_version()
+            metadata['page_count'] = len(pdf)
+            metadata['pdf_version'] = f'{version // 10}.{version % 10}' if version else ''
+            metadata['pdf_producer'] = (pdf.get_metadata_value('Producer') or '')[:255]
+            # -1 significa que el documento no tiene manejador de seguridad
+            metadata['is_encrypted'] = pdfium_c.FPDF_GetSecurityHandlerRevision(pdf.raw) != -1
+    except pdfium.PdfiumError as e:
+        if 'password' not in str(e).lower():
+            raise
+        metadata['is_encrypted'] = True
+    return metadata
+
+
+def render_pages(path, pages, width):
+    """Renderiza las páginas indicadas (índices desde 0) a ``width`` píxeles de ancho.
+
+    Retorna una lista de ``(índice, imagen PIL)``; los índices fuera de rango
+    se ignoran.
+    """
+    images = []
+    with open_pdf(path) as pdf:
+        for index in pages:
+            if not 0 <= index < len(pdf):
+                continue
+            page = pdf[index]
+            try:
+                scale = width / max(page.get_width(), 1)
+                bitmap = page.render(scale=scale, draw_annots=True)
+                images.append((index, bitmap.to_pil()))
+            finally:
+                page.close()
+    return images
+
+
+def page_pdf(path, index):
+    """Una página (índice desde 0) como PDF independiente, en bytes; None si no existe.
+
+    PDFium solo lee la tabla de referencias y los objetos de esa página, así
+    que el costo no depende del tamaño del documento.
+    """
+    with open_pdf(path) as pdf:
+        if not 0 <= index < len(pdf):
+            return None
+        single = pdfium.PdfDocument.new()
+        try:
+            single.import_pages(pdf, [index])
+            buffer = io.BytesIO()
+            single.save(buffer)
+            return buffer.getvalue()
+        finally:
+            single.close()
+
+
+def extract_text(path, max_chars=None):
+    """Texto embebido del PDF, página por página. Retorna ``(texto, páginas)``.
+
+    Las páginas se separan con un salto de página (``\\f``). Si se indica
+    ``max_chars`` se deja de leer al alcanzarlo.
+    """
+    parts = []
+    total = 0
+    with open_pdf(path) as pdf:
+        pages = len(pdf)
+        for index in range(pages):
+            page = pdf[index]
+            try:
+                textpage = page.get_textpage()
+                try:
+                    text = textpage.get_text_bounded()
+                finally:
+                    textpage.close()
+            finally:
+                page.close()
+            parts.append(text)
+            total += len(text)
+            if max_chars and total >= max_chars:
+                break
+    text = '\f'.join(parts)
+    return (text[:max_chars] if max_chars else text), pages
+
+
+def normalize_text(text):
+    """Colapsa espacios repetidos (no aportan al índice de búsqueda)"""
+    return re.sub(r'[ \t]+', ' ', text).strip()
+
+
+# Página "en blanco": casi sin píxeles bastante más oscuros que el fondo al
+# renderizarla en miniatura. El fondo de un escaneo no es blanco puro y trae
+# ruido y sombras en los bordes, por eso la tinta se mide contra la mediana de
+# la página y se ignora un margen
+BLANK_RENDER_WIDTH = 300
+BLANK_INK_CONTRAST = 40
+BLANK_MARGIN = 0.05
+
+
+def page_ink_ratio(page, width=BLANK_RENDER_WIDTH):
+    """Fracción de píxeles de tinta de una página abierta (sin los márgenes)"""
+    scale = width / max(page.get_width(), 1)
+    image = page.render(scale=scale, grayscale=True).to_pil().convert('L')
+    margin_x, margin_y = int(image.width * BLANK_MARGIN), int(image.height * BLANK_MARGIN)
+    image = image.crop((margin_x, margin_y, image.width - margin_x, image.height - margin_y))
+    histogram = image.histogram()
+    total = max(image.width * image.height, 1)
+    seen = 0
+    background = 255
+    for level, count in enumerate(histogram):
+        seen += count
+        if seen * 2 >= total:
+            background = level
+            break
+    return sum(histogram[:max(background - BLANK_INK_CONTRAST, 0)]) / total
+
+
+def page_text(page):
+    """Texto embebido de una página abierta"""
+    textpage = page.get_textpage()
+    try:
+        return textpage.get_text_bounded()
+    finally:
+        textpage.close()
+
+
+def find_separator_pages(path, blank_threshold=None, marker=None):
+    """Marca las páginas separadoras de un lote: ``[bool]`` con una entrada por página.
+
+    Una página es separadora si está en blanco (``blank_threshold`` es la
+    fracción máxima de tinta) o si su texto contiene ``marker``. Se recorre
+    una página a la vez, así que la memoria no depende del tamaño del lote.
+    """
+    marker = marker.casefold() if marker else None
+    separators = []
+    with open_pdf(path) as pdf:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                text = page_text(page) if marker or blank_threshold is not None else ''
+                is_separator = bool(marker and marker in text.casefold())
+                if not is_separator and blank_threshold is not None and not text.strip():
+                    is_separator = page_ink_ratio(page) <= blank_threshold
+            finally:
+                page.close()
+            separators.append(is_separator)
+    return separators
+
+
+def write_page_ranges(path, ranges, destinations):
+    """Copia cada rango ``(inicio, fin)`` de páginas (fin excluido) a su PDF destino.
+
+    PDFium importa las páginas sin decodificar sus imágenes: cada segmento
+    se escribe y se cierra antes de pasar al siguiente.
+    """
+    with open_pdf(path) as pdf:
+        for (start, end), destination in zip(ranges, destinations):
+            segment = pdfium.PdfDocument.new()
+            try:
+                segment.import_pages(pdf, list(range(start, end)))
+                segment.save(str(destination))
+            finally:
+                segment.close()
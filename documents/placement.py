@@ -0,0 +1,162 @@
+"""Colocación de archivos (copiar/mover) evitando copias completas cuando se puede.
+
+Estrategias disponibles, configurables con ``settings.FILE_PLACEMENT_STRATEGY``:
+
+- ``hardlink``: enlace duro, cero bytes copiados (mismo sistema de archivos).
+- ``reflink``: clon copy-on-write con ``FICLONE`` (Btrfs, XFS con reflink).
+- ``copy_file_range``: copia dentro del kernel (``os.copy_file_range``/``os.sendfile``).
+- ``copy``: copia normal con ``shutil.copy2``.
+- ``auto`` (por defecto): prueba las anteriores en ese orden y recuerda cuál
+  funcionó para cada par de dispositivos.
+"""
+import errno
+import os
+import shutil
+import threading
+
+from django.conf import settings
+
+STRATEGIES = ('hardlink', 'reflink', 'copy_file_range', 'copy')
+
+# Valor de FICLONE en <linux/fs.h>
+FICLONE = 0x40049409
+
+# Errores que indican que la estrategia no es soportada (y no un fallo real)
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL,
+    errno.ENOSYS, errno.EMLINK, errno.ENOTTY, errno.EBADF,
+}
+
+# Primera estrategia que funcionó para cada (dispositivo origen, dispositivo destino)
+_capabilities = {}
+_capabilities_lock = threading.Lock()
+
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+
+def _reflink(src, dst):
+    import fcntl
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _kernel_copy(src, dst):
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        try:
+            copy = getattr(os, 'copy_file_range', None)
+            if copy is None:
+                raise OSError(errno.ENOSYS, 'copy_file_range no disponible')
+            while remaining > 0:
+                sent = copy(fsrc.fileno(), fdst.fileno(), remaining)
+                if sent == 0:
+                    break
+                remaining -= sent
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS or not hasattr(os, 'sendfile'):
+                fdst.close()
+                os.unlink(dst)
+                raise
+            # Respaldo: sendfile entre archivos (Linux)
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            offset = 0
+            remaining = os.fstat(fsrc.fileno()).st_size
+            try:
+                while remaining > 0:
+                    sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, remaining)
+                    if sent == 0:
+                        break
+                    offset += sent
+                    remaining -= sent
+            except OSError:
+                fdst.close()
+                os.unlink(dst)
+                raise
+    shutil.copystat(src, dst)
+
+
+def _plain_copy(src, dst):
+    shutil.copy2(src, dst)
+
+
+_IMPLEMENTATIONS = {
+    'hardlink': _hardlink,
+    'reflink': _reflink,
+    'copy_file_range': _kernel_copy,
+    'copy': _plain_copy,
+}
+
+
+def configured_strategy():
+    strategy = getattr(settings, 'FILE_PLACEMENT_STRATEGY', 'auto')
+    if strategy != 'auto' and strategy not in STRATEGIES:
+        raise ValueError(f'FILE_PLACEMENT_STRATEGY inválida: {strategy}')
+    return strategy
+
+
+def _device_key(src, dst):
+    return (os.stat(src).st_dev, os.stat(os.path.dirname(os.path.abspath(dst))).st_dev)
+
+
+def copy_file(src, dst, strategy=None):
+    """Crea ``dst`` con el contenido de ``src`` y retorna la estrategia usada.
+
+    Con ``auto`` se prueban las estrategias de menor a mayor costo; si una
+    falla por no estar soportada se pasa a la siguiente y se recuerda el
+    resultado para ese par de dispositivos.
+    """
+    src, dst = os.fspath(src), os.fspath(dst)
+    strategy = strategy or configured_strategy()
+
+    if strategy != 'auto':
+        try:
+            _IMPLEMENTATIONS[strategy](src, dst)
+            return strategy
+        except OSError as e:
+            if strategy == 'copy' or e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            _plain_copy(src, dst)
+            return 'copy'
+
+    key = _device_key(src, dst)
+    with _capabilities_lock:
+        known = _capabilities.get(key)
+    candidates = STRATEGIES[STRATEGIES.index(known):] if known else STRATEGIES
+
+    for candidate in candidates:
+        try:
+            _IMPLEMENTATIONS[candidate](src, dst)
+        except OSError as e:
+            if candidate == 'copy' or e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            continue
+        if candidate != known:
+            with _capabilities_lock:
+                _capabilities[key] = candidate
+        return candidate
+
+
+def move_file(src, dst, strategy=None):
+    """Mueve ``src`` a ``dst``: renombra si es el mismo dispositivo, si no copia y borra"""
+    src, dst = os.fspath(src), os.fspath(dst)
+    try:
+        os.rename(src, dst)
+        return 'rename'
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Entre dispositivos no hay enlace duro posible; copy_file pasa a la siguiente opción
+    used = copy_file(src, dst, strategy)
+    os.unlink(src)
+    return used
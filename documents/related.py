@@ -0,0 +1,271 @@
+"""Documentos relacionados: índice TF-IDF disperso con vecinos precalculados.
+
+Cada documento se representa con sus ``MAX_TERMS`` términos de mayor peso
+TF-IDF (texto, nombre de archivo, título, entidad y clasificación), en un
+vector normalizado guardado como índice invertido (``DocumentTerm``). La
+similitud coseno es el producto punto de dos vectores, y solo hace falta
+recorrer los documentos que comparten algún término.
+
+Los ``related_count()`` vecinos más cercanos de cada documento se guardan
+en ``RelatedDocument``: consultarlos es una lectura indexada, sin calcular
+nada. La indexación es incremental: solo se vuelven a vectorizar los
+documentos nuevos o cuyo texto o metadatos cambiaron, y cada uno entra
+también en la lista de sus vecinos.
+
+Las frecuencias de documento (IDF) viven en la BD (``TermDocumentFrequency``
+y ``RelatedIndexEntry``) y se actualizan en la misma transacción que los
+vectores de cada lote, con incrementos atómicos: varios workers pueden
+indexar a la vez y cada lote solo lee las frecuencias de sus propios
+términos. Un documento cuenta en las frecuencias la primera vez que se
+indexa; con el tiempo se desvían un poco (textos que cambian, documentos
+borrados) y ``index_related_documents --full`` las recalcula desde cero.
+"""
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Substr
+
+from .classifier import MAX_TEXT_CHARS, document_features, tokenize
+from .models import Document, DocumentTerm, RelatedDocument, RelatedIndexEntry, TermDocumentFrequency
+from .scanner import iter_batches
+
+# Términos por documento: el vector queda disperso y la consulta acotada
+MAX_TERMS = 50
+# Un término presente en más de esta fracción de los documentos no distingue a ninguno
+MAX_DF_RATIO = 0.3
+MIN_SIMILARITY = 0.05
+DEFAULT_BATCH_SIZE = 200
+# Términos por consulta ``IN`` (respeta el límite de variables de SQLite)
+TERM_QUERY_BATCH = 500
+TERM_MAX_LENGTH = TermDocumentFrequency._meta.get_field('term').max_length
+
+
+def related_count():
+    return getattr(settings, 'RELATED_DOCUMENTS_COUNT', 8)
+
+
+def document_terms(filename, title, text, category_id=None, document_type_id=None, entity_id=None, entity_name=None):
+    """Frecuencias de términos de un documento: texto y archivo, título, entidad y clasificación"""
+    counts = document_features(filename or title, text)
+    counts.update(tokenize(' '.join(filter(None, [title, entity_name]))))
+    for prefix, value in (('c:', category_id), ('t:', document_type_id), ('e:', entity_id)):
+        if value:
+            counts[f'{prefix}{value}'] += 1
+    if any(len(token) > TERM_MAX_LENGTH for token in counts):
+        truncated = Counter()
+        for token, tf in counts.items():
+            truncated[token[:TERM_MAX_LENGTH]] += tf
+        return truncated
+    return counts
+
+
+class TermStatistics:
+    """Frecuencias de documento de los términos de un lote y tamaño del corpus indexado"""
+
+    def __init__(self, n_docs=0, doc_freq=None):
+        self.n_docs = n_docs
+        self.doc_freq = doc_freq or {}
+
+    @classmethod
+    def load(cls, terms):
+        """Lee de la BD solo las frecuencias de ``terms``"""
+        doc_freq = {}
+        for batch in iter_batches(sorted(terms), TERM_QUERY_BATCH):
+            doc_freq.update(TermDocumentFrequency.objects.filter(term__in=batch).values_list('term', 'documents'))
+        return cls(RelatedIndexEntry.objects.count(), doc_freq)
+
+    def vector(self, counts):
+        """Los ``MAX_TERMS`` términos de mayor peso TF-IDF, normalizados (L2)"""
+        cutoff = max(self.n_docs * MAX_DF_RATIO, 10)
+        weights = {}
+        for token, tf in counts.items():
+            df = self.doc_freq.get(token, 0)
+            if df <= cutoff:
+                weights[token] = (1 + math.log(tf)) * (math.log((1 + self.n_docs) / (1 + df)) + 1)
+        top = sorted(weights.items(), key=lambda item: -item[1])[:MAX_TERMS]
+        norm = math.sqrt(sum(w * w for _, w in top)) or 1.0
+        return {token: w / norm for token, w in top}
+
+
+def _stamp(updated_at, extracted_at):
+    return max(filter(None, [updated_at, extracted_at]))
+
+
+def _rows(queryset):
+    return queryset.annotate(sample=Substr('text__text', 1, MAX_TEXT_CHARS)).values_list(
+        'id', 'original_filename', 'title', 'sample', 'category_id', 'document_type_id', 'entity_id', 'entity__name',
+        'updated_at', 'text__extracted_at',
+    )
+
+
+def _features(queryset, batch_size):
+    """Frecuencias de términos de los documentos, por lotes: ``[(id, marca, frecuencias)]``"""
+    for batch in iter_batches(list(queryset.values_list('id', flat=True)), batch_size):
+        yield [
+            (document_id, _stamp(updated_at, extracted_at), document_terms(filename, title, text, *labels, entity_name))
+            for document_id, filename, title, text, *labels, entity_name, updated_at, extracted_at in _rows(
+                Document.objects.filter(id__in=batch)
+            )
+        ]
+
+
+def _register(rows):
+    """Anota los documentos como indexados y suma sus términos a las frecuencias de documento.
+
+    Los que ya estaban indexados solo actualizan su marca. Los incrementos
+    son ``UPDATE ... SET documents = documents + n``: dos workers que
+    indexan a la vez no se pisan.
+    """
+    known = set(RelatedIndexEntry.objects.filter(
+        document_id__in=[document_id for document_id, _, _ in rows]
+    ).values_list('document_id', flat=True))
+    increments = Counter()
+    for document_id, _, counts in rows:
+        if document_id not in known:
+            increments.update(counts.keys())
+
+    RelatedIndexEntry.objects.bulk_create(
+        [RelatedIndexEntry(document_id=document_id, stamp=stamp) for document_id, stamp, _ in rows],
+        update_conflicts=True,
+        unique_fields=['document'],
+        update_fields=['stamp'],
+    )
+    TermDocumentFrequency.objects.bulk_create(
+        [TermDocumentFrequency(term=term) for term in increments], ignore_conflicts=True
+    )
+    # Un UPDATE por cantidad a sumar (casi siempre 1) y lote de términos
+    by_amount = defaultdict(list)
+    for term, amount in increments.items():
+        by_amount[amount].append(term)
+    for amount, terms in by_amount.items():
+        for batch in iter_batches(terms, TERM_QUERY_BATCH):
+            TermDocumentFrequency.objects.filter(term__in=batch).update(documents=F('documents') + amount)
+
+
+def _save_terms(rows):
+    stats = TermStatistics.load({term for _, _, counts in rows for term in counts})
+    DocumentTerm.objects.filter(document_id__in=[document_id for document_id, _, _ in rows]).delete()
+    DocumentTerm.objects.bulk_create([
+        DocumentTerm(document_id=document_id, term=term, weight=weight)
+        for document_id, _, counts in rows
+        for term, weight in stats.vector(counts).items()
+    ], ignore_conflicts=True)
+
+
+def neighbours(document_ids, k=None):
+    """Vecinos más similares de cada documento: ``{id: [(otro id, similitud)]}`` de mayor a menor"""
+    k = k or related_count()
+    own = defaultdict(dict)
+    for document_id, term, weight in DocumentTerm.objects.filter(
+        document_id__in=list(document_ids)
+    ).values_list('document_id', 'term', 'weight'):
+        own[term][document_id] = weight
+
+    scores = defaultdict(Counter)
+    for other_id, term, weight in DocumentTerm.objects.filter(term__in=list(own)).values_list('document_id', 'term', 'weight'):
+        for document_id, own_weight in own[term].items():
+            if other_id != document_id:
+                scores[document_id][other_id] += own_weight * weight
+    return {
+        document_id: [(other_id, round(score, 4)) for other_id, score in found.most_common(k) if score >= MIN_SIMILARITY]
+        for document_id, found in scores.items()
+    }
+
+
+def _save_neighbours(found, k, symmetric):
+    """Reemplaza la lista de vecinos de cada documento de ``found``.
+
+    Con ``symmetric`` cada documento entra también en la lista de sus vecinos
+    (la similitud coseno es simétrica) y esas listas se recortan a ``k``.
+    """
+    with transaction.atomic():
+        RelatedDocument.objects.filter(document_id__in=list(found)).delete()
+        if symmetric:
+            # Las similitudes viejas con estos documentos ya no valen
+            RelatedDocument.objects.filter(related_id__in=list(found)).delete()
+        RelatedDocument.objects.bulk_create([
+            RelatedDocument(document_id=document_id, related_id=other_id, score=score)
+            for document_id, matches in found.items()
+            for other_id, score in matches
+        ])
+        if not symmetric:
+            return
+        affected = {other_id for matches in found.values() for other_id, _ in matches} - set(found)
+        RelatedDocument.objects.bulk_create(
+            [
+                RelatedDocument(document_id=other_id, related_id=document_id, score=score)
+                for document_id, matches in found.items()
+                for other_id, score in matches
+                if other_id in affected
+            ],
+            update_conflicts=True,
+            unique_fields=['document', 'related'],
+            update_fields=['score'],
+        )
+        extra = []
+        kept = Counter()
+        for row_id, document_id in RelatedDocument.objects.filter(
+            document_id__in=affected
+        ).order_by('document_id', '-score').values_list('id', 'document_id'):
+            kept[document_id] += 1
+            if kept[document_id] > k:
+                extra.append(row_id)
+        RelatedDocument.objects.filter(id__in=extra).delete()
+
+
+def index_documents(document_ids=None, full=False, batch_size=DEFAULT_BATCH_SIZE):
+    """Actualiza el índice y los vecinos precalculados. Retorna los documentos indexados.
+
+    Sin ``document_ids`` se indexan los documentos nuevos o cuyo texto o
+    metadatos cambiaron desde la última vez; con ``full`` se reconstruye todo,
+    incluidas las frecuencias de documento.
+    """
+    k = related_count()
+    if full:
+        queryset = Document.objects.all()
+        with transaction.atomic():
+            for model in (RelatedDocument, DocumentTerm, RelatedIndexEntry, TermDocumentFrequency):
+                model.objects.all().delete()
+        # Primera pasada: las frecuencias de documento completas antes de pesar ningún término
+        for rows in _features(queryset, batch_size):
+            with transaction.atomic():
+                _register(rows)
+    elif document_ids is not None:
+        queryset = Document.objects.filter(id__in=list(document_ids))
+    else:
+        queryset = Document.objects.filter(
+            Q(related_index__isnull=True) |
+            Q(related_index__stamp__lt=F('updated_at')) |
+            Q(related_index__stamp__lt=F('text__extracted_at'))
+        )
+
+    indexed = []
+    for rows in _features(queryset, batch_size):
+        # Frecuencias y vectores del lote en la misma transacción
+        with transaction.atomic():
+            if not full:
+                _register(rows)
+            _save_terms(rows)
+        indexed += [document_id for document_id, _, _ in rows]
+
+    # Con todos los vectores guardados, cada documento indexado busca sus vecinos
+    for batch in iter_batches(indexed, batch_size):
+        found = neighbours(batch, k)
+        _save_neighbours({document_id: found.get(document_id, []) for document_id in batch}, k, symmetric=not full)
+    return indexed
+
+
+def related_to(document, visible=None):
+    """Vecinos precalculados de ``document`` como ``[(documento, similitud)]``.
+
+    ``visible`` (un queryset de ``Document``) limita a los que el usuario puede ver.
+    """
+    rows = RelatedDocument.objects.filter(document=document).select_related(
+        'related__category', 'related__document_type', 'related__entity'
+    ).order_by('-score')
+    if visible is not None:
+        rows = rows.filter(related__in=visible)
+    return [(row.related, row.score) for row in rows]
@@ -0,0 +1,93 @@
+"""Recorrido incremental de la carpeta de monitoreo.
+
+Los listados se generan con ``os.scandir`` sin construir la lista completa
+en memoria, así la importación puede empezar con el primer archivo aunque
+la carpeta tenga cientos de miles de entradas.
+"""
+import fnmatch
+import os
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+
+# Carpetas internas que nunca se recorren (rutas relativas a la carpeta de monitoreo): una
+# subcarpeta de usuario que también se llame ``processed`` (p. ej. ``Clientes/processed``) sí se importa
+SKIPPED_DIRS = {'processed'}
+
+
+def scan_options(recursive=None, include=None, exclude=None):
+    """Completa las opciones del escáner con los valores de settings"""
+    return {
+        'recursive': getattr(settings, 'MONITORED_FOLDER_RECURSIVE', False) if recursive is None else recursive,
+        'include': include or getattr(settings, 'MONITORED_FOLDER_INCLUDE', None) or ['*.pdf'],
+        'exclude': exclude if exclude is not None else getattr(settings, 'MONITORED_FOLDER_EXCLUDE', []),
+    }
+
+
+def _matches(patterns, name, relative):
+    name = name.lower()
+    relative = relative.lower()
+    return any(
+        fnmatch.fnmatchcase(name, pattern.lower()) or fnmatch.fnmatchcase(relative, pattern.lower())
+        for pattern in patterns
+    )
+
+
+def scanned_dir(name, relative, exclude=()):
+    """True si el escáner entra en la subcarpeta ``name`` (``relative`` a la carpeta monitoreada)"""
+    return not name.startswith('.') and relative not in SKIPPED_DIRS and not _matches(exclude, name, relative)
+
+
+def scanned_file(name, relative, include=('*.pdf',), exclude=()):
+    """True si el escáner importa el archivo ``name`` (``relative`` a la carpeta monitoreada)"""
+    return not name.startswith('.') and _matches(include, name, relative) and not _matches(exclude, name, relative)
+
+
+def iter_pdfs(folder, recursive=False, include=('*.pdf',), exclude=()):
+    """Genera las rutas de los PDFs de ``folder`` a medida que se encuentran.
+
+    Los patrones de ``include``/``exclude`` se comparan (sin distinguir
+    mayúsculas) contra el nombre del archivo y contra su ruta relativa a
+    ``folder``, p. ej. ``'2024-*/*.pdf'``. Se omiten archivos y carpetas
+    ocultos y la carpeta ``processed`` de la raíz.
+    """
+    folder = Path(folder)
+    pending_dirs = [folder]
+    while pending_dirs:
+        current = pending_dirs.pop()
+        try:
+            entries = os.scandir(current)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                relative = os.path.relpath(entry.path, folder).replace(os.sep, '/')
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and scanned_dir(entry.name, relative, exclude):
+                            pending_dirs.append(Path(entry.path))
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if scanned_file(entry.name, relative, include, exclude):
+                    yield Path(entry.path)
+
+
+def iter_batches(iterable, batch_size):
+    """Agrupa un iterable en listas de hasta ``batch_size`` elementos"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def count_pdfs(folder, **options):
+    """Cuenta los PDFs sin guardar el listado"""
+    return sum(1 for _ in iter_pdfs(folder, **options))
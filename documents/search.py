@@ -0,0 +1,116 @@
+"""Búsqueda de texto completo sobre título, entidad, notas y contenido de los PDFs.
+
+En SQLite se usa la tabla virtual FTS5 ``documents_search`` (creada en la
+migración 0009 y mantenida por triggers), así que la latencia depende del
+número de coincidencias y no del tamaño del corpus. En otros motores se
+recurre a ``icontains`` sobre los campos del documento.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import DocumentText
+from .pdf_tools import extract_text, normalize_text
+
+# Límite de texto guardado por documento (el índice no necesita libros enteros)
+MAX_TEXT_CHARS = getattr(settings, 'SEARCH_MAX_TEXT_CHARS', 200_000)
+
+# Marcadores que no aparecen en el texto; se reemplazan por <mark> ya escapado
+_HIT_START = '\x02'
+_HIT_END = '\x03'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """Convierte lo que escribe el usuario en una consulta FTS5 segura.
+
+    Cada palabra se busca como prefijo (``"factu"*``) y todas deben
+    aparecer; así no hay errores de sintaxis por comillas u operadores.
+    """
+    words = _WORD_RE.findall(text or '')
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_documents(queryset, text):
+    """Filtra ``queryset`` por ``text`` ordenando por relevancia.
+
+    Con FTS5 cada documento trae ``search_snippet`` (fragmento del contenido
+    con las coincidencias marcadas, ver ``highlight``).
+    """
+    if not fts_available():
+        return queryset.filter(
+            Q(title__icontains=text) |
+            Q(entity__name__icontains=text) |
+            Q(notes__icontains=text) |
+            Q(text__text__icontains=text)
+        )
+
+    match = build_match_query(text)
+    if not match:
+        return queryset
+    return queryset.filter(search_index__search=match).annotate(
+        search_rank=F('search_index__rank'),
+        search_snippet=RawSQL(
+            "snippet(documents_search, 3, %s, %s, '…', 16)", (_HIT_START, _HIT_END)
+        ),
+    ).order_by('search_rank')
+
+
+def highlight(snippet):
+    """HTML seguro del fragmento con las coincidencias en <mark>"""
+    if not snippet:
+        return ''
+    return mark_safe(
+        escape(snippet).replace(_HIT_START, '<mark>').replace(_HIT_END, '</mark>')
+    )
+
+
+def extract_document_text(path):
+    """Extrae la capa de texto del PDF. Retorna ``(texto, páginas)``"""
+    text, pages = extract_text(path, max_chars=MAX_TEXT_CHARS)
+    return normalize_text(text), pages
+
+
+def save_texts(results, source='pdf'):
+    """Guarda (insertando o actualizando) ``[(document_id, texto, páginas)]`` en un solo INSERT.
+
+    Los triggers de ``documents_search`` actualizan el índice en la misma
+    transacción.
+    """
+    return DocumentText.objects.bulk_create(
+        [
+            DocumentText(document_id=document_id, text=text, page_count=pages, source=source)
+            for document_id, text, pages in results
+        ],
+        update_conflicts=True,
+        unique_fields=['document'],
+        update_fields=['text', 'page_count', 'source', 'extracted_at'],
+    )
+
+
+def rebuild_index():
+    """Reconstruye el índice FTS5 completo desde las tablas y lo optimiza"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM documents_search")
+        cursor.execute(
+            """
+            INSERT INTO documents_search(rowid, title, entity, notes, content)
+            SELECT d.id, d.title, coalesce(e.name, ''), coalesce(d.notes, ''), coalesce(t.text, '')
+            FROM documents_document d
+            LEFT JOIN documents_entity e ON e.id = d.entity_id
+            LEFT JOIN documents_documenttext t ON t.document_id = d.id
+            """
+        )
+        cursor.execute("INSERT INTO documents_search(documents_search) VALUES('optimize')")
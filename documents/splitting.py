@@ -0,0 +1,149 @@
+"""División de lotes escaneados (varios documentos en un solo PDF) en documentos separados.
+
+El escáner con alimentador suele entregar una pila completa de hojas como
+un único PDF. Los límites entre documentos se detectan de tres formas
+(``SCAN_SPLIT_MODE``):
+
+- ``'blank'``: una página en blanco separa un documento del siguiente.
+- ``'marker'``: una hoja separadora impresa con el texto ``SCAN_SPLIT_MARKER``.
+- ``'pages'``: cada ``SCAN_SPLIT_PAGES`` páginas empieza un documento.
+
+Las páginas separadoras no se copian a ningún segmento. Cada segmento se
+registra como un ``Document`` pendiente con ``source_batch`` apuntando al
+lote, que queda en estado 'Escaneado' (fuera de la lista de pendientes).
+
+``find_segments`` no importa modelos de Django, así que puede ejecutarse en
+un pool de procesos (ver ``workers.find_segments``).
+"""
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+from .pdf_tools import find_separator_pages, page_count, write_page_ranges
+
+SPLIT_MODES = ('blank', 'marker', 'pages')
+
+
+def split_settings():
+    return {
+        'mode': getattr(settings, 'SCAN_SPLIT_MODE', None),
+        'pages': getattr(settings, 'SCAN_SPLIT_PAGES', 1),
+        'marker': getattr(settings, 'SCAN_SPLIT_MARKER', 'DOCTRAC-SEPARADOR'),
+        'blank_threshold': getattr(settings, 'SCAN_SPLIT_BLANK_THRESHOLD', 0.001),
+    }
+
+
+def find_segments(path, mode, pages=1, marker=None, blank_threshold=0.001):
+    """Rangos de páginas ``[(inicio, fin)]`` (fin excluido) de cada documento del lote"""
+    if mode not in SPLIT_MODES:
+        raise ValueError(f'Modo de división desconocido: {mode}')
+    if mode == 'pages':
+        pages = max(int(pages), 1)
+        total = page_count(path)
+        return [(start, min(start + pages, total)) for start in range(0, total, pages)]
+
+    separators = find_separator_pages(
+        path,
+        blank_threshold=blank_threshold if mode == 'blank' else None,
+        marker=marker if mode == 'marker' else None,
+    )
+    segments = []
+    start = None
+    for index, is_separator in enumerate(separators):
+        if is_separator:
+            # Varias separadoras seguidas (p. ej. el reverso en blanco) no generan segmentos vacíos
+            if start is not None:
+                segments.append((start, index))
+                start = None
+        elif start is None:
+            start = index
+    if start is not None:
+        segments.append((start, len(separators)))
+    return segments
+
+
+def is_batch_candidate(document):
+    """Un documento importado desde la subcarpeta de lotes (``SCAN_SPLIT_FOLDER``) que
+    aún no se ha dividido y no es a su vez un segmento"""
+    if not document.imported_from_folder or document.source_batch_id or document.status != 'pending':
+        return False
+    folder = getattr(settings, 'SCAN_SPLIT_FOLDER', '').strip('/')
+    return not folder or (document.original_filename or '').startswith(f'{folder}/')
+
+
+def split_batch(document, segments):
+    """Crea un documento pendiente por cada segmento del lote ``document``.
+
+    Escribe los PDFs de los segmentos en Pending y los registra con un
+    INSERT masivo; el lote pasa a 'Escaneado'. Con menos de dos segmentos
+    no hay nada que dividir y se retorna una lista vacía.
+    """
+    from django.db import transaction
+
+    from .ingestion import _safe_metadata, compute_file_hash, unique_pending_name
+    from .models import Document, DocumentHistory
+    from .tasks import dispatch_post_ingest
+
+    if len(segments) < 2:
+        return []
+
+    pending_folder = Path(settings.MEDIA_ROOT) / 'Pending'
+    pending_folder.mkdir(parents=True, exist_ok=True)
+    stem = Path(document.original_filename or document.file.name).stem
+    now = datetime.now()
+    paths = [
+        pending_folder / unique_pending_name(f'{stem}_p{start + 1}-{end}.pdf', now)
+        for start, end in segments
+    ]
+    try:
+        write_page_ranges(document.file.path, segments, paths)
+        hashes = [compute_file_hash(path) for path in paths]
+        # content_hash es único: un segmento idéntico a otro documento se registra sin hash
+        taken = set(Document.objects.filter(content_hash__in=hashes).values_list('content_hash', flat=True))
+        children = []
+        for number, ((start, end), path, content_hash) in enumerate(zip(segments, paths, hashes), 1):
+            if content_hash in taken:
+                content_hash = None
+            taken.add(content_hash)
+            child = Document(
+                title=f'{document.title} ({number}/{len(segments)})',
+                notes=f'Páginas {start + 1}-{end} del lote escaneado "{document.title}"',
+                category=document.category,
+                created_by=document.created_by,
+                original_filename=f'{document.original_filename or stem}#p{start + 1}-{end}'[:255],
+                content_hash=content_hash,
+                imported_from_folder=document.imported_from_folder,
+                status='pending',
+                file=str(path.relative_to(settings.MEDIA_ROOT)),
+                file_size_bytes=path.stat().st_size,
+                source_batch=document,
+                source_pages=f'{start + 1}-{end}',
+            )
+            metadata = _safe_metadata(path)
+            if metadata:
+                child.apply_pdf_metadata(metadata)
+            children.append(child)
+
+        with transaction.atomic():
+            children = Document.objects.bulk_create(children)
+            DocumentHistory.objects.bulk_create([
+                DocumentHistory(
+                    document=child,
+                    previous_status=None,
+                    new_status=child.status,
+                    changed_by=child.created_by,
+                    change_reason='Documento creado al dividir un lote escaneado'
+                )
+                for child in children
+            ])
+            document.status = 'scanned'
+            document._change_reason = f'Lote dividido en {len(children)} documentos'
+            document.save(update_fields=['status', 'updated_at'])
+    except Exception:
+        for path in paths:
+            path.unlink(missing_ok=True)
+        raise
+
+    dispatch_post_ingest(child.id for child in children)
+    return children
@@ -0,0 +1,178 @@
+"""Detección de archivos que el escáner todavía está escribiendo.
+
+Un PDF se considera listo para importar cuando:
+
+* el kernel avisó que se cerró tras escribirse (``IN_CLOSE_WRITE`` o un
+  ``rename`` hacia la carpeta, ver ``watcher.InotifyWatcher``), o bien su
+  tamaño y fecha de modificación no cambiaron durante ``quiescence``
+  segundos entre un escaneo y otro; y además
+* termina con el trailer ``%%EOF`` de un PDF completo.
+
+Los archivos que no cumplen se difieren: no se espera por ellos, solo se
+anota cuándo conviene volver a revisarlos. El estado se guarda en un JSON
+pequeño para que las corridas sucesivas de ``sync_documents`` (cron)
+también cuenten como escaneos.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Según la especificación el trailer está dentro de los últimos 1024 bytes
+TRAILER_WINDOW = 1024
+PDF_TRAILER = b'%%EOF'
+
+# Intervalo mínimo entre revisiones de un archivo diferido
+MIN_RECHECK_SECONDS = 1.0
+
+
+def has_pdf_trailer(path):
+    """Indica si el archivo termina con ``%%EOF`` (lee solo el último KB)"""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - TRAILER_WINDOW, 0))
+            return PDF_TRAILER in f.read(TRAILER_WINDOW)
+    except OSError:
+        return False
+
+
+class StabilityGate:
+    """Decide qué archivos están completos y recuerda los que se difieren.
+
+    ``trailer_grace`` evita que un PDF truncado para siempre quede diferido
+    indefinidamente: si lleva ese tiempo sin cambiar se deja pasar y la
+    importación (o una revisión manual) se encarga de él.
+    """
+
+    def __init__(self, quiescence=5.0, trailer_grace=600.0, state_path=None, log=None):
+        self.quiescence = max(float(quiescence), 0.0)
+        self.trailer_grace = trailer_grace
+        self.state_path = Path(state_path) if state_path else None
+        self.log = log or (lambda level, message: None)
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    @classmethod
+    def from_settings(cls, state_path=None, log=None):
+        from django.conf import settings
+
+        return cls(
+            quiescence=getattr(settings, 'INGEST_STABLE_SECONDS', 5.0),
+            trailer_grace=getattr(settings, 'INGEST_TRAILER_GRACE_SECONDS', 600.0),
+            state_path=state_path,
+            log=log,
+        )
+
+    def _load(self):
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save(self):
+        """Guarda solo los archivos diferidos que siguen existiendo"""
+        if not self.state_path:
+            return
+        with self._lock:
+            self._state = {key: entry for key, entry in self._state.items() if os.path.exists(key)}
+            if not self._state:
+                try:
+                    self.state_path.unlink()
+                except FileNotFoundError:
+                    pass
+                return
+            tmp_path = self.state_path.with_suffix('.tmp')
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.state_path)
+
+    def mark_closed(self, paths):
+        """Registra archivos que el kernel reportó como cerrados tras escribirse"""
+        now = time.time()
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            with self._lock:
+                self._state[str(path)] = {
+                    'sig': [stat.st_size, stat.st_mtime_ns],
+                    'since': now,
+                    'closed': True,
+                    'next': now,
+                }
+
+    def check(self, path):
+        """Retorna True si el archivo está listo, False si se difiere y None si ya no existe"""
+        key = str(path)
+        try:
+            stat = os.stat(key)
+        except FileNotFoundError:
+            with self._lock:
+                self._state.pop(key, None)
+            return None
+
+        now = time.time()
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            entry = self._state.get(key)
+            if entry is None or entry['sig'] != signature:
+                # Primera vez que se ve, o cambió desde el último escaneo
+                entry = {'sig': signature, 'since': now, 'closed': False}
+                self._state[key] = entry
+
+        quiet = (
+            entry['closed']
+            or now - entry['since'] >= self.quiescence
+            # Archivos que ya estaban en la carpeta: su mtime basta como reposo
+            or now - stat.st_mtime >= self.quiescence
+        )
+        if stat.st_size and quiet:
+            if has_pdf_trailer(key):
+                self.forget(key)
+                return True
+            if self.trailer_grace is not None and now - entry['since'] >= self.trailer_grace:
+                self.log('warning', f'⚠️  {Path(key).name} no termina en %%EOF; se importa tras '
+                                    f'{self.trailer_grace:.0f}s sin cambios')
+                self.forget(key)
+                return True
+
+        with self._lock:
+            wait = self.quiescence - (now - entry['since']) if not quiet else self.quiescence
+            entry['next'] = now + max(wait, MIN_RECHECK_SECONDS)
+        return False
+
+    def split(self, paths, map_func=map):
+        """Separa ``paths`` en (listos, diferidos); los archivos que desaparecieron se descartan"""
+        ready, deferred = [], []
+        for path, status in zip(paths, map_func(self.check, paths)):
+            if status:
+                ready.append(path)
+            elif status is not None:
+                deferred.append(path)
+        return ready, deferred
+
+    def forget(self, path):
+        with self._lock:
+            self._state.pop(str(path), None)
+
+    def due(self):
+        """Archivos diferidos cuya próxima revisión ya llegó"""
+        now = time.time()
+        with self._lock:
+            return [Path(key) for key, entry in self._state.items() if entry.get('next', 0) <= now]
+
+    def next_check(self):
+        """Segundos hasta la próxima revisión pendiente (None si no hay archivos diferidos)"""
+        with self._lock:
+            pending = [entry.get('next', 0) for entry in self._state.values()]
+        if not pending:
+            return None
+        return max(min(pending) - time.time(), 0.0)
@@ -0,0 +1,144 @@
+"""Respuestas de archivo en streaming con soporte de ``Range`` (206 Partial Content).
+
+El visor de PDF del navegador pide primero el final del archivo (la tabla
+de referencias) y luego solo los rangos de las páginas que muestra: con un
+PDF linealizado la primera página aparece sin descargar el resto. Aquí se
+atiende un rango (``Content-Range``) o varios (``multipart/byteranges``)
+leyendo el archivo por bloques, así que la memoria por petición es
+constante sin importar el tamaño del PDF.
+
+Un ``Range`` mal formado se ignora (se entrega el archivo completo, como
+manda la RFC 9110); uno que no se puede satisfacer responde 416. Si la
+petición trae ``If-Range`` y el archivo cambió, también se entrega completo.
+"""
+import os
+import re
+import uuid
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+CHUNK_SIZE = 64 * 1024
+# Más rangos que esto en una petición no es un visor sino un abuso: se entrega el archivo completo
+MAX_RANGES = 50
+
+_RANGE_RE = re.compile(r'^(\d*)-(\d*)$')
+
+
+def parse_range_header(header, size):
+    """Rangos ``[(inicio, fin)]`` (inclusivos, ordenados y fusionados) pedidos en ``header``.
+
+    Retorna None si el encabezado no aplica (ausente o mal formado) y ``[]``
+    si ningún rango se puede satisfacer.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    specs = [spec.strip() for spec in header[len('bytes='):].split(',')]
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        match = _RANGE_RE.match(spec)
+        if not match or match.group(0) == '-':
+            return None
+        first, last = match.groups()
+        if not first:
+            # Sufijo: los últimos ``last`` bytes
+            if int(last):
+                ranges.append((max(size - int(last), 0), size - 1))
+            continue
+        first = int(first)
+        if last and int(last) < first:
+            return None
+        if first < size:
+            ranges.append((first, min(int(last), size - 1) if last else size - 1))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _file_stat(file):
+    """Tamaño y fecha de modificación (None si no es un archivo en disco, p. ej. ``BytesIO``)"""
+    try:
+        stat = os.fstat(file.fileno())
+        return stat.st_size, stat.st_mtime
+    except (AttributeError, OSError, ValueError):
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        return size, None
+
+
+def _read(file, start, end, chunk_size):
+    file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = file.read(min(chunk_size, remaining))
+        if not data:
+            return
+        remaining -= len(data)
+        yield data
+
+
+def _stream(file, parts, chunk_size):
+    """Recorre ``parts`` (bytes o rangos del archivo) y cierra el archivo al terminar"""
+    try:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield from _read(file, *part, chunk_size)
+    finally:
+        file.close()
+
+
+def ranged_file_response(request, file, content_type, chunk_size=CHUNK_SIZE):
+    """Respuesta en streaming de ``file`` (abierto en binario) que respeta ``Range`` e ``If-Range``.
+
+    La respuesta se encarga de cerrar el archivo.
+    """
+    size, mtime = _file_stat(file)
+    etag = f'"{size:x}-{int(mtime * 1000):x}"' if mtime is not None else None
+
+    ranges = None
+    if_range = request.headers.get('If-Range')
+    # Con If-Range, los rangos solo valen si el archivo sigue siendo el mismo que tiene el cliente
+    if not if_range or (etag and if_range in (etag, http_date(mtime))):
+        ranges = parse_range_header(request.headers.get('Range'), size)
+
+    if ranges == []:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif not ranges:
+        response = StreamingHttpResponse(_stream(file, [(0, size - 1)], chunk_size), content_type=content_type)
+        response['Content-Length'] = size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(_stream(file, ranges, chunk_size), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for start, end in ranges:
+            parts.append((
+                f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode())
+            parts.append((start, end))
+        parts.append(f'\r\n--{boundary}--\r\n'.encode())
+        response = StreamingHttpResponse(
+            _stream(file, parts, chunk_size), status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = sum(len(part) if isinstance(part, bytes) else part[1] - part[0] + 1 for part in parts)
+
+    response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+    return response
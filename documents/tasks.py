@@ -1,14 +1,444 @@
-from celery import shared_task
-import shutil
+import logging
+import uuid
+from datetime import timedelta
+from celery import Task, chain, shared_task, group
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
 from pathlib import Path
+from .placement import copy_file, move_file
+from .scanner import iter_batches
+
+logger = logging.getLogger(__name__)
+
+def ingest_chunk_size():
+    """Archivos por tarea al despachar una importación"""
+    return getattr(settings, 'INGEST_CHUNK_SIZE', 100)
+
+def ingest_group_size():
+    """Tareas por grupo al despachar una importación"""
+    return getattr(settings, 'INGEST_GROUP_SIZE', 20)
+
+class SettingsRateLimitTask(Task):
+    """Tarea cuyo ``rate_limit`` se lee de ``rate_limit_setting`` cada vez que el worker lo consulta.
+
+    Un valor asignado en tiempo de ejecución (``celery control rate_limit``) tiene prioridad.
+    """
+    rate_limit_setting = None
+    _rate_limit = None
+
+    @property
+    def rate_limit(self):
+        if self._rate_limit is not None:
+            return self._rate_limit
+        return getattr(settings, self.rate_limit_setting, None) if self.rate_limit_setting else None
+
+    @rate_limit.setter
+    def rate_limit(self, value):
+        self._rate_limit = value
 
 def move_to_processed(source_path, processed_path):
-    shutil.move(source_path, processed_path)
+    move_file(source_path, processed_path)
 
 def copy_to_pending(processed_path, pending_path):
-    shutil.copy2(processed_path, pending_path)
+    copy_file(processed_path, pending_path)
 
 @shared_task
 def process_document(source_path, processed_path, pending_path):
     move_to_processed(source_path, processed_path)
-    copy_to_pending(processed_path, pending_path)
\ No newline at end of file
+    copy_to_pending(processed_path, pending_path)
+
+def _update_job(job_id, **increments):
+    """Suma contadores al trabajo y lo cierra cuando ya se procesó todo lo despachado"""
+    from .models import IngestionJob
+
+    IngestionJob.objects.filter(pk=job_id).update(
+        status='running',
+        **{name: F(name) + value for name, value in increments.items()}
+    )
+    _finish_job_if_complete(job_id)
+
+def _fail_job_on_last_retry(task, job_id, count, error):
+    """Cuenta ``count`` archivos como fallidos si ``task`` ya no se va a reintentar.
+
+    Sin esto un OperationalError persistente deja el trabajo en cola para siempre.
+    """
+    if task.request.retries < task.max_retries:
+        return
+    from .models import IngestionJob
+
+    try:
+        IngestionJob.objects.filter(pk=job_id).update(message=str(error))
+        _update_job(job_id, failed=count)
+    except OperationalError as e:
+        logger.error(f'No se pudo marcar como fallido el trabajo {job_id}: {e}')
+
+def _finish_job_if_complete(job_id):
+    from .models import IngestionJob
+
+    # Un solo UPDATE condicional: no importa qué tarea termine última
+    IngestionJob.objects.filter(
+        pk=job_id,
+        dispatched=True,
+        status__in=['queued', 'running'],
+        total__lte=F('processed') + F('skipped') + F('failed'),
+    ).update(status=Case(When(failed=0, then=Value('done')), default=Value('failed')))
+
+@shared_task(
+    bind=True,
+    autoretry_for=(OperationalError,),
+    retry_backoff=True,
+    retry_jitter=True,
+    max_retries=5,
+    base=SettingsRateLimitTask,
+    rate_limit_setting='INGEST_TASK_RATE_LIMIT',
+    acks_late=True,
+)
+def ingest_chunk(self, job_id, paths):
+    """Importa un lote de archivos de la carpeta de monitoreo.
+
+    Se enruta a la cola 'ingest', que debe correr con concurrencia 1: es el
+    único escritor de la BD y de la bitácora de importación. Si la BD está
+    bloqueada (OperationalError) la tarea se reintenta con espera exponencial;
+    lo que haya quedado a medias se recupera con ``sync_documents --recover``.
+    """
+    from .ingestion import FolderIngestor, IngestionStats
+
+    ingestor = FolderIngestor(workers=getattr(settings, 'INGEST_TASK_FILE_WORKERS', 1))
+    if not ingestor.prepare():
+        _update_job(job_id, failed=len(paths))
+        return {'processed': 0, 'skipped': 0, 'failed': len(paths)}
+
+    existing = [p for p in paths if Path(p).exists()]
+    try:
+        stats = ingestor.ingest(existing, IngestionStats())
+    except OperationalError as e:
+        _fail_job_on_last_retry(self, job_id, len(paths), e)
+        raise
+    # Los archivos que desaparecieron antes de la tarea (p. ej. ya importados) cuentan como omitidos,
+    # igual que los que aún se están escribiendo: los toma la siguiente sincronización
+    skipped = stats.skipped + stats.deferred + len(paths) - len(existing)
+
+    _update_job(
+        job_id,
+        processed=stats.processed,
+        skipped=skipped,
+        failed=stats.failed,
+        bytes_processed=stats.bytes_processed,
+    )
+    return {'processed': stats.processed, 'skipped': skipped, 'failed': stats.failed}
+
+@shared_task(
+    bind=True,
+    autoretry_for=(OperationalError,),
+    retry_backoff=True,
+    max_retries=5,
+    acks_late=True,
+)
+def process_upload(self, document_id, job_id=None):
+    """Mueve un PDF subido a 'processed' y deja su copia en 'Pending'"""
+    from .ingestion import place_uploaded_document
+    from .models import Document
+
+    try:
+        document = Document.objects.get(pk=document_id)
+        place_uploaded_document(document)
+    except OperationalError as e:
+        if job_id:
+            _fail_job_on_last_retry(self, job_id, 1, e)
+        raise
+    except Exception as e:
+        if job_id:
+            from .models import IngestionJob
+            IngestionJob.objects.filter(pk=job_id).update(message=str(e))
+            _update_job(job_id, failed=1)
+        raise
+    if job_id:
+        _update_job(job_id, processed=1)
+
+def dispatch_folder_ingestion(paths, user=None, chunk_size=None):
+    """Encola la importación de ``paths`` en grupos de tareas y retorna el IngestionJob.
+
+    Los archivos se agrupan en lotes de ``chunk_size`` (una tarea por lote) y
+    los lotes en grupos de ``INGEST_GROUP_SIZE`` tareas, así el listado se
+    consume de forma incremental aunque tenga cientos de miles de archivos.
+    """
+    from .models import IngestionJob
+
+    job = IngestionJob.objects.create(kind='folder', created_by=user)
+    chunks = iter_batches((str(p) for p in paths), chunk_size or ingest_chunk_size())
+    for chunk_group in iter_batches(chunks, ingest_group_size()):
+        IngestionJob.objects.filter(pk=job.pk).update(total=F('total') + sum(len(c) for c in chunk_group))
+        group(ingest_chunk.s(job.pk, chunk) for chunk in chunk_group).apply_async()
+
+    IngestionJob.objects.filter(pk=job.pk).update(dispatched=True)
+    _finish_job_if_complete(job.pk)
+    job.refresh_from_db()
+    return job
+
+def dispatch_upload(document, user=None):
+    """Crea el trabajo de una subida manual y encola su procesamiento al confirmar la transacción"""
+    from .models import IngestionJob
+
+    job = IngestionJob.objects.create(kind='upload', total=1, dispatched=True, created_by=user)
+    transaction.on_commit(lambda: process_upload.delay(document.pk, job.pk))
+    return job
+
+@shared_task(acks_late=True)
+def generate_thumbnails(document_ids):
+    """Etapa del pipeline: miniaturas de las primeras páginas de cada documento"""
+    from .models import Document
+    from .thumbnails import generate_thumbnails as render_thumbnails
+
+    created = 0
+    for document in Document.objects.filter(pk__in=document_ids).only('id', 'file', 'content_hash'):
+        try:
+            created += render_thumbnails(document)
+        except Exception as e:
+            logger.warning(f'No se pudieron generar miniaturas del documento {document.pk}: {e}')
+    return created
+
+@shared_task(acks_late=True)
+def extract_text(document_ids):
+    """Etapa del pipeline: extrae la capa de texto y actualiza el índice de búsqueda"""
+    from .models import Document
+    from .search import extract_document_text, save_texts
+
+    results = []
+    for document in Document.objects.filter(pk__in=document_ids).only('id', 'file'):
+        try:
+            text, pages = extract_document_text(document.file.path)
+        except Exception as e:
+            logger.warning(f'No se pudo extraer el texto del documento {document.pk}: {e}')
+            continue
+        results.append((document.pk, text, pages))
+    save_texts(results)
+    return len(results)
+
+@shared_task(acks_late=True, base=SettingsRateLimitTask, rate_limit_setting='OCR_TASK_RATE_LIMIT')
+def ocr_pages(document_ids):
+    """Etapa opcional del pipeline (``OCR_ENABLED``): OCR de las páginas sin capa de texto.
+
+    Se enruta a la cola 'ocr' (pocos procesos); cada página se guarda al
+    reconocerse, así que una tarea interrumpida continúa donde quedó.
+    """
+    if not getattr(settings, 'OCR_ENABLED', False):
+        return 0
+    from .models import Document
+    from .ocr import (
+        RateLimiter, finalize, iter_ocr_pages, ocr_available, ocr_candidates, ocr_settings,
+        remaining_pages, save_page_texts,
+    )
+
+    options = ocr_settings()
+    if not ocr_available(options['command']):
+        logger.warning(f"OCR_ENABLED está activo pero no se encontró {options['command']}")
+        return 0
+    limiter = RateLimiter(getattr(settings, 'OCR_PAGES_PER_MINUTE', 0))
+    documents = list(ocr_candidates(Document.objects.filter(pk__in=document_ids)).only('id', 'file', 'page_count'))
+    for document, pages in remaining_pages(documents):
+        try:
+            for result in iter_ocr_pages(document.file.path, pages, **options):
+                save_page_texts(document.pk, [result])
+                limiter.wait()
+        except Exception as e:
+            logger.warning(f'OCR incompleto del documento {document.pk}: {e}')
+    return len(finalize([document.pk for document in documents]))
+
+@shared_task(acks_late=True)
+def extract_dates(document_ids):
+    """Etapa del pipeline: detecta fecha del documento y vencimiento en el texto extraído"""
+    from .dates import extract_dates as parse_dates, save_extracted_dates
+    from .models import Document
+
+    texts = Document.objects.filter(pk__in=document_ids, text__isnull=False).values_list('id', 'text__text')
+    return save_extracted_dates((document_id, parse_dates(text)) for document_id, text in texts)
+
+@shared_task(acks_late=True)
+def suggest_classification(document_ids):
+    """Etapa del pipeline: sugiere categoría, tipo y entidad con el clasificador local"""
+    from .classifier import suggest
+
+    return suggest(document_ids)
+
+@shared_task(acks_late=True)
+def index_near_duplicates(document_ids):
+    """Etapa del pipeline: firma MinHash del texto para detectar casi duplicados"""
+    from .models import DocumentText
+    from .near_duplicates import save_signatures, signature
+
+    texts = DocumentText.objects.filter(document_id__in=document_ids).values_list('document_id', 'text')
+    return save_signatures((document_id, *signature(text)) for document_id, text in texts)
+
+@shared_task(acks_late=True)
+def index_related_documents(document_ids):
+    """Etapa del pipeline: vector TF-IDF del documento y sus vecinos para el panel de relacionados"""
+    from .related import index_documents
+
+    return len(index_documents(document_ids))
+
+@shared_task(acks_late=True)
+def optimize_pdfs(document_ids):
+    """Etapa opcional del pipeline (``PDF_OPTIMIZE``): derivado linealizado y con imágenes recomprimidas"""
+    if not getattr(settings, 'PDF_OPTIMIZE', False):
+        return 0
+    from .models import Document
+    from .optimize import derivative_name, optimize_pdf, optimize_settings, save_derivatives
+
+    options = optimize_settings()
+    results = []
+    documents = Document.objects.filter(pk__in=document_ids).only('id', 'file', 'content_hash').prefetch_related('derivatives')
+    for document in documents:
+        name = derivative_name(document, 'optimized')
+        try:
+            source = document.derivative_source_path('optimized')
+            result = optimize_pdf(source, Path(settings.MEDIA_ROOT) / name, **options)
+        except Exception as e:
+            logger.warning(f'No se pudo optimizar el documento {document.pk}: {e}')
+            continue
+        result.update(options)
+        results.append((document.pk, name, result))
+    return len(save_derivatives(results))
+
+@shared_task(acks_late=True)
+def split_scan_batches(document_ids):
+    """Etapa opcional del pipeline (``SCAN_SPLIT_MODE``): divide los lotes escaneados en un documento por segmento"""
+    from .splitting import find_segments, is_batch_candidate, split_batch, split_settings
+
+    options = split_settings()
+    if not options['mode']:
+        return 0
+    from .models import Document
+
+    created = 0
+    for document in Document.objects.filter(pk__in=document_ids, source_batch__isnull=True, status='pending'):
+        if not is_batch_candidate(document):
+            continue
+        try:
+            created += len(split_batch(document, find_segments(document.file.path, **options)))
+        except Exception as e:
+            logger.warning(f'No se pudo dividir el lote {document.pk}: {e}')
+    return created
+
+@shared_task(acks_late=True)
+def remove_blank_pages(document_ids):
+    """Etapa opcional del pipeline (``BLANK_PAGE_REMOVAL``): derivado sin las páginas en blanco"""
+    if not getattr(settings, 'BLANK_PAGE_REMOVAL', False):
+        return 0
+    from .models import Document
+    from .optimize import (
+        blank_page_threshold, derivative_name, discard_derivatives, remove_blank_pages as write_without_blanks,
+        save_derivatives,
+    )
+
+    threshold = blank_page_threshold()
+    results = []
+    for document in Document.objects.filter(pk__in=document_ids).only('id', 'file', 'content_hash'):
+        name = derivative_name(document, 'blank_removed')
+        try:
+            result = write_without_blanks(document.file.path, Path(settings.MEDIA_ROOT) / name, threshold)
+        except Exception as e:
+            logger.warning(f'No se pudieron quitar las páginas en blanco del documento {document.pk}: {e}')
+            continue
+        if result:
+            results.append((document.pk, name, result))
+    derivatives = save_derivatives(results, 'blank_removed')
+    discard_derivatives([d.document_id for d in derivatives], 'optimized')
+    return len(derivatives)
+
+# Etapas que se ejecutan sobre los documentos recién importados (cola 'pipeline').
+# Cada lista es una secuencia (la sugerencia necesita el texto extraído) y las
+# secuencias corren en paralelo entre sí
+POST_INGEST_STAGES = [
+    [split_scan_batches],
+    [generate_thumbnails],
+    [extract_text, ocr_pages, extract_dates, suggest_classification, index_near_duplicates,
+     index_related_documents],
+    [remove_blank_pages, optimize_pdfs],
+]
+
+PIPELINE_MODES = ('queue', 'celery', 'inline')
+
+def pipeline_mode():
+    mode = getattr(settings, 'DOCUMENT_PIPELINE', 'queue')
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f'DOCUMENT_PIPELINE inválido: {mode}')
+    return mode
+
+def run_post_ingest(document_ids):
+    """Ejecuta todas las etapas en este proceso; un error en una etapa no detiene las demás"""
+    for stages in POST_INGEST_STAGES:
+        for stage in stages:
+            try:
+                stage(document_ids)
+            except Exception as e:
+                logger.warning(f'Etapa {stage.name} falló para {len(document_ids)} documentos: {e}')
+
+def dispatch_post_ingest(document_ids):
+    """Programa las etapas posteriores a la importación para ``document_ids``.
+
+    Renderizar y extraer texto tarda mucho más que importar, así que por
+    defecto nunca se hace en el proceso que importa (el único escritor de
+    ``sync_documents``/``watch_documents``) ni en una petición web:
+
+    - ``DOCUMENT_PIPELINE = 'queue'`` (por defecto): una fila por documento en
+      ``PipelineQueueEntry``, que drena ``process_pipeline`` en otro proceso.
+    - ``'celery'``: un grupo de cadenas en la cola 'pipeline' al confirmar la transacción.
+    - ``'inline'``: en este mismo proceso (pruebas y ``benchmark_ingestion --pipeline``).
+    """
+    document_ids = list(document_ids)
+    if not document_ids:
+        return
+    mode = pipeline_mode()
+    if mode == 'queue':
+        from .models import PipelineQueueEntry
+
+        PipelineQueueEntry.objects.bulk_create(
+            [PipelineQueueEntry(document_id=document_id) for document_id in document_ids], ignore_conflicts=True
+        )
+    elif mode == 'celery':
+        transaction.on_commit(
+            lambda: group(
+                chain(stage.si(document_ids) for stage in stages) for stages in POST_INGEST_STAGES
+            ).apply_async()
+        )
+    else:
+        run_post_ingest(document_ids)
+
+def claim_post_ingest(limit):
+    """Reclama hasta ``limit`` documentos de la cola y retorna ``(token, ids)``.
+
+    Una fila reclamada hace más de ``PIPELINE_CLAIM_TIMEOUT`` segundos es de
+    un worker que se cayó y se vuelve a reclamar; tras ``PIPELINE_MAX_ATTEMPTS``
+    intentos (p. ej. un PDF que tumba al proceso) se deja de intentar.
+    """
+    from .models import PipelineQueueEntry
+
+    now = timezone.now()
+    claimable = PipelineQueueEntry.objects.filter(
+        Q(claimed_at__isnull=True) |
+        Q(claimed_at__lt=now - timedelta(seconds=getattr(settings, 'PIPELINE_CLAIM_TIMEOUT', 3600))),
+        attempts__lt=getattr(settings, 'PIPELINE_MAX_ATTEMPTS', 3),
+    )
+    candidates = list(claimable.order_by('queued_at').values_list('document_id', flat=True)[:limit])
+    if not candidates:
+        return None, []
+    token = uuid.uuid4().hex
+    # El UPDATE repite la condición: una fila que otro worker reclamó entre ambas consultas no se pisa
+    claimable.filter(document_id__in=candidates).update(claimed_at=now, claimed_by=token, attempts=F('attempts') + 1)
+    return token, list(PipelineQueueEntry.objects.filter(claimed_by=token).values_list('document_id', flat=True))
+
+def drain_post_ingest(batch_size=20, limit=None):
+    """Ejecuta las etapas de los documentos en cola, por lotes, hasta vaciarla. Retorna cuántos se procesaron"""
+    from .models import PipelineQueueEntry
+
+    processed = 0
+    while limit is None or processed < limit:
+        token, document_ids = claim_post_ingest(batch_size if limit is None else min(batch_size, limit - processed))
+        if not document_ids:
+            break
+        run_post_ingest(document_ids)
+        PipelineQueueEntry.objects.filter(claimed_by=token).delete()
+        processed += len(document_ids)
+    return processed
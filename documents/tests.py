@@ -1,3 +1,1987 @@
-from django.test import TestCase
+import errno
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from unittest import mock, skipUnless
+
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from doctrac.celery import app as celery_app
+from . import classifier as classifier_module, journal as stages, placement
+from .cache import BoundedFileCache
+from .ingestion import FolderIngestor, IngestionStats, compute_file_hash, place_pdf, unique_pending_name
+from .journal import IngestionJournal
+from .classifier import NaiveBayesClassifier, train
+from .dates import extract_dates, save_extracted_dates
+from .ocr import ocr_available, ocr_candidates
+from .models import (
+    Category, Document, DocumentDerivative, DocumentHistory, DocumentPageText, DocumentSuggestion, DocumentText, DocumentType,
+    Entity, IngestionJob, PipelineQueueEntry, RelatedIndexEntry, TermDocumentFrequency,
+)
+from .scanner import iter_batches, iter_pdfs
+from .stability import StabilityGate
+from .thumbnails import thumbnail_cache, thumbnail_key
+from .tasks import claim_post_ingest, dispatch_folder_ingestion, ingest_chunk, process_upload
+from .watcher import InotifyWatcher, PollingWatcher, create_watcher
+
+User = get_user_model()
+
+
+def write_pdf(path, body=b'', pages=1):
+    """Crea un PDF real con reportlab (mismo ``body`` = mismos bytes)"""
+    from reportlab.pdfgen import canvas
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pdf = canvas.Canvas(str(path), invariant=1)
+    for page in range(pages):
+        pdf.drawString(72, 720, f'Factura de prueba {body.decode()} - página {page + 1}')
+        pdf.showPage()
+    pdf.save()
+    return path
+
+
+class TemporaryFoldersMixin:
+    """Usa carpetas temporales como MEDIA_ROOT y MONITORED_FOLDER"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = Path(tempfile.mkdtemp())
+        self.media_root = self.tmp / 'Main'
+        self.work_folder = self.media_root / 'WorkFolder'
+        self.work_folder.mkdir(parents=True)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=str(self.media_root),
+            MAIN_FOLDER=str(self.media_root),
+            MONITORED_FOLDER=str(self.work_folder),
+            # Los PDFs de prueba se crean al instante: no esperar reposo
+            INGEST_STABLE_SECONDS=0,
+            # Las etapas posteriores corren al importar para poder verificarlas
+            DOCUMENT_PIPELINE='inline',
+            THUMBNAIL_CACHE_DIR=self.tmp / 'cache' / 'thumbnails',
+            PAGE_CACHE_DIR=self.tmp / 'cache' / 'pages',
+            WATERMARK_CACHE_DIR=self.tmp / 'cache' / 'watermarked',
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create_user('admin', password='secreto', role='admin')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        super().tearDown()
+
+    def ingest_pdfs(self, *paths):
+        """Importa ``paths`` como la sincronización y retorna sus documentos en el mismo orden"""
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest(list(paths))
+        return [Document.objects.get(original_filename=p.relative_to(self.work_folder).as_posix()) for p in paths]
+
+
+class IngestionHelpersTests(TestCase):
+    """Nombres en Pending y hash por bloques"""
+
+    def test_pending_names_are_unique_within_the_same_second(self):
+        second = datetime(2024, 5, 1, 10, 30, 0)
+        moments = [second.replace(microsecond=i * 997) for i in range(1000)]
+
+        names = [unique_pending_name('factura.pdf', when) for when in moments]
+
+        self.assertEqual(len(set(names)), 1000)
+        # El prefijo ordena las copias en el orden en que se importaron
+        self.assertEqual(sorted(names), names)
+        self.assertTrue(all(name.startswith('20240501_103000_') and name.endswith('_factura.pdf') for name in names))
+
+    def test_same_instant_still_gets_a_random_suffix(self):
+        when = datetime(2024, 5, 1, 10, 30, 0, 123456)
+
+        first, second = unique_pending_name('factura.pdf', when), unique_pending_name('factura.pdf', when)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(first[:len('20240501_103000_123456_')], second[:len('20240501_103000_123456_')])
+
+    def test_hash_matches_sha256_across_buffer_boundaries(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'grande.pdf'
+            content = os.urandom(3 * 4096 + 123)
+            path.write_bytes(content)
+
+            # Varias lecturas, una exacta y una parcial al final
+            for chunk_size in (4096, 1000, len(content), 1024 * 1024):
+                self.assertEqual(compute_file_hash(path, chunk_size), hashlib.sha256(content).hexdigest())
+
+            path.write_bytes(b'')
+            self.assertEqual(compute_file_hash(path), hashlib.sha256(b'').hexdigest())
+
+
+def unsupported(code):
+    return mock.Mock(side_effect=OSError(code, os.strerror(code)))
+
+
+def fake_reflink(dst_fd, request, src_fd):
+    """Simula FICLONE copiando el contenido (tmpfs no soporta reflink)"""
+    assert request == placement.FICLONE
+    os.write(dst_fd, os.pread(src_fd, os.fstat(src_fd).st_size, 0))
+
+
+class FilePlacementTests(TestCase):
+    """Cadena enlace duro → reflink → copy_file_range/sendfile → copia"""
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.src = self.tmp / 'origen.pdf'
+        self.src.write_bytes(os.urandom(300 * 1024))
+        placement._capabilities.clear()
+        self.addCleanup(placement._capabilities.clear)
+
+    def assertSameContent(self, dst):
+        self.assertEqual(dst.read_bytes(), self.src.read_bytes())
+        self.assertEqual(compute_file_hash(dst), compute_file_hash(self.src))
+
+    def test_each_unsupported_strategy_falls_back_to_the_next(self):
+        cases = [
+            ('hardlink', {}),
+            ('reflink', {'link': unsupported(errno.EXDEV), 'ioctl': mock.Mock(side_effect=fake_reflink)}),
+            ('copy_file_range', {'link': unsupported(errno.EPERM), 'ioctl': unsupported(errno.EOPNOTSUPP)}),
+            ('copy_file_range', {
+                'link': unsupported(errno.EXDEV), 'ioctl': unsupported(errno.ENOTSUP),
+                'copy_file_range': unsupported(errno.EXDEV),
+            }),
+            ('copy', {
+                'link': unsupported(errno.EXDEV), 'ioctl': unsupported(errno.EOPNOTSUPP),
+                'copy_file_range': unsupported(errno.ENOSYS), 'sendfile': unsupported(errno.EINVAL),
+            }),
+        ]
+        for i, (expected, failures) in enumerate(cases):
+            with self.subTest(expected=expected, failing=sorted(failures)):
+                placement._capabilities.clear()
+                dst = self.tmp / f'destino_{i}.pdf'
+                with mock.patch('os.link', failures.get('link', os.link)), \
+                        mock.patch('fcntl.ioctl', failures.get('ioctl', unsupported(errno.EOPNOTSUPP))), \
+                        mock.patch('os.copy_file_range', failures.get('copy_file_range', os.copy_file_range)), \
+                        mock.patch('os.sendfile', failures.get('sendfile', os.sendfile)):
+                    self.assertEqual(placement.copy_file(self.src, dst, 'auto'), expected)
+                self.assertSameContent(dst)
+                self.assertEqual(os.stat(dst).st_ino == os.stat(self.src).st_ino, expected == 'hardlink')
+                self.assertEqual(sorted(p.name for p in self.tmp.iterdir() if p.name.startswith('destino')),
+                                 sorted(f'destino_{j}.pdf' for j in range(i + 1)))
+
+    def test_working_strategy_is_remembered_per_device_pair(self):
+        link = unsupported(errno.EXDEV)
+        with mock.patch('os.link', link), mock.patch('fcntl.ioctl', unsupported(errno.EOPNOTSUPP)):
+            self.assertEqual(placement.copy_file(self.src, self.tmp / 'a.pdf', 'auto'), 'copy_file_range')
+            self.assertEqual(placement.copy_file(self.src, self.tmp / 'b.pdf', 'auto'), 'copy_file_range')
+
+        self.assertEqual(link.call_count, 1)
+        self.assertSameContent(self.tmp / 'b.pdf')
+
+    def test_fixed_strategy_falls_back_to_copy_and_real_errors_propagate(self):
+        with mock.patch('os.link', unsupported(errno.EXDEV)):
+            self.assertEqual(placement.copy_file(self.src, self.tmp / 'a.pdf', 'hardlink'), 'copy')
+        self.assertSameContent(self.tmp / 'a.pdf')
+
+        with mock.patch('os.link', unsupported(errno.EIO)), self.assertRaises(OSError):
+            placement.copy_file(self.src, self.tmp / 'b.pdf', 'auto')
+
+    def test_move_across_devices_copies_and_removes_source(self):
+        content = self.src.read_bytes()
+        dst = self.tmp / 'movido.pdf'
+
+        with mock.patch('os.rename', unsupported(errno.EXDEV)), mock.patch('os.link', unsupported(errno.EXDEV)), \
+                mock.patch('fcntl.ioctl', unsupported(errno.EOPNOTSUPP)):
+            self.assertEqual(placement.move_file(self.src, dst, 'auto'), 'copy_file_range')
+
+        self.assertFalse(self.src.exists())
+        self.assertEqual(dst.read_bytes(), content)
+
+
+class DuplicateFilterTests(TemporaryFoldersMixin, TestCase):
+    """Duplicados por nombre (sin hashear) y por contenido"""
+
+    def setUp(self):
+        super().setUp()
+        self.ingestor = FolderIngestor()
+        self.ingestor.prepare()
+
+    def test_known_names_are_skipped_without_hashing(self):
+        known = write_pdf(self.work_folder / 'conocido.pdf', b'viejo')
+        Document.objects.create(
+            title='conocido', original_filename='conocido.pdf', file='Pending/conocido.pdf',
+            category=self.ingestor.default_category, created_by=self.user,
+        )
+        new = write_pdf(self.work_folder / 'nuevo.pdf', b'nuevo')
+        stats = IngestionStats()
+
+        with mock.patch('documents.ingestion._safe_hash', wraps=compute_file_hash) as hashed:
+            new_files = self.ingestor.filter_new([known, new], stats)
+
+        self.assertEqual([call.args[0] for call in hashed.call_args_list], [new])
+        self.assertEqual([(f, name) for f, name, _ in new_files], [(new, 'nuevo.pdf')])
+        self.assertEqual(new_files[0][2], compute_file_hash(new))
+        self.assertEqual(stats.skipped, 1)
+
+    def test_renamed_and_in_batch_duplicates_are_skipped_by_hash(self):
+        original = write_pdf(self.work_folder / 'original.pdf', b'mismo')
+        self.ingestor.ingest([original])
+        renamed = write_pdf(self.work_folder / 'reescaneo.pdf', b'mismo')
+        first = write_pdf(self.work_folder / 'a.pdf', b'otro')
+        second = write_pdf(self.work_folder / 'b.pdf', b'otro')
+        stats = IngestionStats()
+
+        new_files = self.ingestor.filter_new([renamed, first, second], stats)
+
+        self.assertEqual([name for _, name, _ in new_files], ['a.pdf'])
+        self.assertEqual(stats.skipped, 2)
+
+
+class FolderScannerTests(TemporaryFoldersMixin, TestCase):
+    """Recorrido incremental y recursivo de la carpeta de monitoreo"""
+
+    def setUp(self):
+        super().setUp()
+        self.top = write_pdf(self.work_folder / 'raiz.pdf', b'raiz')
+        self.nested = write_pdf(self.work_folder / '2024-05-01' / 'turno' / 'a.PDF', b'a')
+        write_pdf(self.work_folder / 'borradores' / 'b.pdf', b'b')
+        write_pdf(self.work_folder / 'processed' / 'ya_importado.pdf')
+        write_pdf(self.work_folder / '.oculta' / 'c.pdf')
+        write_pdf(self.work_folder / '.temporal.pdf')
+        (self.work_folder / 'notas.txt').write_text('no es un PDF')
+
+    def test_top_level_only_by_default(self):
+        self.assertEqual(list(iter_pdfs(self.work_folder)), [self.top])
+
+    def test_recursive_skips_hidden_processed_and_excluded(self):
+        found = set(iter_pdfs(self.work_folder, recursive=True, exclude=['borradores']))
+
+        self.assertEqual(found, {self.top, self.nested})
+
+    def test_only_the_root_processed_folder_is_skipped(self):
+        client = write_pdf(self.work_folder / 'Clientes' / 'processed' / 'factura.pdf', b'cliente')
+
+        self.assertIn(client, set(iter_pdfs(self.work_folder, recursive=True)))
+
+    def test_patterns_match_relative_paths(self):
+        found = list(iter_pdfs(self.work_folder, recursive=True, include=['2024-*/*/*.pdf']))
+
+        self.assertEqual(found, [self.nested])
+
+    def test_scanner_is_lazy_and_batches_are_bounded(self):
+        pdfs = iter_pdfs(self.work_folder, recursive=True)
+
+        self.assertIsInstance(next(pdfs), Path)
+        self.assertEqual([len(batch) for batch in iter_batches(range(7), 3)], [3, 3, 1])
+
+    def test_sync_documents_imports_subfolders(self):
+        call_command('sync_documents', '--recursive', '--exclude', 'borradores', stdout=io.StringIO())
+
+        self.assertEqual(
+            set(Document.objects.values_list('original_filename', flat=True)),
+            {'raiz.pdf', '2024-05-01/turno/a.PDF'},
+        )
+        self.assertTrue((self.work_folder / 'borradores' / 'b.pdf').exists())
+
+    def test_sync_workfolder_lists_the_folder_once(self):
+        from . import admin_views
+
+        self.client.force_login(self.user)
+        url = reverse('documents:admin_sync_workfolder')
+        with mock.patch.object(admin_views, 'iter_pdfs', wraps=iter_pdfs) as scans:
+            data = self.client.post(url).json()
+
+        self.assertEqual(scans.call_count, 1)
+        self.assertEqual((data['processed_count'], data['pending_count']), (1, 0))
+
+        # La bitácora y el estado de estabilidad no cuentan como archivos procesados
+        (self.work_folder / 'processed' / '.ingest_journal.jsonl').touch()
+        self.assertEqual(self.client.get(url).context['processed_count'], 2)
+
+
+class BatchCommitTests(TemporaryFoldersMixin, TestCase):
+    """Inserción por lotes de documentos y de su historial inicial"""
+
+    def setUp(self):
+        super().setUp()
+        self.ingestor = FolderIngestor(batch_size=2)
+        self.ingestor.prepare()
+
+    def place(self, names):
+        return [
+            place_pdf(
+                write_pdf(self.work_folder / name, name.encode()), self.ingestor.processed_folder,
+                self.ingestor.pending_folder, compute_file_hash(self.work_folder / name), name,
+            )
+            for name in names
+        ]
+
+    def test_one_insert_per_chunk_for_documents_and_history(self):
+        paths = [write_pdf(self.work_folder / f'scan_{i}.pdf', str(i).encode()) for i in range(5)]
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = self.ingestor.ingest(paths)
+
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT INTO')]
+        self.assertEqual(sum(sql.startswith('INSERT INTO "documents_document" ') for sql in inserts), 3)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "documents_documenthistory" ') for sql in inserts), 3)
+        self.assertEqual(stats.processed, 5)
+        for document in Document.objects.all():
+            self.assertTrue(document.file.name.startswith('Pending/'))
+            self.assertTrue(Path(document.file.path).exists())
+
+    def test_bulk_history_rows_match_the_signal(self):
+        documents = self.ingestor.commit_batch(self.place(['a.pdf', 'b.pdf']), IngestionStats())
+
+        history = DocumentHistory.objects.order_by('document_id')
+        self.assertEqual(
+            list(history.values_list('document_id', 'previous_status', 'new_status', 'changed_by', 'change_reason')),
+            [(d.id, None, 'pending', self.user.id, 'Documento creado') for d in documents],
+        )
+
+    def test_failed_batch_is_retried_row_by_row(self):
+        placed = self.place(['a.pdf', 'b.pdf', 'c.pdf'])
+        # Otro proceso importó el mismo contenido entre el filtro de duplicados y la inserción
+        Document.objects.create(
+            title='otro', original_filename='otro.pdf', file='Pending/otro.pdf', content_hash=placed[1].content_hash,
+            category=self.ingestor.default_category, created_by=self.user,
+        )
+        stats = IngestionStats()
+
+        documents = self.ingestor.commit_batch(placed, stats)
+
+        self.assertEqual([d.original_filename for d in documents], ['a.pdf', 'c.pdf'])
+        self.assertEqual((stats.processed, stats.failed), (2, 1))
+        self.assertFalse(Document.objects.filter(original_filename='b.pdf').exists())
+        for document in documents:
+            self.assertEqual(document.history.count(), 1)
+
+
+class IngestionJournalTests(TemporaryFoldersMixin, TestCase):
+    """Bitácora de importación y ``sync_documents --recover``"""
+
+    def journal_path(self):
+        return self.work_folder / 'processed' / '.ingest_journal.jsonl'
+
+    def crash_before_commit(self, names):
+        """Importa ``names`` y simula una caída después de mover y copiar, antes de guardar en la BD"""
+        paths = [write_pdf(self.work_folder / name, name.encode()) for name in names]
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        with mock.patch.object(FolderIngestor, 'commit_batch', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                ingestor.ingest(paths)
+        return paths
+
+    def test_torn_last_line_is_ignored_on_replay(self):
+        journal = IngestionJournal(self.journal_path())
+        journal.record('a.pdf', stages.SEEN, source='a.pdf')
+        journal.record('a.pdf', stages.MOVED, processed_path='processed/a.pdf')
+        journal.record('b.pdf', stages.SEEN, source='b.pdf')
+        journal.record('b.pdf', stages.COMMITTED, document_id=1)
+        with open(self.journal_path(), 'a', encoding='utf-8') as f:
+            f.write('{"key": "a.pdf", "stage": "cop')
+
+        entries = IngestionJournal(self.journal_path()).load()
+
+        self.assertEqual(entries['a.pdf']['stage'], stages.MOVED)
+        self.assertEqual(entries['a.pdf']['source'], 'a.pdf')
+        self.assertEqual([e['key'] for e in IngestionJournal(self.journal_path()).pending()], ['a.pdf'])
+
+    def test_compaction_keeps_only_incomplete_entries(self):
+        journal = IngestionJournal(self.journal_path())
+        journal.record_many([
+            {'key': 'a.pdf', 'stage': stages.SEEN},
+            {'key': 'a.pdf', 'stage': stages.COPIED, 'pending_path': 'Pending/a.pdf'},
+            {'key': 'b.pdf', 'stage': stages.SEEN},
+            {'key': 'b.pdf', 'stage': stages.ABANDONED},
+            {'key': 'c.pdf', 'stage': stages.COMMITTED},
+        ])
+
+        journal.compact()
+
+        lines = self.journal_path().read_text(encoding='utf-8').splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(IngestionJournal(self.journal_path()).load(), {
+            'a.pdf': {'key': 'a.pdf', 'stage': stages.COPIED, 'pending_path': 'Pending/a.pdf'},
+        })
+
+        journal.record('a.pdf', stages.COMMITTED, document_id=1)
+        journal.compact()
+        self.assertFalse(self.journal_path().exists())
+
+    def test_recover_commits_files_moved_before_a_crash(self):
+        paths = self.crash_before_commit(['a.pdf', 'b.pdf'])
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(any(p.exists() for p in paths))
+        self.assertEqual(len(IngestionJournal(self.journal_path()).pending()), 2)
+
+        call_command('sync_documents', '--recover', stdout=io.StringIO())
+        call_command('sync_documents', '--recover', stdout=io.StringIO())
+
+        self.assertEqual(sorted(Document.objects.values_list('original_filename', flat=True)), ['a.pdf', 'b.pdf'])
+        self.assertEqual(DocumentHistory.objects.count(), 2)
+        for document in Document.objects.all():
+            self.assertTrue(Path(document.file.path).exists())
+        self.assertFalse(self.journal_path().exists())
+
+    def test_recover_is_idempotent_when_the_commit_was_not_journaled(self):
+        path = write_pdf(self.work_folder / 'a.pdf', b'a')
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        # La BD guardó el documento pero la caída impidió anotar la etapa 'committed'
+        with mock.patch.object(FolderIngestor, 'record_committed', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                ingestor.ingest([path])
+        self.assertEqual(Document.objects.count(), 1)
+
+        stats = FolderIngestor().recover()
+
+        self.assertEqual((stats.processed, stats.failed), (0, 0))
+        self.assertEqual(Document.objects.count(), 1)
+        self.assertFalse(self.journal_path().exists())
+
+    def test_recover_does_not_match_documents_without_hash(self):
+        # Documento anterior al cálculo de hashes que coincide por nombre con la bitácora
+        Document.objects.create(title='Viejo', original_filename='viejo.pdf', created_by=self.user)
+        source = write_pdf(self.work_folder / 'nuevo.pdf', b'nuevo')
+        IngestionJournal(self.journal_path()).record_many([
+            {'key': 'viejo.pdf', 'stage': stages.SEEN},
+            {'key': 'nuevo.pdf', 'stage': stages.SEEN, 'source': str(source)},
+        ])
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+
+        stats = ingestor.recover()
+
+        self.assertEqual(stats.processed, 1)
+        self.assertTrue(Document.objects.filter(original_filename='nuevo.pdf').exists())
+
+
+class ScriptedWatcher:
+    """Envuelve un watcher real: ejecuta un paso antes de cada espera y corta con Ctrl+C al final"""
+
+    def __init__(self, watcher, steps):
+        self.watcher = watcher
+        self.name = watcher.name
+        self.steps = list(steps)
+
+    def wait(self, timeout=None):
+        if not self.steps:
+            raise KeyboardInterrupt
+        self.steps.pop(0)()
+        return self.watcher.wait(5)
+
+    def __getattr__(self, name):
+        return getattr(self.watcher, name)
+
+
+class FolderWatcherTests(TemporaryFoldersMixin, TestCase):
+    """Eventos de la carpeta (y sus subcarpetas) que llegan hasta la importación"""
+
+    def inotify_watcher(self, **options):
+        try:
+            return InotifyWatcher(self.work_folder, **options)
+        except OSError as e:
+            self.skipTest(f'inotify no disponible: {e}')
+
+    def test_inotify_watches_existing_and_new_subfolders(self):
+        (self.work_folder / 'lunes').mkdir()
+        (self.work_folder / 'processed').mkdir()
+        watcher = self.inotify_watcher(recursive=True)
+        self.addCleanup(watcher.close)
+
+        existing = write_pdf(self.work_folder / 'lunes' / 'a.pdf')
+        write_pdf(self.work_folder / 'processed' / 'ya_importado.pdf')
+        self.assertEqual(watcher.wait(5), [existing])
+        self.assertEqual(watcher.take_closed(), [existing])
+
+        (self.work_folder / 'martes' / 'turno').mkdir(parents=True)
+        self.assertEqual(watcher.wait(5), [])
+        nested = write_pdf(self.work_folder / 'martes' / 'turno' / 'b.pdf')
+        self.assertEqual(watcher.wait(5), [nested])
+
+    def test_files_copied_with_a_new_subfolder_are_reported_but_not_closed(self):
+        watcher = self.inotify_watcher(recursive=True)
+        self.addCleanup(watcher.close)
+        staging = write_pdf(self.tmp / 'staging' / 'dia' / 'c.pdf').parent
+
+        # Una carpeta movida ya llena no genera eventos por sus archivos
+        staging.rename(self.work_folder / 'dia')
+
+        self.assertEqual(watcher.wait(5), [self.work_folder / 'dia' / 'c.pdf'])
+        self.assertEqual(watcher.take_closed(), [])
+
+    def test_non_recursive_watcher_ignores_subfolders(self):
+        watcher = self.inotify_watcher()
+        self.addCleanup(watcher.close)
+        write_pdf(self.work_folder / 'sub' / 'a.pdf')
+        top = write_pdf(self.work_folder / 'b.pdf')
+
+        self.assertEqual(watcher.wait(5), [top])
+
+    def test_polling_watcher_scans_subfolders(self):
+        watcher = PollingWatcher(self.work_folder, interval=0, recursive=True, exclude=['borradores'])
+        nested = write_pdf(self.work_folder / 'lunes' / 'a.pdf')
+        write_pdf(self.work_folder / 'borradores' / 'b.pdf')
+
+        self.assertEqual(watcher.wait(), [nested])
+        self.assertEqual(watcher.wait(), [])
+
+    @override_settings(MONITORED_FOLDER_RECURSIVE=True)
+    def test_watch_documents_ingests_files_from_events(self):
+        subfolder = self.work_folder / '2024-05-01'
+        steps = [
+            lambda: subfolder.mkdir(),
+            lambda: write_pdf(subfolder / 'evento.pdf', b'evento'),
+        ]
+
+        def scripted(*args, **kwargs):
+            kwargs['interval'] = 0.1
+            return ScriptedWatcher(create_watcher(*args, **kwargs), steps)
+
+        with mock.patch('documents.management.commands.watch_documents.create_watcher', scripted):
+            call_command('watch_documents', '--settle', '0', '--rescan', '0', stdout=io.StringIO())
+
+        document = Document.objects.get()
+        self.assertEqual(document.original_filename, '2024-05-01/evento.pdf')
+        self.assertFalse((subfolder / 'evento.pdf').exists())
+
+
+class BenchmarkCommandTests(TemporaryFoldersMixin, TestCase):
+    """Prueba de humo de ``benchmark_ingestion``"""
+
+    def test_reports_each_mode_and_leaves_no_documents(self):
+        output = self.tmp / 'bench.json'
+        database_name = settings.DATABASES['default']['NAME']
+
+        # Cada modo corre sobre su propio SQLite desechable: la BD real no recibe ninguna consulta
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                'benchmark_ingestion', '--files', '3', '--max-pages', '2', '--modes', 'sequential,batched',
+                '--corpus-dir', str(self.tmp / 'corpus'), '--output', str(output), stderr=io.StringIO(),
+            )
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(settings.DATABASES['default']['NAME'], database_name)
+
+        report = json.loads(output.read_text(encoding='utf-8'))
+        self.assertEqual(report['corpus']['files'], 3)
+        self.assertEqual([run['mode'] for run in report['runs']], ['sequential', 'batched'])
+        for run in report['runs']:
+            self.assertEqual((run['files'], run['failed']), (3, 0))
+            self.assertGreater(run['files_per_second'], 0)
+            self.assertGreater(run['queries'], 0)
+            self.assertGreaterEqual(run['peak_rss_mb'], run['rss_before_mb'])
+            self.assertGreaterEqual(run['peak_rss_delta_mb'], 0)
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(list(self.work_folder.iterdir()), [])
+
+    def test_pipeline_run_leaves_no_state_behind(self):
+        call_command(
+            'benchmark_ingestion', '--files', '2', '--max-pages', '1', '--modes', 'batched', '--pipeline',
+            '--corpus-dir', str(self.tmp / 'corpus'), stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+
+        # Ni las estadísticas del índice de relacionados ni las cachés llegan a la BD real o se quedan en disco
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(RelatedIndexEntry.objects.exists())
+        self.assertFalse(TermDocumentFrequency.objects.exists())
+        self.assertFalse((self.tmp / 'cache').exists())
+
+
+class AsyncIngestionTests(TemporaryFoldersMixin, TestCase):
+    """Importación vía Celery en modo eager (sin broker)"""
+
+    def setUp(self):
+        super().setUp()
+        # Con el espacio de nombres CELERY_ (config_from_object) la clave efectiva lleva el prefijo
+        self._eager = celery_app.conf.CELERY_TASK_ALWAYS_EAGER
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+
+    def tearDown(self):
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = self._eager
+        super().tearDown()
+
+    def uploaded_document(self):
+        write_pdf(self.media_root / 'documents' / 'subido.pdf', b'subido')
+        document = Document.objects.create(title='Subido', file='documents/subido.pdf', created_by=self.user)
+        job = IngestionJob.objects.create(kind='upload', total=1, dispatched=True, created_by=self.user)
+        return document, job
+
+    def run_upload(self, document, job):
+        """Ejecuta ``process_upload`` en este proceso, incluidos sus reintentos"""
+        propagates = celery_app.conf.CELERY_TASK_EAGER_PROPAGATES
+        # Con propagación activa el primer reintento se lanza como excepción en vez de ejecutarse
+        celery_app.conf.CELERY_TASK_EAGER_PROPAGATES = False
+        try:
+            process_upload.apply((document.pk, job.pk))
+        finally:
+            celery_app.conf.CELERY_TASK_EAGER_PROPAGATES = propagates
+        job.refresh_from_db()
+
+    def test_dispatch_folder_ingestion_imports_in_chunks(self):
+        paths = [write_pdf(self.work_folder / f'scan_{i}.pdf', str(i).encode()) for i in range(5)]
+
+        job = dispatch_folder_ingestion(paths, user=self.user, chunk_size=2)
+
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((job.total, job.processed, job.skipped, job.failed), (5, 5, 0, 0))
+        self.assertEqual(Document.objects.count(), 5)
+        self.assertEqual(DocumentHistory.objects.count(), 5)
+        self.assertFalse(any(p.exists() for p in paths))
+
+    def test_duplicates_and_missing_files_are_skipped(self):
+        original = write_pdf(self.work_folder / 'a.pdf', b'mismo contenido')
+        copy = write_pdf(self.work_folder / 'b.pdf', b'mismo contenido')
+        missing = self.work_folder / 'no_existe.pdf'
+
+        job = dispatch_folder_ingestion([original, copy, missing], user=self.user)
+
+        self.assertEqual((job.processed, job.skipped, job.failed), (1, 2, 0))
+        self.assertEqual(job.status, 'done')
+
+    def test_job_status_endpoint(self):
+        job = IngestionJob.objects.create(total=4, processed=1, dispatched=True, created_by=self.user)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('documents:ingestion_job_status', args=[job.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['progress'], 25)
+        self.assertFalse(response.json()['finished'])
+
+    def test_upload_retry_after_the_move_finishes_the_placement(self):
+        document, job = self.uploaded_document()
+
+        copy = mock.patch(
+            'documents.ingestion.copy_file', wraps=placement.copy_file, side_effect=[OperationalError('locked'), mock.DEFAULT]
+        )
+        with copy:
+            self.run_upload(document, job)
+
+        document.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.failed), ('done', 1, 0))
+        self.assertTrue(document.file.name.startswith('Pending/'))
+        self.assertTrue(Path(document.file.path).exists())
+        self.assertTrue((self.work_folder / 'processed' / 'subido.pdf').exists())
+
+    def test_job_fails_when_retries_are_exhausted(self):
+        document, job = self.uploaded_document()
+
+        with mock.patch('documents.ingestion.place_uploaded_document', side_effect=OperationalError('locked')) as place:
+            self.run_upload(document, job)
+
+        self.assertEqual(place.call_count, process_upload.max_retries + 1)
+        self.assertEqual((job.status, job.failed, job.message), ('failed', 1, 'locked'))
+
+    def test_limits_are_read_from_settings_when_used(self):
+        paths = [write_pdf(self.work_folder / f'scan_{i}.pdf', str(i).encode()) for i in range(3)]
+
+        with override_settings(INGEST_CHUNK_SIZE=1, INGEST_TASK_RATE_LIMIT='5/m'):
+            self.assertEqual(ingest_chunk.rate_limit, '5/m')
+            with mock.patch.object(ingest_chunk, 'run', wraps=ingest_chunk.run) as run:
+                dispatch_folder_ingestion(paths, user=self.user)
+
+        self.assertEqual(run.call_count, 3)
+
+
+class StabilityGateTests(TemporaryFoldersMixin, TestCase):
+    """Archivos que el escáner aún está escribiendo se difieren sin bloquear la importación"""
+
+    def test_file_without_trailer_is_deferred_until_complete(self):
+        path = self.work_folder / 'escaneo.pdf'
+        path.write_bytes(b'%PDF-1.4\nmedia pagina')
+        gate = StabilityGate(quiescence=0)
+
+        self.assertEqual(gate.split([path]), ([], [path]))
+        self.assertIsNotNone(gate.next_check())
+
+        with open(path, 'ab') as f:
+            f.write(b'\n%%EOF\n')
+        self.assertEqual(gate.split([path]), ([path], []))
+        self.assertIsNone(gate.next_check())
+
+    def test_recent_file_waits_for_quiescence_unless_closed(self):
+        path = write_pdf(self.work_folder / 'nuevo.pdf')
+        gate = StabilityGate(quiescence=60)
+
+        self.assertFalse(gate.check(path))
+        gate.mark_closed([path])
+        self.assertTrue(gate.check(path))
+
+    def test_ingestor_defers_and_persists_state_across_runs(self):
+        path = self.work_folder / 'lento.pdf'
+        path.write_bytes(b'%PDF-1.4\nsin terminar')
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+
+        stats = ingestor.ingest([path])
+
+        self.assertEqual((stats.processed, stats.deferred), (0, 1))
+        self.assertTrue(path.exists())
+        self.assertFalse(Document.objects.exists())
+        self.assertIn(str(path), FolderIngestor().gate._state)
+
+
+class PipelineQueueTests(TemporaryFoldersMixin, TestCase):
+    """Las etapas posteriores se encolan al importar y las ejecuta ``process_pipeline``"""
+
+    def setUp(self):
+        super().setUp()
+        self.pipeline_override = override_settings(DOCUMENT_PIPELINE='queue')
+        self.pipeline_override.enable()
+
+    def tearDown(self):
+        self.pipeline_override.disable()
+        super().tearDown()
+
+    def ingest(self, count=2):
+        paths = [write_pdf(self.work_folder / f'scan_{i}.pdf', str(i).encode()) for i in range(count)]
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest(paths)
+        return list(Document.objects.order_by('id'))
+
+    def test_ingest_only_enqueues_and_the_command_runs_the_stages(self):
+        documents = self.ingest()
+
+        self.assertEqual(sorted(PipelineQueueEntry.objects.values_list('document_id', flat=True)), [d.id for d in documents])
+        self.assertFalse(DocumentText.objects.exists())
+        self.assertIsNone(thumbnail_cache().get(thumbnail_key(documents[0], 1, 'small')))
+
+        out = io.StringIO()
+        call_command('process_pipeline', '--once', stdout=out)
+
+        self.assertIn('2 documentos procesados', out.getvalue())
+        self.assertFalse(PipelineQueueEntry.objects.exists())
+        self.assertEqual(DocumentText.objects.count(), 2)
+        self.assertIsNotNone(thumbnail_cache().get(thumbnail_key(documents[0], 1, 'small')))
+
+    def test_upload_request_does_not_render(self):
+        self.client.force_login(self.user)
+        path = write_pdf(self.tmp / 'subida.pdf', b'subida')
+        category = Category.objects.create(name='Facturas')
+
+        with open(path, 'rb') as f:
+            response = self.client.post(reverse('documents:document_create'), {
+                'title': 'Subida', 'category': category.pk, 'payment_status': 'not_applicable', 'file': f,
+            })
+
+        self.assertEqual(response.status_code, 302)
+        document = Document.objects.get()
+        self.assertTrue(PipelineQueueEntry.objects.filter(document=document).exists())
+        self.assertFalse(DocumentText.objects.exists())
+
+    def test_claims_are_exclusive_and_stale_claims_are_retried(self):
+        documents = self.ingest(3)
+
+        token, first = claim_post_ingest(2)
+        _, second = claim_post_ingest(2)
+        self.assertEqual(first, [d.id for d in documents[:2]])
+        self.assertEqual(second, [documents[2].id])
+        self.assertEqual(claim_post_ingest(2), (None, []))
+
+        # Un worker que se cayó deja sus filas reclamadas: vencido el plazo, se reintentan
+        with override_settings(PIPELINE_CLAIM_TIMEOUT=-1):
+            _, retried = claim_post_ingest(10)
+        self.assertEqual(sorted(retried), [d.id for d in documents])
+        self.assertEqual(set(PipelineQueueEntry.objects.values_list('attempts', flat=True)), {2})
+
+        # Tras agotar los intentos la fila queda en la cola, pero nadie la vuelve a reclamar
+        with override_settings(PIPELINE_CLAIM_TIMEOUT=-1, PIPELINE_MAX_ATTEMPTS=2):
+            self.assertEqual(claim_post_ingest(10), (None, []))
+        self.assertEqual(PipelineQueueEntry.objects.count(), 3)
+
+
+class ThumbnailTests(TemporaryFoldersMixin, TestCase):
+    """Miniaturas generadas al importar y servidas desde la caché LRU"""
+
+    def test_ingest_generates_thumbnails_served_by_endpoint(self):
+        write_pdf(self.work_folder / 'recibo.pdf', pages=2)
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([self.work_folder / 'recibo.pdf'])
+        document = Document.objects.get()
+
+        self.assertIsNotNone(thumbnail_cache().get(thumbnail_key(document, 1, 'small')))
+        self.assertIsNotNone(thumbnail_cache().get(thumbnail_key(document, 1, 'preview')))
+
+        self.client.force_login(self.user)
+        url = reverse('documents:document_thumbnail', args=[document.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        # Las páginas sin miniatura previa se renderizan a pedido; las inexistentes dan 404
+        self.assertEqual(self.client.get(url, {'page': 2}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'page': 3}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'size': 'enorme'}).status_code, 404)
+
+    def test_thumbnail_evicted_before_opening_is_regenerated(self):
+        from . import thumbnails
+
+        write_pdf(self.work_folder / 'recibo.pdf')
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([self.work_folder / 'recibo.pdf'])
+        document = Document.objects.get()
+        lookups = []
+
+        def evicted_once(*args):
+            # Otro proceso desaloja la miniatura justo después de la consulta
+            path = thumbnails.get_thumbnail(*args)
+            if not lookups:
+                path.unlink()
+            lookups.append(path)
+            return path
+
+        self.client.force_login(self.user)
+        with mock.patch('documents.views.get_thumbnail', side_effect=evicted_once):
+            response = self.client.get(reverse('documents:document_thumbnail', args=[document.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(lookups), 2)
+
+    def test_cache_evicts_least_recently_used_entries(self):
+        cache = BoundedFileCache(self.tmp / 'lru', max_bytes=250)
+        now = time.time()
+        for key, age in (('aa1', 300), ('bb2', 200)):
+            cache.put(key, b'x' * 100)
+            os.utime(cache.path_for(key), (now - age, now - age))
+
+        # Leer la entrada más antigua la marca como usada recientemente
+        self.assertIsNotNone(cache.get('aa1'))
+        cache.put('cc3', b'x' * 100)
+
+        self.assertIsNone(cache.get('bb2'))
+        self.assertIsNotNone(cache.get('aa1'))
+        self.assertIsNotNone(cache.get('cc3'))
+
+
+class FullTextSearchTests(TemporaryFoldersMixin, TestCase):
+    """Índice FTS5 alimentado con el texto extraído al importar"""
+
+    def ingest(self, *names):
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([write_pdf(self.work_folder / f'{name}.pdf', name.encode()) for name in names])
+
+    def search(self, text):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('documents:document_list'), {'search': text})
+        return list(response.context['documents'])
+
+    def test_finds_documents_by_pdf_content_with_snippet(self):
+        self.ingest('luz', 'agua')
+
+        results = self.search('factu prueba agua')
+
+        self.assertEqual([d.title for d in results], ['agua'])
+        self.assertIn('<mark>Factura</mark>', results[0].search_snippet_html)
+
+    def test_index_follows_renames_and_text_updates(self):
+        self.ingest('recibo')
+        document = Document.objects.get()
+        entity = Entity.objects.create(name='Compañía Eléctrica', value='electrica')
+        document.entity = entity
+        document.save()
+        entity.name = 'Acueductos'
+        entity.save()
+        DocumentText.objects.filter(document=document).update(text='hipoteca <script>')
+
+        self.assertEqual(len(self.search('acueductos')), 1)
+        self.assertEqual(self.search('electrica'), [])
+        self.assertIn('&lt;script&gt;', self.search('hipoteca')[0].search_snippet_html)
+
+    def test_reindex_command_extracts_missing_text(self):
+        self.ingest('seguro')
+        DocumentText.objects.all().delete()
+        self.assertEqual(self.search('factura'), [])
+
+        call_command('reindex_search', workers=2, stdout=io.StringIO())
+
+        self.assertEqual(len(self.search('factura')), 1)
+
+
+class PdfMetadataTests(TemporaryFoldersMixin, TestCase):
+    """Tamaño, páginas y versión guardados al importar (sin consultar el disco después)"""
+
+    def test_ingest_stores_metadata_and_list_sorts_by_pages(self):
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([
+            write_pdf(self.work_folder / 'corto.pdf', b'corto', pages=1),
+            write_pdf(self.work_folder / 'largo.pdf', b'largo', pages=4),
+        ])
+
+        largo = Document.objects.get(title='largo')
+        self.assertEqual(largo.page_count, 4)
+        self.assertEqual(largo.pdf_version, '1.3')
+        self.assertIn('ReportLab', largo.pdf_producer)
+        self.assertFalse(largo.is_encrypted)
+        # El archivo puede desaparecer: el tamaño sale de la base de datos
+        os.remove(largo.file.path)
+        self.assertGreater(largo.file_size_bytes, 0)
+        self.assertEqual(largo.file_size, round(largo.file_size_bytes / 1024 / 1024, 2))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('documents:document_list'), {'sort': '-pages'})
+        self.assertEqual([d.title for d in response.context['documents']], ['largo', 'corto'])
+
+    def test_backfill_command_fills_missing_metadata(self):
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([write_pdf(self.work_folder / 'viejo.pdf', b'viejo', pages=2)])
+        Document.objects.update(file_size_bytes=None, page_count=None, pdf_version='')
+
+        call_command('backfill_metadata', workers=2, stdout=io.StringIO())
+
+        document = Document.objects.get()
+        self.assertEqual(document.page_count, 2)
+        self.assertEqual(document.file_size_bytes, os.path.getsize(document.file.path))
+
+
+class ClassifierTests(TemporaryFoldersMixin, TestCase):
+    """Sugerencias de categoría, tipo y entidad aprendidas de los documentos revisados"""
+
+    def setUp(self):
+        super().setUp()
+        self.override_model = override_settings(CLASSIFIER_MODEL_PATH=self.tmp / 'classifier.json')
+        self.override_model.enable()
+        self.servicios = Category.objects.create(name='Servicios', value='servicios')
+        self.banco = Category.objects.create(name='Banco', value='banco')
+        self.factura = DocumentType.objects.create(name='Factura', value='factura', category=self.servicios)
+        self.estado = DocumentType.objects.create(name='Estado de cuenta', value='estado', category=self.banco)
+        self.luz = Entity.objects.create(name='Compañía Eléctrica', value='luz')
+        self.hipotecaria = Entity.objects.create(name='Banco Hipotecario', value='bh')
+        self.ingestor = FolderIngestor()
+        self.ingestor.prepare()
+
+    def tearDown(self):
+        self.override_model.disable()
+        super().tearDown()
+
+    def ingest(self, name, body):
+        self.ingestor.ingest([write_pdf(self.work_folder / f'{name}.pdf', body.encode())])
+        return Document.objects.get(original_filename=f'{name}.pdf')
+
+    def review(self, document, category, document_type, entity):
+        Document.objects.filter(pk=document.pk).update(
+            status='categorized', category=category, document_type=document_type, entity=entity
+        )
+
+    def test_suggestions_are_learned_and_shown_in_dashboard(self):
+        for i in range(3):
+            self.review(self.ingest(f'luz_{i}', f'electricidad kilovatios consumo {i}'),
+                        self.servicios, self.factura, self.luz)
+            self.review(self.ingest(f'bh_{i}', f'hipoteca préstamo intereses {i}'),
+                        self.banco, self.estado, self.hipotecaria)
+
+        call_command('train_classifier', stdout=io.StringIO())
+        pending = self.ingest('scan_nuevo', 'consumo de electricidad del mes')
+
+        suggestion = DocumentSuggestion.objects.get(document=pending)
+        self.assertEqual(suggestion.entity, self.luz)
+        self.assertEqual(suggestion.category, self.servicios)
+        self.assertEqual(suggestion.document_type, self.factura)
+        self.assertGreater(suggestion.entity_confidence, 0.6)
+
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('documents:document_data', args=[pending.pk])).json()
+        self.assertEqual(data['suggestions']['category']['id'], self.servicios.pk)
+        self.assertEqual(data['suggestions']['entity']['name'], 'Compañía Eléctrica')
+        self.assertContains(self.client.get(reverse('documents:dashboard')), 'fa-magic')
+
+    def test_incremental_training_only_learns_changes(self):
+        document = self.ingest('luz', 'electricidad kilovatios')
+        self.review(document, self.servicios, self.factura, self.luz)
+
+        self.assertEqual(train()[1], 1)
+        self.assertEqual(train()[1], 0)
+
+        self.review(document, self.banco, self.estado, self.hipotecaria)
+        classifier, learned = train()
+        self.assertEqual(learned, 1)
+        self.assertEqual(list(classifier.fields['entity']['class_docs']), [str(self.hipotecaria.pk)])
+
+    def replace_text(self, document, text):
+        """Simula el OCR reemplazando la capa de texto de un documento ya aprendido"""
+        DocumentText.objects.filter(document=document).update(text=text)
+
+    def assertSameModel(self, classifier):
+        rebuilt, _ = train(full=True)
+        self.assertEqual(classifier.n_docs, rebuilt.n_docs)
+        self.assertEqual(classifier.doc_freq, rebuilt.doc_freq)
+        self.assertEqual(classifier.fields, rebuilt.fields)
+        self.assertEqual(classifier.trained, rebuilt.trained)
+
+    def test_forget_after_text_change_retrains_instead_of_drifting(self):
+        luz = self.ingest('luz', 'electricidad kilovatios')
+        banco = self.ingest('banco', 'hipoteca intereses')
+        self.review(luz, self.servicios, self.factura, self.luz)
+        self.review(banco, self.banco, self.estado, self.hipotecaria)
+        train()
+
+        self.replace_text(luz, 'medidor tarifa residencial electricidad')
+        Document.objects.filter(pk=luz.pk).update(status='pending')
+        classifier, _ = train()
+
+        self.assertNotIn(str(luz.pk), classifier.trained)
+        self.assertNotIn('kilovatios', classifier.doc_freq)
+        self.assertNotIn('medidor', classifier.doc_freq)
+        self.assertSameModel(NaiveBayesClassifier.load())
+
+    def test_relabel_after_text_change_matches_a_full_retrain(self):
+        luz = self.ingest('luz', 'electricidad kilovatios')
+        self.review(luz, self.servicios, self.factura, self.luz)
+        train()
+
+        self.replace_text(luz, 'estado de cuenta hipoteca')
+        self.review(luz, self.banco, self.estado, self.hipotecaria)
+        classifier, learned = train()
+
+        self.assertEqual(learned, 1)
+        self.assertIn('hipoteca', classifier.doc_freq)
+        self.assertNotIn('kilovatios', classifier.doc_freq)
+        self.assertSameModel(classifier)
+
+    def test_unchanged_text_is_subtracted_exactly(self):
+        luz = self.ingest('luz', 'electricidad kilovatios consumo consumo')
+        self.review(luz, self.servicios, self.factura, self.luz)
+        train()
+
+        Document.objects.filter(pk=luz.pk).update(status='pending')
+        with mock.patch('documents.classifier._train', wraps=classifier_module._train) as passes:
+            classifier, learned = train()
+
+        # Sin reentrenar desde cero: una sola pasada incremental
+        self.assertEqual(passes.call_count, 1)
+        self.assertEqual(learned, 1)
+        self.assertEqual((classifier.n_docs, dict(classifier.doc_freq), classifier.learned_features), (0, {}, {}))
+
+
+class DateExtractionTests(TemporaryFoldersMixin, TestCase):
+    """Fecha del documento y vencimiento detectados en el texto del PDF"""
+
+    today = date(2024, 6, 1)
+
+    def document_date(self, text, **options):
+        return extract_dates(text, today=self.today, **options)['document_date']
+
+    def test_labels_and_formats(self):
+        extracted = extract_dates('Fecha: 15/01/2024\nFecha de vencimiento: 14 de febrero de 2024', today=self.today)
+        self.assertEqual(extracted['document_date'], (date(2024, 1, 15), 0.9))
+        self.assertEqual(extracted['due_date'], (date(2024, 2, 14), 0.9))
+
+        extracted = extract_dates('Invoice date: 2024-03-04  Payment due date: Apr 30, 2024', today=self.today)
+        self.assertEqual(extracted, {'document_date': (date(2024, 3, 4), 0.9), 'due_date': (date(2024, 4, 30), 0.9)})
+
+        # Sin etiqueta: la primera fecha, con confianza baja
+        self.assertEqual(self.document_date('San Juan, 5 de marzo de 2024'), (date(2024, 3, 5), 0.4))
+
+    def test_ambiguous_day_and_month(self):
+        # 03/04 se lee según el idioma de la etiqueta (o DATE_EXTRACTION_DAY_FIRST) y pierde confianza
+        self.assertEqual(self.document_date('Fecha: 03/04/2024'), (date(2024, 4, 3), 0.72))
+        self.assertEqual(self.document_date('Invoice date: 03/04/2024'), (date(2024, 3, 4), 0.72))
+        self.assertEqual(self.document_date('Fecha: 03/04/2024', day_first=False), (date(2024, 3, 4), 0.72))
+        # Un número mayor que 12 o ambos iguales no dejan duda
+        self.assertEqual(self.document_date('Invoice date: 13/04/2024'), (date(2024, 4, 13), 0.9))
+        self.assertEqual(self.document_date('Fecha: 04/04/2024'), (date(2024, 4, 4), 0.9))
+
+    def test_two_digit_years(self):
+        self.assertEqual(self.document_date('Fecha: 15.01.24'), (date(2024, 1, 15), 0.81))
+        # Como %y de strptime: 69-99 son del siglo XX
+        self.assertEqual(self.document_date('Fecha: 15/01/98'), (date(1998, 1, 15), 0.81))
+        # Fuera del rango plausible (1990 a tres años en el futuro) se descarta
+        self.assertIsNone(self.document_date('Fecha: 15/01/68'))
+
+    def test_due_date_before_issue_date_is_not_prefilled(self):
+        extracted = extract_dates('Fecha: 20/02/2024 Vence: 15/02/2024', today=self.today)
+        self.assertEqual(extracted['due_date'], (date(2024, 2, 15), 0.45))
+
+        document = Document.objects.create(title='Recibo', created_by=self.user)
+        save_extracted_dates([(document.pk, extracted)])
+
+        document.refresh_from_db()
+        # La sugerencia se guarda para revisión, pero no alcanza DATE_EXTRACTION_MIN_CONFIDENCE
+        self.assertEqual((document.document_date, document.due_date), (date(2024, 2, 20), None))
+        self.assertEqual(document.suggestion.due_date, date(2024, 2, 15))
+
+    def test_pipeline_and_bulk_command_prefill_dates(self):
+        document, = self.ingest_pdfs(write_pdf(self.work_folder / 'recibo.pdf', b'Fecha: 02/01/2024 Vence: 20/01/2024'))
+        self.assertEqual((document.document_date, document.due_date), (date(2024, 1, 2), date(2024, 1, 20)))
+
+        Document.objects.update(document_date=None, due_date=date(2024, 3, 1))
+        call_command('extract_dates', workers=2, stdout=io.StringIO())
+
+        document.refresh_from_db()
+        # Solo se completa lo que falta: el vencimiento elegido a mano se respeta
+        self.assertEqual((document.document_date, document.due_date), (date(2024, 1, 2), date(2024, 3, 1)))
+        self.assertEqual(document.suggestion.due_date_confidence, 0.9)
+
+
+def write_scanned_pdf(path, pages=1):
+    """PDF con páginas escaneadas simuladas: imagen con ruido en escala de grises a 200 dpi, sin pérdida"""
+    from PIL import Image, ImageDraw
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pdf = canvas.Canvas(str(path), invariant=1)
+    for page in range(pages):
+        image = Image.new('L', (1700, 2200), 235)
+        draw = ImageDraw.Draw(image)
+        for y in range(100, 2100, 30):
+            draw.text((100, y), f'Factura escaneada página {page + 1} línea {y} ' * 4, fill=20)
+        # Ruido del sensor: lo que hace que los escaneos reales compriman mal sin pérdida
+        image = Image.blend(image, Image.effect_noise(image.size, 40), 0.15)
+        pdf.drawImage(ImageReader(image), 0, 0, 612, 792)
+        pdf.showPage()
+    pdf.save()
+    return path
+
+
+class PdfOptimizationTests(TemporaryFoldersMixin, TestCase):
+    """Derivado linealizado y recomprimido que serve_document prefiere"""
+
+    @override_settings(PDF_OPTIMIZE=True)
+    def test_pipeline_creates_smaller_linearized_derivative_that_is_served(self):
+        import pikepdf
+
+        document, = self.ingest_pdfs(write_scanned_pdf(self.work_folder / 'escaneo.pdf', pages=2))
+
+        derivative = DocumentDerivative.objects.get(document=document, kind='optimized')
+        self.assertLess(derivative.size, derivative.original_size)
+        self.assertEqual(derivative.details['images'], 2)
+        with pikepdf.open(derivative.path) as pdf:
+            self.assertTrue(pdf.is_linearized)
+            self.assertEqual(len(pdf.pages), 2)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('documents:serve_document', args=[document.pk]))
+        self.assertEqual(int(response['Content-Length']), derivative.size)
+        response = self.client.get(reverse('documents:serve_document', args=[document.pk]), {'original': '1'})
+        self.assertEqual(int(response['Content-Length']), derivative.original_size)
+
+    def test_command_reports_bytes_saved(self):
+        self.ingest_pdfs(write_scanned_pdf(self.work_folder / 'escaneo.pdf'))
+
+        out = io.StringIO()
+        call_command('optimize_documents', workers=1, quality=60, stdout=out)
+
+        derivative = DocumentDerivative.objects.get()
+        self.assertEqual(derivative.details['quality'], 60)
+        self.assertIn('1 documentos optimizados', out.getvalue())
+
+    def test_images_are_downsampled_only_above_max_dpi(self):
+        import pikepdf
+        from .optimize import optimize_pdf
+
+        # La hoja escaneada mide 1700 píxeles de ancho sobre una página A4 (8.27 pulgadas): ~206 dpi
+        source = write_scanned_pdf(self.tmp / 'escaneo.pdf')
+        for max_dpi, width in ((100, 826), (300, 1700)):
+            result = optimize_pdf(source, self.tmp / f'{max_dpi}.pdf', max_dpi=max_dpi)
+            self.assertEqual(result['images'], 1)
+            with pikepdf.open(self.tmp / f'{max_dpi}.pdf') as pdf:
+                image, = pdf.pages[0].images.values()
+                self.assertEqual((image.Width, image.Filter), (width, pikepdf.Name.DCTDecode))
+
+    def test_text_only_pdf_is_linearized_without_touching_images(self):
+        import pikepdf
+        from .optimize import optimize_pdf
+
+        result = optimize_pdf(write_pdf(self.tmp / 'texto.pdf', pages=3), self.tmp / 'texto.opt.pdf')
+
+        self.assertEqual(result['images'], 0)
+        with pikepdf.open(self.tmp / 'texto.opt.pdf') as pdf:
+            self.assertTrue(pdf.is_linearized)
+
+    def test_derivative_that_is_not_smaller_is_discarded(self):
+        from .optimize import save_derivatives
+
+        document = Document.objects.create(title='Texto', created_by=self.user)
+        DocumentDerivative.objects.create(document=document, kind='optimized', file='viejo.pdf', size=1, original_size=2)
+        stale = self.media_root / 'Derivatives' / 'nuevo.pdf'
+        write_pdf(stale)
+
+        saved = save_derivatives([(document.pk, 'Derivatives/nuevo.pdf', {'original_size': 100, 'size': 100})])
+
+        # Se sigue entregando el original: ni el archivo ni el registro anterior sobreviven
+        self.assertEqual(saved, [])
+        self.assertFalse(stale.exists())
+        self.assertFalse(document.derivatives.exists())
+
+
+def write_batch_pdf(path, pages):
+    """Lote escaneado: una página por elemento; '' es una hoja en blanco escaneada (solo ruido)"""
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pdf = canvas.Canvas(str(path), invariant=1)
+    for text in pages:
+        if text:
+            pdf.drawString(72, 720, text)
+        else:
+            blank = Image.blend(Image.new('L', (425, 550), 240), Image.effect_noise((425, 550), 40), 0.15)
+            pdf.drawImage(ImageReader(blank), 0, 0, 612, 792)
+        pdf.showPage()
+    pdf.save()
+    return path
+
+
+class ScanBatchSplitTests(TemporaryFoldersMixin, TestCase):
+    """División de lotes escaneados en un documento por segmento"""
+
+    @override_settings(SCAN_SPLIT_MODE='blank', SCAN_SPLIT_FOLDER='Lotes')
+    def test_pipeline_splits_batches_on_blank_pages(self):
+        write_batch_pdf(
+            self.work_folder / 'Lotes' / 'lote.pdf',
+            ['Factura A pagina 1', 'Factura A pagina 2', '', 'Recibo B', '', '', 'Estado C'],
+        )
+        write_batch_pdf(self.work_folder / 'suelto.pdf', ['Factura D', '', 'Anexo D'])
+        batch, loose = self.ingest_pdfs(self.work_folder / 'Lotes' / 'lote.pdf', self.work_folder / 'suelto.pdf')
+
+        self.assertEqual(batch.status, 'scanned')
+        segments = list(batch.segments.order_by('id'))
+        self.assertEqual([s.source_pages for s in segments], ['1-2', '4-4', '7-7'])
+        self.assertEqual([s.page_count for s in segments], [2, 1, 1])
+        self.assertTrue(all(s.status == 'pending' and s.text for s in segments))
+        self.assertIn('Recibo B', segments[1].text.text)
+        # Fuera de SCAN_SPLIT_FOLDER no se divide
+        self.assertFalse(loose.segments.exists())
+
+    def test_command_splits_on_marker_pages(self):
+        batch, = self.ingest_pdfs(
+            write_batch_pdf(self.work_folder / 'lote.pdf', ['Factura A', 'DOCTRAC-SEPARADOR', 'Factura B', 'Anexo B'])
+        )
+
+        out = io.StringIO()
+        call_command('split_batches', batch.pk, mode='marker', workers=1, stdout=out)
+
+        self.assertEqual(list(batch.segments.order_by('id').values_list('source_pages', flat=True)), ['1-1', '3-4'])
+        self.assertIn('1 lotes divididos en 2 documentos', out.getvalue())
+
+    def test_separators_at_the_edges_or_in_a_row_make_no_empty_segments(self):
+        from .splitting import find_segments
+
+        path = write_batch_pdf(self.tmp / 'lote.pdf', ['', 'Factura A', '', '', 'Recibo B', ''])
+
+        self.assertEqual(find_segments(path, 'blank'), [(1, 2), (4, 5)])
+
+    def test_fixed_page_count_keeps_the_remainder(self):
+        from .splitting import find_segments
+
+        path = write_pdf(self.tmp / 'lote.pdf', pages=5)
+
+        self.assertEqual(find_segments(path, 'pages', pages=2), [(0, 2), (2, 4), (4, 5)])
+        with self.assertRaises(ValueError):
+            find_segments(path, 'hojas')
+
+    @override_settings(SCAN_SPLIT_FOLDER='Lotes')
+    def test_only_unsplit_batches_from_the_batch_folder_are_candidates(self):
+        from .splitting import is_batch_candidate, split_batch
+
+        def imported(**fields):
+            return Document(**{'imported_from_folder': True, 'status': 'pending', **fields})
+
+        batch = imported(original_filename='Lotes/lote.pdf')
+        self.assertTrue(is_batch_candidate(batch))
+        self.assertFalse(is_batch_candidate(imported(original_filename='lote.pdf')))
+        self.assertFalse(is_batch_candidate(imported(original_filename='Lotes/a.pdf', imported_from_folder=False)))
+        self.assertFalse(is_batch_candidate(imported(original_filename='Lotes/a.pdf', status='scanned')))
+
+        # Un solo segmento no es un lote: no se crea nada y el documento sigue pendiente
+        self.assertEqual(split_batch(batch, [(0, 3)]), [])
+        self.assertEqual(batch.status, 'pending')
+
+
+class OcrTests(TemporaryFoldersMixin, TestCase):
+    """OCR de las páginas escaneadas: reanudable y sin repetir páginas con capa de texto"""
+
+    def ingest_mixed_batch(self):
+        # Una página con capa de texto y una hoja escaneada (solo imagen)
+        return self.ingest_pdfs(
+            write_batch_pdf(self.work_folder / 'mixto.pdf', ['Factura de electricidad de marzo', ''])
+        )[0]
+
+    def test_command_resumes_from_saved_pages_and_indexes_text(self):
+        document = self.ingest_mixed_batch()
+        self.assertEqual(list(ocr_candidates()), [document])
+        # Una corrida anterior alcanzó a reconocer la página 2 antes de interrumpirse
+        DocumentPageText.objects.create(document=document, page_number=2, text='Recibo de agua potable', source='ocr')
+
+        out = io.StringIO()
+        call_command('ocr_documents', workers=1, pages_per_minute=0, stdout=out)
+
+        pages = list(document.page_texts.values_list('page_number', 'source'))
+        self.assertEqual(pages, [(1, 'pdf'), (2, 'ocr')])
+        text = DocumentText.objects.get(document=document)
+        self.assertEqual(text.source, 'ocr')
+        self.assertIn('Recibo de agua potable', text.text)
+        self.assertFalse(ocr_candidates().exists())
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('documents:document_list'), {'search': 'potable'})
+        self.assertContains(response, 'mixto')
+
+    @skipUnless(ocr_available(), 'tesseract no está instalado')
+    def test_pipeline_recognizes_image_only_pages(self):
+        with override_settings(OCR_ENABLED=True, OCR_PAGES_PER_MINUTE=0, OCR_LANGUAGE='eng'):
+            document = self.ingest_mixed_batch()
+        self.assertEqual(document.page_texts.count(), 2)
+        self.assertEqual(DocumentText.objects.get(document=document).source, 'ocr')
+
+    def test_only_pages_without_text_layer_go_through_tesseract(self):
+        from .ocr import iter_ocr_pages
+
+        path = write_batch_pdf(self.tmp / 'mixto.pdf', ['Factura de electricidad de marzo', '', 'Hoja'])
+        with mock.patch('documents.ocr.run_tesseract', return_value='Recibo de agua') as tesseract:
+            results = list(iter_ocr_pages(path, [0, 1, 2], dpi=72))
+
+        # 'Hoja' tiene capa de texto, pero no alcanza OCR_MIN_PAGE_CHARS
+        self.assertEqual([(number, source) for number, _, source in results], [(1, 'pdf'), (2, 'ocr'), (3, 'ocr')])
+        self.assertEqual(results[1][1], 'Recibo de agua')
+        self.assertEqual(tesseract.call_count, 2)
+
+    def test_candidates_skip_encrypted_and_documents_with_enough_text(self):
+        scanned, encrypted, typed, recognized = (
+            Document.objects.create(title=title, file=f'{title}.pdf', page_count=2, created_by=self.user)
+            for title in ('escaneado', 'cifrado', 'digital', 'reconocido')
+        )
+        Document.objects.filter(pk=encrypted.pk).update(is_encrypted=True)
+        DocumentText.objects.create(document=scanned, text='Hoja')
+        DocumentText.objects.create(document=typed, text='Factura de electricidad de marzo ' * 3)
+        DocumentText.objects.create(document=recognized, text='', source='ocr')
+
+        self.assertEqual(list(ocr_candidates()), [scanned])
+
+    def test_rate_limiter_spaces_pages(self):
+        from .ocr import RateLimiter
+
+        with mock.patch('documents.ocr.time') as clock:
+            clock.monotonic.return_value = 100.0
+            limiter = RateLimiter(per_minute=30)
+            limiter.wait()
+            limiter.wait()
+            RateLimiter(per_minute=0).wait()
+
+        clock.sleep.assert_called_once_with(2.0)
+
+
+class DocumentPageTests(TemporaryFoldersMixin, TestCase):
+    """Página individual de un documento como PDF o imagen, desde la caché de páginas"""
+
+    def setUp(self):
+        super().setUp()
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([write_pdf(self.work_folder / 'estado.pdf', b'paginas', pages=30)])
+        self.document = Document.objects.get()
+        self.client.force_login(self.user)
+
+    def test_serves_single_page_pdf_and_caches_it(self):
+        from .pages import page_cache, page_key
+        from .pdf_tools import extract_text
+
+        url = reverse('documents:document_page', args=[self.document.pk, 7])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        single = self.tmp / 'pagina.pdf'
+        single.write_bytes(b''.join(response.streaming_content))
+        text, pages = extract_text(single)
+        self.assertEqual(pages, 1)
+        self.assertIn('página 7', text)
+        self.assertIsNotNone(page_cache().get(page_key(self.document, 7, 'pdf')))
+
+        response = self.client.get(url, {'format': 'png'})
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(self.client.get(reverse('documents:document_page', args=[self.document.pk, 31])).status_code, 404)
+
+    def test_page_missing_from_cache_twice_is_not_found(self):
+        with mock.patch('documents.views.get_page', return_value=self.tmp / 'desalojada.pdf') as lookup:
+            response = self.client.get(reverse('documents:document_page', args=[self.document.pk, 3]))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(lookup.call_count, 2)
+
+    def test_detail_previews_large_documents_page_by_page(self):
+        response = self.client.get(reverse('documents:document_detail', args=[self.document.pk]))
+        self.assertContains(response, reverse('documents:document_page', args=[self.document.pk, 1]))
+        self.assertContains(response, 'id="page-pager"')
+
+
+class BlankPageRemovalTests(TemporaryFoldersMixin, TestCase):
+    """Derivado sin páginas en blanco, base del optimizado"""
+
+    def ingest_duplex_scan(self):
+        return self.ingest_pdfs(
+            write_batch_pdf(self.work_folder / 'duplex.pdf', ['Factura pagina 1', '', 'Factura pagina 2', ''])
+        )[0]
+
+    @override_settings(BLANK_PAGE_REMOVAL=True, PDF_OPTIMIZE=True)
+    def test_pipeline_removes_blank_pages_and_optimizes_the_result(self):
+        from .pdf_tools import page_count
+
+        document = self.ingest_duplex_scan()
+        blank_removed = DocumentDerivative.objects.get(document=document, kind='blank_removed')
+        self.assertEqual(blank_removed.details['pages_removed'], [2, 4])
+        self.assertLess(blank_removed.size, blank_removed.original_size)
+        self.assertEqual(page_count(blank_removed.path), 2)
+        # El optimizado se genera a partir del derivado, y el original queda intacto
+        self.assertEqual(page_count(document.served_file_path()), 2)
+        self.assertEqual(page_count(document.file.path), 4)
+
+    def test_command_reports_pages_removed_and_discards_stale_optimized(self):
+        document = self.ingest_duplex_scan()
+        call_command('optimize_documents', workers=1, stdout=io.StringIO())
+        self.assertTrue(document.derivatives.filter(kind='optimized').exists())
+
+        out = io.StringIO()
+        call_command('remove_blank_pages', workers=1, stdout=out)
+
+        self.assertEqual(list(document.derivatives.values_list('kind', flat=True)), ['blank_removed'])
+        self.assertIn('2 páginas en blanco quitadas', out.getvalue())
+
+    def test_marks_in_the_margins_do_not_count_as_ink(self):
+        from reportlab.pdfgen import canvas
+        from .pdf_tools import find_separator_pages
+
+        # Sombra de la perforación o la grapa en el borde de la hoja, y la misma mancha en el centro
+        path = self.tmp / 'bordes.pdf'
+        pdf = canvas.Canvas(str(path), invariant=1)
+        for x in (0, 280):
+            pdf.rect(x, 400, 20, 40, stroke=0, fill=1)
+            pdf.showPage()
+        pdf.save()
+
+        self.assertEqual(find_separator_pages(path, blank_threshold=0.001), [True, False])
+
+    def test_nothing_is_written_when_no_page_or_every_page_is_blank(self):
+        from .optimize import remove_blank_pages
+
+        for name, pages in (('sin_blancos', ['Factura', 'Anexo']), ('todo_blanco', ['', ''])):
+            destination = self.tmp / f'{name}.out.pdf'
+            self.assertIsNone(remove_blank_pages(write_batch_pdf(self.tmp / f'{name}.pdf', pages), destination))
+            self.assertFalse(destination.exists())
+
+
+INVOICE_LINES = [
+    'Compañía Eléctrica del Norte, factura número 48213 del período de marzo',
+    'Cliente Ricardo Vázquez, cuenta 7731-0042, tarifa residencial general',
+    'Consumo del período 412 kilovatios hora con lectura anterior 18220',
+    'Cargo por energía, cargo fijo mensual y alumbrado público incluidos',
+    'Total a pagar 1,284.50 antes del 15 de abril en sucursales autorizadas',
+]
+
+
+class NearDuplicateTests(TemporaryFoldersMixin, TestCase):
+    """Firmas MinHash del texto para detectar re-escaneos del mismo documento"""
+
+    def ingest(self, name, lines):
+        return self.ingest_pdfs(write_batch_pdf(self.work_folder / f'{name}.pdf', lines))[0]
+
+    def test_rescan_with_ocr_differences_is_flagged_in_dashboard(self):
+        original = self.ingest('factura', INVOICE_LINES)
+        Document.objects.filter(pk=original.pk).update(status='categorized', title='Factura de luz marzo')
+        # El re-escaneo lee mal un par de palabras y no comparte el hash de contenido
+        rescan = self.ingest('factura_scan', [line.replace('kilovatios', 'ki1ovatios') for line in INVOICE_LINES])
+        other = self.ingest('estado', ['Banco Hipotecario, estado de cuenta del préstamo número 99 ' * 2] * 3)
+
+        self.assertTrue(original.signature.shingle_count)
+        self.assertNotEqual(original.content_hash, rescan.content_hash)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('documents:dashboard'))
+        flagged = {d.pk: d.near_duplicate for d in response.context['pending_documents']}
+        self.assertEqual(flagged[rescan.pk]['document'], original)
+        self.assertGreaterEqual(flagged[rescan.pk]['similarity'], 0.8)
+        self.assertIsNone(flagged[other.pk])
+        self.assertContains(response, 'fa-clone')
+
+        detail = self.client.get(reverse('documents:document_detail', args=[original.pk]))
+        self.assertEqual([m['document'] for m in detail.context['near_duplicates']], [rescan])
+
+    def test_command_signs_missing_documents_and_reports_duplicates(self):
+        reviewed = Document.objects.create(title='Factura revisada', status='archived', created_by=self.user)
+        pending = Document.objects.create(title='Factura escaneada', created_by=self.user)
+        short = Document.objects.create(title='Nota', created_by=self.user)
+        text = ' '.join(INVOICE_LINES)
+        DocumentText.objects.create(document=reviewed, text=text)
+        DocumentText.objects.create(document=pending, text=text.replace('48213', '48218'))
+        DocumentText.objects.create(document=short, text='recibido')
+
+        out = io.StringIO()
+        call_command('index_near_duplicates', workers=1, stdout=out)
+
+        self.assertIn('2 firmas guardadas (1 con texto insuficiente)', out.getvalue())
+        self.assertIn('Factura escaneada ≈ Factura revisada', out.getvalue())
+        self.assertEqual(reviewed.signature_bands.count(), 20)
+        self.assertFalse(short.signature_bands.exists())
+
+    def test_signature_similarity_estimates_jaccard(self):
+        from .near_duplicates import shingles, signature, similarity
+
+        text = ' '.join(INVOICE_LINES)
+        edited = text.replace('kilovatios', 'ki1ovatios').replace('residencial', 'comercial')
+        exact = len(shingles(text) & shingles(edited)) / len(shingles(text) | shingles(edited))
+
+        self.assertEqual(similarity(signature(text)[0], signature(text.upper())[0]), 1.0)
+        self.assertAlmostEqual(similarity(signature(text)[0], signature(edited)[0]), exact, delta=0.1)
+        # Un texto corto (p. ej. un escaneo sin OCR) no tiene firma
+        self.assertEqual(signature('Factura de luz'), (None, 1))
+
+    def test_document_that_lost_its_text_leaves_the_index(self):
+        from .near_duplicates import near_duplicates, save_signatures, signature
+
+        first, second, third = (Document.objects.create(title=f'Factura {n}', created_by=self.user) for n in range(3))
+        text = ' '.join(INVOICE_LINES)
+        save_signatures([(document.pk, *signature(text)) for document in (first, second, third)])
+        self.assertEqual(sorted(near_duplicates([first.pk])[first.pk]), [(second.pk, 1.0), (third.pk, 1.0)])
+        # Solo se compara contra los candidatos indicados
+        self.assertEqual(near_duplicates([first.pk], candidates=Document.objects.filter(pk=third.pk)),
+                         {first.pk: [(third.pk, 1.0)]})
+
+        save_signatures([(second.pk, *signature(''))])
+
+        self.assertFalse(second.signature_bands.exists())
+        self.assertEqual(near_duplicates([first.pk])[first.pk], [(third.pk, 1.0)])
+
+
+class RelatedDocumentsTests(TemporaryFoldersMixin, TestCase):
+    """Vecinos precalculados del índice TF-IDF para el panel de documentos relacionados"""
+
+    def setUp(self):
+        super().setUp()
+        self.servicios = Category.objects.create(name='Servicios', value='servicios')
+        self.luz = Entity.objects.create(name='Compañía Eléctrica', value='luz')
+
+    def ingest(self, name, lines):
+        return self.ingest_pdfs(write_batch_pdf(self.work_folder / f'{name}.pdf', lines))[0]
+
+    def test_pipeline_indexes_and_endpoint_returns_classified_neighbours(self):
+        march = self.ingest('luz_marzo', INVOICE_LINES)
+        Document.objects.filter(pk=march.pk).update(status='categorized', category=self.servicios, entity=self.luz)
+        bank = self.ingest('banco', ['Banco Hipotecario, préstamo hipotecario, saldo e intereses, amortización'] * 2)
+        april = self.ingest('luz_abril', [line.replace('marzo', 'abril').replace('412', '398') for line in INVOICE_LINES])
+
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('documents:related_documents', args=[april.pk])).json()
+        self.assertEqual(data['related'][0]['id'], march.pk)
+        self.assertEqual(data['related'][0]['entity_name'], 'Compañía Eléctrica')
+        self.assertNotIn(bank.pk, [other['id'] for other in data['related']])
+        # Al indexar abril también entró en la lista de marzo
+        detail = self.client.get(reverse('documents:document_detail', args=[march.pk]))
+        self.assertEqual([other for other, _ in detail.context['related']], [april])
+
+        # Un usuario sin acceso a marzo no lo ve entre los relacionados
+        viewer = User.objects.create_user('lector', password='secreto', role='user')
+        april.assigned_users.add(viewer)
+        self.client.force_login(viewer)
+        data = self.client.get(reverse('documents:related_documents', args=[april.pk])).json()
+        self.assertEqual(data['related'], [])
+
+    def test_incremental_index_only_revisits_changed_documents(self):
+        from .related import index_documents
+
+        first = Document.objects.create(title='Factura luz marzo', created_by=self.user)
+        second = Document.objects.create(title='Factura luz abril', created_by=self.user)
+        DocumentText.objects.create(document=first, text=' '.join(INVOICE_LINES))
+        DocumentText.objects.create(document=second, text=' '.join(INVOICE_LINES[1:]))
+
+        out = io.StringIO()
+        call_command('index_related_documents', stdout=out)
+        self.assertIn('2 documentos indexados', out.getvalue())
+        self.assertEqual(index_documents(), [])
+
+        second.entity = self.luz
+        second.save()
+        self.assertEqual(index_documents(), [second.pk])
+        self.assertEqual(list(first.related_documents.values_list('related', flat=True)), [second.pk])
+
+        second.delete()
+        call_command('index_related_documents', full=True, stdout=io.StringIO())
+        self.assertFalse(first.related_documents.exists())
+
+    def test_document_frequencies_live_in_the_database(self):
+        from .related import TermStatistics, index_documents
+
+        first = Document.objects.create(title='Factura luz marzo', created_by=self.user)
+        second = Document.objects.create(title='Factura luz abril', created_by=self.user)
+        DocumentText.objects.create(document=first, text=' '.join(INVOICE_LINES))
+        DocumentText.objects.create(document=second, text='Préstamo hipotecario')
+
+        index_documents()
+        self.assertEqual(RelatedIndexEntry.objects.count(), 2)
+        stats = TermStatistics.load(['factura', 'marzo', 'hipotecario', 'desconocido'])
+        self.assertEqual((stats.n_docs, stats.doc_freq), (2, {'factura': 2, 'marzo': 1, 'hipotecario': 1}))
+
+        # Reindexar un documento ya contado no vuelve a sumar sus términos
+        second.save()
+        self.assertEqual(index_documents(), [second.pk])
+        self.assertEqual(TermDocumentFrequency.objects.get(term='factura').documents, 2)
+
+        # Un lote revertido no deja frecuencias a medias
+        third = Document.objects.create(title='Factura agua', created_by=self.user)
+        with transaction.atomic():
+            index_documents([third.pk])
+            transaction.set_rollback(True)
+        self.assertFalse(RelatedIndexEntry.objects.filter(document=third).exists())
+        self.assertEqual(TermDocumentFrequency.objects.get(term='factura').documents, 2)
+
+        call_command('index_related_documents', full=True, stdout=io.StringIO())
+        self.assertEqual(TermDocumentFrequency.objects.get(term='factura').documents, 3)
+        self.assertEqual(RelatedIndexEntry.objects.count(), 3)
+
+    def test_common_terms_are_dropped_and_vectors_normalized(self):
+        from collections import Counter
+        from .related import MAX_TERMS, TermStatistics
+
+        stats = TermStatistics(n_docs=100, doc_freq={'factura': 80, 'luz': 5})
+        vector = stats.vector(Counter({'factura': 3, 'luz': 2, 'medidor': 1}))
+
+        # 'factura' aparece en más del 30% de los documentos: no distingue a ninguno
+        self.assertEqual(set(vector), {'luz', 'medidor'})
+        self.assertGreater(vector['luz'], vector['medidor'])
+        self.assertAlmostEqual(sum(w * w for w in vector.values()), 1.0)
+        self.assertEqual(len(stats.vector(Counter(f'termino{i}' for i in range(80)))), MAX_TERMS)
+
+    def test_labels_become_terms_and_long_tokens_are_truncated(self):
+        from .related import TERM_MAX_LENGTH, document_terms
+
+        counts = document_terms(
+            'recibo.pdf', 'Factura luz', f"{'x' * 70} {'x' * 80} consumo", category_id=3, entity_id=7,
+            entity_name='Compañía Eléctrica',
+        )
+
+        self.assertTrue({'c:3', 'e:7', 'compania', 'factura', 'consumo'} <= set(counts))
+        self.assertFalse(any(term.startswith('t:') for term in counts))
+        # Dos términos que solo difieren después del límite de la columna cuentan como uno
+        self.assertEqual(counts['x' * TERM_MAX_LENGTH], 2)
+
+    @override_settings(RELATED_DOCUMENTS_COUNT=1)
+    def test_neighbour_lists_are_capped_at_related_count(self):
+        from .related import index_documents
+
+        documents = [Document.objects.create(title=f'Factura luz {n}', created_by=self.user) for n in range(3)]
+        for n, document in enumerate(documents):
+            DocumentText.objects.create(document=document, text=' '.join(INVOICE_LINES[n:]))
+
+        for document in documents:
+            index_documents([document.pk])
+
+        for document in documents:
+            self.assertEqual(document.related_documents.count(), 1)
+
+
+class WatermarkTests(TemporaryFoldersMixin, TestCase):
+    """Versión marcada con usuario y fecha para usuarios sin acceso total, desde caché"""
+
+    def setUp(self):
+        super().setUp()
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([write_pdf(self.work_folder / 'contrato.pdf', b'confidencial', pages=3)])
+        self.document = Document.objects.get()
+        self.viewer = User.objects.create_user('lector', password='secreto', role='user')
+        self.document.assigned_users.add(self.viewer)
+
+    def download(self, user, url=None):
+        from .pdf_tools import extract_text
+
+        self.client.force_login(user)
+        response = self.client.get(url or reverse('documents:serve_document', args=[self.document.pk]))
+        path = self.tmp / f'descarga_{user.pk}.pdf'
+        path.write_bytes(b''.join(response.streaming_content) if response.streaming else response.content)
+        return response, extract_text(path)
+
+    def test_non_admin_gets_stamped_pdf_generated_once_per_day(self):
+        from django.utils.timezone import localdate
+
+        from .watermark import watermark_cache
+
+        stamp = f'lector · {localdate():%d/%m/%Y}'
+        response, (text, pages) = self.download(self.viewer)
+        self.assertEqual(pages, 3)
+        self.assertIn(stamp, text)
+        self.assertIn('Factura de prueba confidencial', text)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=3600')
+
+        entries = list(watermark_cache().root.rglob('*_u*.pdf'))
+        self.assertEqual(len(entries), 1)
+        generated = entries[0].stat().st_mtime_ns
+        self.download(self.viewer)
+        self.assertEqual(entries[0].stat().st_mtime_ns, generated)
+
+        # Los administradores reciben el archivo sin marca
+        _, (text, _) = self.download(self.user)
+        self.assertNotIn(stamp, text)
+
+    def test_single_pages_are_stamped_and_cache_stays_bounded(self):
+        from .watermark import watermark_cache
+
+        page_url = reverse('documents:document_page', args=[self.document.pk, 2])
+        _, (text, pages) = self.download(self.viewer, page_url)
+        self.assertEqual(pages, 1)
+        self.assertIn('lector ·', text)
+
+        self.download(self.viewer)
+        limit = max(path.stat().st_size for path in watermark_cache().root.rglob('*.pdf')) * 2.5
+        with self.settings(WATERMARK_CACHE_MAX_BYTES=limit):
+            for i in range(4):
+                user = User.objects.create_user(f'lector{i}', password='secreto', role='user')
+                self.document.assigned_users.add(user)
+                _, (text, _) = self.download(user)
+                self.assertIn(f'lector{i} ·', text)
+            total = sum(path.stat().st_size for path in watermark_cache().root.rglob('*.pdf'))
+        self.assertLessEqual(total, limit)
+
+    def image(self, user, url, **params):
+        from PIL import Image
+
+        self.client.force_login(user)
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, Image.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def assertStamped(self, url, stamped=True, **params):
+        from PIL import ImageChops
+
+        _, original = self.image(self.user, url, **params)
+        response, image = self.image(self.viewer, url, **params)
+        self.assertEqual((image.format, image.size), (original.format, original.size))
+        difference = ImageChops.difference(image.convert('RGB'), original.convert('RGB')).getbbox()
+        if stamped:
+            self.assertIsNotNone(difference)
+            self.assertEqual(response['Cache-Control'], 'private, max-age=3600')
+        else:
+            self.assertIsNone(difference)
+
+    def test_page_images_are_stamped(self):
+        from .watermark import watermark_cache
+
+        url = reverse('documents:document_page', args=[self.document.pk, 1])
+        for fmt in ('png', 'jpeg', 'webp'):
+            self.assertStamped(url, format=fmt)
+        self.assertEqual(
+            sorted(path.suffix for path in watermark_cache().root.rglob('*_u*')), ['.jpeg', '.png', '.webp']
+        )
+
+    def test_preview_thumbnail_is_stamped_but_small_one_is_not(self):
+        url = reverse('documents:document_thumbnail', args=[self.document.pk])
+        self.assertStamped(url, size='preview')
+        self.assertStamped(url, stamped=False, size='small')
+
+    def ingest_encrypted(self, name, user_password):
+        import pikepdf
+
+        path = self.work_folder / name
+        with pikepdf.open(write_pdf(self.tmp / name, b'cifrado')) as pdf:
+            pdf.save(path, encryption=pikepdf.Encryption(owner='propietario', user=user_password))
+        document, = self.ingest_pdfs(path)
+        document.assigned_users.add(self.viewer)
+        self.assertTrue(document.is_encrypted)
+        return reverse('documents:serve_document', args=[document.pk])
+
+    def test_encrypted_pdf_keeps_its_encryption_and_gets_stamped(self):
+        import pikepdf
+
+        url = self.ingest_encrypted('restringido.pdf', user_password='')
+        response, (text, _) = self.download(self.viewer, url)
+
+        self.assertIn('lector ·', text)
+        with pikepdf.open(self.tmp / f'descarga_{self.viewer.pk}.pdf') as pdf:
+            self.assertTrue(pdf.is_encrypted)
+
+    def test_password_protected_pdf_is_refused_when_it_cannot_be_stamped(self):
+        # Sin la contraseña las etapas posteriores no pueden leerlo
+        with self.assertLogs('documents.tasks', 'WARNING'):
+            url = self.ingest_encrypted('protegido.pdf', user_password='clave')
+
+        self.client.force_login(self.viewer)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        # Quien tiene acceso total lo recibe tal cual
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class RangeRequestTests(TemporaryFoldersMixin, TestCase):
+    """serve_document en streaming con respuestas 206 para uno o varios rangos"""
+
+    def setUp(self):
+        super().setUp()
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([write_pdf(self.work_folder / 'estado.pdf', b'rangos', pages=20)])
+        self.document = Document.objects.get()
+        self.data = Path(self.document.file.path).read_bytes()
+        self.url = reverse('documents:serve_document', args=[self.document.pk])
+        self.client.force_login(self.user)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_single_range_suffix_and_unsatisfiable(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response, body = self.get(Range='bytes=100-1123')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-1123/{len(self.data)}')
+        self.assertEqual(int(response['Content-Length']), 1024)
+        self.assertEqual(body, self.data[100:1124])
+
+        # El visor pide primero el final del archivo (tabla de referencias)
+        response, body = self.get(Range='bytes=-500')
+        self.assertEqual(body, self.data[-500:])
+
+        response, _ = self.get(Range=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+        # Mal formado, o If-Range de otra versión del archivo: se entrega completo
+        self.assertEqual(self.get(Range='bytes=20-10')[0].status_code, 200)
+        self.assertEqual(self.get(Range='bytes=0-9', **{'If-Range': '"otra-version"'})[0].status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.get(Range='bytes=0-9', **{'If-Range': etag})[0].status_code, 206)
+
+    def test_multiple_ranges_are_sent_as_multipart_byteranges(self):
+        response, body = self.get(Range='bytes=0-99, 500-599, 550-649, -10')
+        self.assertEqual(response.status_code, 206)
+        content_type, _, boundary = response['Content-Type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        self.assertEqual(int(response['Content-Length']), len(body))
+
+        parts = body.split(f'--{boundary}'.encode())[1:-1]
+        size = len(self.data)
+        expected = [(0, 99), (500, 649), (size - 10, size - 1)]
+        self.assertEqual(len(parts), len(expected))
+        for part, (start, end) in zip(parts, expected):
+            headers, _, payload = part.partition(b'\r\n\r\n')
+            self.assertIn(f'Content-Range: bytes {start}-{end}/{size}'.encode(), headers)
+            self.assertEqual(payload[:-2], self.data[start:end + 1])
+
+
+class FrontServerStandIn:
+    """Hace de servidor frontal (nginx, Apache o un servidor estático con URLs firmadas):
+    resuelve X-Accel-Redirect y X-Sendfile y verifica las URLs firmadas antes de entregar"""
+
+    def __init__(self, locations):
+        self.locations = {prefix: Path(root) for root, prefix in locations.items()}
+
+    def resolve(self, url_path):
+        from urllib.parse import unquote
+
+        for prefix, root in self.locations.items():
+            if url_path.startswith(prefix):
+                return root / unquote(url_path[len(prefix):])
+        raise AssertionError(f'Ruta fuera de las locations configuradas: {url_path}')
+
+    def deliver(self, response, now=None):
+        """Bytes que recibiría el navegador, o None si el servidor rechazaría la petición"""
+        from .delivery import verify_signed_url
+
+        if response.has_header('X-Accel-Redirect'):
+            assert not response.content, 'Django no debe enviar el cuerpo'
+            return self.resolve(response['X-Accel-Redirect']).read_bytes()
+        if response.has_header('X-Sendfile'):
+            assert not response.content, 'Django no debe enviar el cuerpo'
+            return Path(response['X-Sendfile']).read_bytes()
+        assert response.status_code == 302, 'Sin delegación: los bytes pasaron por Django'
+        url_path = verify_signed_url(response['Location'], now=now)
+        if url_path is None:
+            return None
+        return self.resolve(url_path).read_bytes()
+
+
+class OffloadedDeliveryTests(TemporaryFoldersMixin, TestCase):
+    """serve_document solo verifica permisos y delega la entrega al servidor frontal"""
+
+    def setUp(self):
+        super().setUp()
+        ingestor = FolderIngestor()
+        ingestor.prepare()
+        ingestor.ingest([write_pdf(self.work_folder / 'póliza seguro.pdf', b'delegado', pages=2)])
+        self.document = Document.objects.get()
+        self.url = reverse('documents:serve_document', args=[self.document.pk])
+        self.locations = {
+            str(self.media_root): '/protected/media/',
+            str(self.tmp / 'cache' / 'watermarked'): '/protected/watermarked/',
+        }
+        self.override_locations = override_settings(DOCUMENT_DELIVERY_LOCATIONS=self.locations)
+        self.override_locations.enable()
+        self.front = FrontServerStandIn(self.locations)
+
+    def tearDown(self):
+        self.override_locations.disable()
+        super().tearDown()
+
+    def test_accel_redirect_and_sendfile_hand_off_the_file(self):
+        from .watermark import watermark_cache
+
+        data = Path(self.document.file.path).read_bytes()
+        self.client.force_login(self.user)
+        with self.settings(DOCUMENT_DELIVERY='x-accel'):
+            response = self.client.get(self.url)
+            self.assertTrue(response['X-Accel-Redirect'].startswith('/protected/media/'))
+            self.assertIn('p%C3%B3liza%20seguro.pdf', response['X-Accel-Redirect'])
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertIn('inline; filename=', response['Content-Disposition'])
+            self.assertEqual(self.front.deliver(response), data)
+
+            # Los usuarios sin acceso total reciben la versión marcada desde su caché
+            viewer = User.objects.create_user('lector', password='secreto', role='user')
+            self.document.assigned_users.add(viewer)
+            self.client.force_login(viewer)
+            response = self.client.get(self.url)
+            self.assertTrue(response['X-Accel-Redirect'].startswith('/protected/watermarked/'))
+            stamped = self.front.deliver(response)
+            self.assertEqual(stamped, next(watermark_cache().root.rglob('*_u*.pdf')).read_bytes())
+
+        self.client.force_login(self.user)
+        with self.settings(DOCUMENT_DELIVERY='x-sendfile'):
+            response = self.client.get(self.url)
+            self.assertEqual(self.front.deliver(response), data)
+        # Fuera de las carpetas configuradas se sigue entregando desde Django
+        with self.settings(DOCUMENT_DELIVERY='x-accel', DOCUMENT_DELIVERY_LOCATIONS={str(self.tmp / 'otra'): '/x/'}):
+            response = self.client.get(self.url)
+            self.assertFalse(response.has_header('X-Accel-Redirect'))
+            self.assertEqual(b''.join(response.streaming_content), data)
+
+    @override_settings(DOCUMENT_DELIVERY='signed', DOCUMENT_SIGNING_KEY='clave-compartida', DOCUMENT_SIGNED_URL_TTL=60)
+    def test_signed_urls_expire_and_reject_tampering(self):
+        from .delivery import verify_signed_url
+
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        location = response['Location']
+        self.assertEqual(self.front.deliver(response), Path(self.document.file.path).read_bytes())
+
+        expires = int(location.split('expires=')[1].split('&')[0])
+        self.assertIsNone(self.front.deliver(response, now=expires + 1))
+        self.assertIsNone(verify_signed_url(location.replace('expires=', f'expires={expires + 3600}&x=')))
+        self.assertIsNone(verify_signed_url(location.replace('/protected/media/', '/protected/media/../')))
+        with self.settings(DOCUMENT_SIGNING_KEY='otra-clave'):
+            self.assertIsNone(verify_signed_url(location))
+
+        # La firma no reemplaza la verificación de permisos de Django
+        self.client.force_login(User.objects.create_user('intruso', password='secreto', role='user'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
@@ -0,0 +1,98 @@
+"""Miniaturas de las primeras páginas de cada documento.
+
+Se generan al importar (etapa ``generate_thumbnails`` del pipeline) y se
+guardan en una caché LRU acotada, con clave derivada del hash de
+contenido: los re-escaneos idénticos comparten miniaturas y mover o
+renombrar el PDF al organizarlo no las invalida. Si una miniatura fue
+desalojada se vuelve a renderizar al pedirla.
+"""
+import io
+import logging
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import BoundedFileCache
+from .pdf_tools import render_pages
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {'small': 160, 'preview': 900}
+
+CONTENT_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+_cache = None
+
+
+def thumbnail_cache():
+    """Caché compartida del proceso (se recrea si cambia la configuración)"""
+    global _cache
+    root = Path(getattr(settings, 'THUMBNAIL_CACHE_DIR', settings.BASE_DIR / 'cache' / 'thumbnails'))
+    max_bytes = getattr(settings, 'THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    if _cache is None or _cache.root != root or _cache.max_bytes != max_bytes:
+        _cache = BoundedFileCache(root, max_bytes)
+    return _cache
+
+
+def thumbnail_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', DEFAULT_SIZES)
+
+
+def thumbnail_format():
+    return getattr(settings, 'THUMBNAIL_FORMAT', 'JPEG').upper()
+
+
+def thumbnail_pages():
+    return max(int(getattr(settings, 'THUMBNAIL_PAGES', 1)), 1)
+
+
+def thumbnail_key(document, page, size):
+    """Clave de caché: hash de contenido (o id si aún no tiene), página, tamaño y formato"""
+    identity = document.content_hash or f'doc{document.pk}'
+    return f'{identity}_p{page}_{size}.{thumbnail_format().lower()}'
+
+
+def _encode(image):
+    buffer = io.BytesIO()
+    fmt = thumbnail_format()
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(buffer, format=fmt, quality=getattr(settings, 'THUMBNAIL_QUALITY', 80))
+    return buffer.getvalue()
+
+
+def generate_thumbnails(document, pages=None):
+    """Renderiza las primeras páginas una vez (al tamaño mayor) y guarda todos los tamaños.
+
+    Retorna el número de miniaturas nuevas; las que ya estaban en caché no
+    se vuelven a renderizar.
+    """
+    cache = thumbnail_cache()
+    sizes = thumbnail_sizes()
+    pages = pages or range(1, thumbnail_pages() + 1)
+    missing = [
+        page for page in pages
+        if any(cache.get(thumbnail_key(document, page, size)) is None for size in sizes)
+    ]
+    if not missing or not document.file:
+        return 0
+
+    created = 0
+    largest = max(sizes.values())
+    for index, image in render_pages(document.file.path, [page - 1 for page in missing], largest):
+        for size, width in sorted(sizes.items(), key=lambda item: -item[1]):
+            if image.width > width:
+                image = image.resize((width, max(round(image.height * width / image.width), 1)))
+            cache.put(thumbnail_key(document, index + 1, size), _encode(image))
+            created += 1
+    return created
+
+
+def get_thumbnail(document, page=1, size='small'):
+    """Ruta de la miniatura en caché, renderizándola si no está. None si la página no existe"""
+    key = thumbnail_key(document, page, size)
+    path = thumbnail_cache().get(key)
+    if path is None:
+        generate_thumbnails(document, pages=[page])
+        path = thumbnail_cache().get(key)
+    return path
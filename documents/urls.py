@@ -10,9 +10,13 @@ urlpatterns = [
     path('create/', views.DocumentCreateView.as_view(), name='document_create'),
     path('<int:pk>/', views.document_detail, name='document_detail'),
     path('<int:pk>/data/', views.get_document_data, name='document_data'),
+    path('<int:pk>/related/', views.related_documents, name='related_documents'),
     path('<int:pk>/update/', views.update_document, name='update_document'),
     path('<int:pk>/serve/', views.serve_document, name='serve_document'),
+    path('<int:pk>/thumbnail/', views.document_thumbnail, name='document_thumbnail'),
+    path('<int:pk>/page/<int:page>/', views.document_page, name='document_page'),
     path('api/document-types/', views.get_document_types_by_category, name='document_types_by_category'),
+    path('jobs/<int:pk>/', views.ingestion_job_status, name='ingestion_job_status'),
     
     # URLs de administración
     path('admin/', admin_views.administration_dashboard, name='administration_dashboard'),
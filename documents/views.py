@@ -3,18 +3,32 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth import get_user_model
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import JsonResponse, HttpResponse, Http404, FileResponse
 from django.contrib import messages
-from django.db.models import Q
-from django.urls import reverse_lazy
+from django.core.exceptions import PermissionDenied
+from django.db.models import F, Q
+from django.urls import reverse, reverse_lazy
 from django.forms import ModelForm
 from django.conf import settings
-from .models import Document, Category, DocumentType, Entity, DocumentHistory
+from .models import Document, Category, DocumentType, Entity, DocumentHistory, DocumentSuggestion, IngestionJob
+from .classifier import min_confidence
+from .dates import min_confidence as min_date_confidence
+from .delivery import delivery_mode, offloaded_response
+from .ingestion import compute_upload_hash, place_uploaded_document
+from .near_duplicates import near_duplicates, reviewed_documents
+from .pages import PAGE_FORMATS, get_page
+from .placement import move_file
+from .related import related_to
+from .tasks import dispatch_upload
+from .search import highlight, search_documents
+from .streaming import ranged_file_response
+from .thumbnails import CONTENT_TYPES, get_thumbnail, thumbnail_format, thumbnail_sizes
+from .watermark import WatermarkUnavailable, open_watermarked, watermark_applies, watermarked_path
 import json
 import os
-import shutil
 from pathlib import Path
 from datetime import datetime
+from django.utils.dateparse import parse_date
 from django.utils.timezone import now
 import logging
 
@@ -52,8 +66,12 @@ def dashboard(request):
     # Configuración de uso para el template
     usage_config = getattr(settings, 'USAGE_CONFIG', {}).get(usage_type, {})
     
+    # Limitar a 20 para performance (la sugerencia del clasificador viene en la misma consulta)
+    shown_documents = list(pending_documents.select_related('entity', 'suggestion__entity')[:20])
+    flag_near_duplicates(user, shown_documents)
+    
     context = {
-        'pending_documents': pending_documents[:20],  # Limitar a 20 para performance
+        'pending_documents': shown_documents,
         'categories': categories,
         'document_types': document_types,
         'entities': entities,
@@ -66,6 +84,30 @@ def dashboard(request):
     
     return render(request, 'documents/dashboard.html', context)
 
+def flag_near_duplicates(user, documents, candidates=None):
+    """Asigna ``near_duplicate`` (documento y similitud) a los documentos que parecen
+    duplicar otro ya revisado, según el índice LSH de firmas MinHash"""
+    candidates = reviewed_documents() if candidates is None else candidates
+    if visible_documents(user) is not None:
+        candidates = candidates.filter(id__in=visible_documents(user))
+    found = near_duplicates([document.id for document in documents], candidates=candidates)
+    others = Document.objects.only('id', 'title', 'status').in_bulk(
+        {other_id for matches in found.values() for other_id, _ in matches}
+    )
+    for document in documents:
+        document.near_duplicates = [
+            {'document': others[other_id], 'similarity': score}
+            for other_id, score in found.get(document.id, []) if other_id in others
+        ]
+        document.near_duplicate = document.near_duplicates[0] if document.near_duplicates else None
+    return documents
+
+def visible_documents(user):
+    """Documentos que el usuario puede ver (None si puede ver todos)"""
+    if user.can_view_all_documents():
+        return None
+    return Document.objects.filter(Q(assigned_users=user) | Q(created_by=user))
+
 @login_required
 def document_detail(request, pk):
     """Vista detalle del documento con preview"""
@@ -83,6 +125,13 @@ def document_detail(request, pk):
     context = {
         'document': document,
         'history': history,
+        'optimized': document.derivatives.filter(kind='optimized').first(),
+        'blank_removed': document.derivatives.filter(kind='blank_removed').first(),
+        'near_duplicates': flag_near_duplicates(user, [document], Document.objects.all())[0].near_duplicates,
+        'related': related_to(document, visible_documents(user)),
+        'segments': document.segments.only('id', 'title', 'source_pages').order_by('id'),
+        # Los documentos grandes se previsualizan página por página
+        'page_preview': (document.page_count or 0) > getattr(settings, 'PAGE_PREVIEW_MIN_PAGES', 20),
     }
     
     return render(request, 'documents/document_detail.html', context)
@@ -130,6 +179,9 @@ def update_document(request, pk):
             else:
                 document.document_date = data['document_date']
         
+        if 'due_date' in data and data['due_date']:
+            document.due_date = parse_date(data['due_date'])
+        
         if 'payment_status' in data:
             document.payment_status = data['payment_status']
         
@@ -194,7 +246,7 @@ def update_document(request, pk):
                 # Mover el archivo al nuevo destino (solo si existe)
                 if current_file_path.exists():
                     logger.info(f"Moviendo archivo...")
-                    shutil.move(str(current_file_path), str(new_file_path))
+                    move_file(current_file_path, new_file_path)
                     
                     # Actualizar la ruta del archivo en el modelo con ruta relativa
                     relative_path = new_file_path.relative_to(settings.MEDIA_ROOT)
@@ -254,6 +306,14 @@ class DocumentListView(LoginRequiredMixin, ListView):
     template_name = 'documents/document_list.html'
     context_object_name = 'documents'
     paginate_by = 20
+
+    # Ordenamientos sobre columnas indexadas (no se consulta el disco)
+    SORT_OPTIONS = {
+        '-size': ('Más pesados', [F('file_size_bytes').desc(nulls_last=True)]),
+        'size': ('Más livianos', [F('file_size_bytes').asc(nulls_last=True)]),
+        '-pages': ('Más páginas', [F('page_count').desc(nulls_last=True)]),
+        'pages': ('Menos páginas', [F('page_count').asc(nulls_last=True)]),
+    }
     
     def get_queryset(self):
         user = self.request.user
@@ -265,15 +325,6 @@ class DocumentListView(LoginRequiredMixin, ListView):
                 Q(assigned_users=user) | Q(created_by=user)
             ).distinct()
         
-        # Filtros de búsqueda
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(entity__name__icontains=search) |
-                Q(notes__icontains=search)
-            )
-        
         status = self.request.GET.get('status')
         if status:
             queryset = queryset.filter(status=status)
@@ -282,7 +333,24 @@ class DocumentListView(LoginRequiredMixin, ListView):
         if category:
             queryset = queryset.filter(category_id=category)
         
-        return queryset.select_related('category', 'document_type', 'entity', 'created_by')
+        queryset = queryset.select_related('category', 'document_type', 'entity', 'created_by')
+        
+        # Búsqueda de texto completo (título, entidad, notas y contenido del PDF), ordenada por relevancia
+        search = self.request.GET.get('search')
+        if search:
+            queryset = search_documents(queryset, search)
+
+        sort = self.SORT_OPTIONS.get(self.request.GET.get('sort'))
+        if sort:
+            queryset = queryset.order_by(*sort[1], '-created_at')
+        return queryset
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['sort_options'] = [(value, label) for value, (label, _) in self.SORT_OPTIONS.items()]
+        for document in context['documents']:
+            document.search_snippet_html = highlight(getattr(document, 'search_snippet', ''))
+        return context
 
 class DocumentCreateView(LoginRequiredMixin, CreateView):
     """Vista para crear nuevo documento"""
@@ -301,11 +369,26 @@ class DocumentCreateView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         form.instance.created_by = self.request.user
         
+        # Detectar duplicados por contenido antes de guardar (consulta por índice único)
+        uploaded_file = form.cleaned_data.get('file')
+        if uploaded_file:
+            content_hash = compute_upload_hash(uploaded_file)
+            duplicate = Document.objects.filter(content_hash=content_hash).only('id', 'title').first()
+            if duplicate:
+                form.add_error('file', f'Este PDF ya existe en el sistema: "{duplicate.title}" (ID {duplicate.id})')
+                return self.form_invalid(form)
+            form.instance.content_hash = content_hash
+        
         # Guardar el documento primero
         response = super().form_valid(form)
         
         # Copiar el archivo a la carpeta de monitoreo si está configurada
         if hasattr(settings, 'MONITORED_FOLDER') and form.instance.file:
+            if getattr(settings, 'DOCUMENT_INGESTION_ASYNC', False):
+                # Procesar en segundo plano (Celery) una vez confirmada la transacción
+                dispatch_upload(form.instance, self.request.user)
+                messages.success(self.request, 'Documento creado; el archivo se está procesando en segundo plano.')
+                return response
             try:
                 self._copy_to_monitored_folder(form.instance)
             except Exception as e:
@@ -319,45 +402,7 @@ class DocumentCreateView(LoginRequiredMixin, CreateView):
     
     def _copy_to_monitored_folder(self, document):
         """Copia el archivo subido a la carpeta de monitoreo"""
-        if not document.file:
-            return
-
-        monitored_folder = Path(settings.MONITORED_FOLDER)
-        if not monitored_folder.exists():
-            monitored_folder.mkdir(parents=True, exist_ok=True)
-
-        # Crear subcarpeta 'processed' para los originales
-        processed_folder = monitored_folder / 'processed'
-        processed_folder.mkdir(exist_ok=True)
-
-        try:
-            # Crear carpeta 'Pending' dentro de MEDIA_ROOT (Main)
-            pending_folder = Path(settings.MEDIA_ROOT) / 'Pending'
-            pending_folder.mkdir(parents=True, exist_ok=True)
-        except Exception as e:
-            logger.error(f"Error al crear la carpeta 'Pending': {e}")
-            raise
-
-        # Generar nombre único basado en timestamp y nombre original
-        timestamp = now().strftime('%Y%m%d_%H%M%S')
-        original_name = document.file.name.split('/')[-1]  # Solo el nombre del archivo
-        new_name = f"{timestamp}_{original_name}"
-
-        # Mover archivo original a 'processed'
-        source_path = document.file.path
-        processed_path = processed_folder / original_name
-        shutil.move(source_path, processed_path)
-
-        # Crear copia en 'Pending'
-        pending_path = pending_folder / new_name
-        shutil.copy2(processed_path, pending_path)
-
-        # Actualizar el campo file del documento con la ruta relativa
-        relative_path = pending_path.relative_to(settings.MEDIA_ROOT)
-        document.file = str(relative_path)
-        document.original_filename = original_name
-        document.imported_from_folder = False  # False porque fue subido manualmente
-        document.save(update_fields=['file', 'original_filename', 'imported_from_folder'])
+        place_uploaded_document(document)
 
 @login_required
 def get_document_data(request, pk):
@@ -384,14 +429,70 @@ def get_document_data(request, pk):
         'entity_id': document.entity.id if document.entity else None,
         'entity_name': document.entity.name if document.entity else None,
         'document_date': document.document_date.isoformat() if document.document_date else None,
+        'due_date': document.due_date.isoformat() if document.due_date else None,
         'notes': document.notes or '',
         'structured_name': document.get_structured_name(),
         'created_at': document.created_at.isoformat(),
-        'file_size': document.file_size
+        'file_size': document.file_size,
+        'page_count': document.page_count,
+        'pdf_version': document.pdf_version,
+        'is_encrypted': document.is_encrypted,
+        'suggestions': {},
     }
     
+    # Sugerencias del clasificador para los campos que aún no eligió nadie
+    if document.status == 'pending':
+        suggestion = DocumentSuggestion.objects.filter(document=document).select_related(
+            'category', 'document_type', 'entity'
+        ).first()
+        if suggestion:
+            suggestions = suggestion.as_dict(min_confidence())
+            if document.category and document.category.name != Category.SCANNED_NAME:
+                suggestions.pop('category', None)
+            if document.document_type_id:
+                suggestions.pop('document_type', None)
+            if document.entity_id:
+                suggestions.pop('entity', None)
+            # Fechas detectadas: se muestran si el documento no tiene otra elegida a mano
+            for field in ('document_date', 'due_date'):
+                value = getattr(suggestion, field)
+                confidence = getattr(suggestion, f'{field}_confidence')
+                current = getattr(document, field)
+                if value and (current == value or (current is None and confidence >= min_date_confidence())):
+                    suggestions[field] = {'value': value.isoformat(), 'confidence': round(confidence, 3)}
+            data['suggestions'] = suggestions
+    
     return JsonResponse(data)
 
+@login_required
+def related_documents(request, pk):
+    """Documentos relacionados (vecinos precalculados del índice TF-IDF) en formato JSON"""
+    user = request.user
+    document = get_object_or_404(Document, pk=pk)
+    
+    # Verificar permisos
+    if not user.can_view_all_documents():
+        if not (document.assigned_users.filter(id=user.id).exists() or document.created_by == user):
+            return JsonResponse({'error': 'Sin permisos'}, status=403)
+    
+    return JsonResponse({
+        'id': document.id,
+        'related': [
+            {
+                'id': other.id,
+                'title': other.title,
+                'url': reverse('documents:document_detail', args=[other.pk]),
+                'status_display': other.get_status_display(),
+                'category_name': other.category.name if other.category else None,
+                'document_type_name': other.document_type.name if other.document_type else None,
+                'entity_name': other.entity.name if other.entity else None,
+                'document_date': other.document_date.isoformat() if other.document_date else None,
+                'score': score,
+            }
+            for other, score in related_to(document, visible_documents(user))
+        ],
+    })
+
 @login_required
 def serve_document(request, pk):
     """Servir archivo PDF con verificación de permisos"""
@@ -403,23 +504,130 @@ def serve_document(request, pk):
         if not (document.assigned_users.filter(id=user.id).exists() or document.created_by == user):
             raise Http404("Documento no encontrado")
     
+    # Se prefiere el derivado optimizado (linealizado, más liviano); ?original=1 entrega el archivo tal cual
     try:
-        with open(document.file.path, 'rb') as pdf_file:
-            pdf_content = pdf_file.read()
-            
-            # Crear respuesta con headers optimizados para iframe
-            response = HttpResponse(pdf_content, content_type='application/pdf')
-            
-            # Headers para permitir visualización en iframe
-            response['Content-Disposition'] = 'inline; filename="{}"'.format(document.filename)
-            response['X-Frame-Options'] = 'SAMEORIGIN'
-            response['Content-Length'] = len(pdf_content)
-            response['Cache-Control'] = 'public, max-age=3600'
-            
-            # Headers adicionales para compatibility
-            response['Accept-Ranges'] = 'bytes'
-            response['Content-Security-Policy'] = "default-src 'self'"
-            
-            return response
+        source = document.served_file_path(original=request.GET.get('original') == '1')
+        # Sin acceso total: versión con usuario y fecha, generada una vez por día (caché de marcas de agua)
+        stamped = watermark_applies(user)
+        # Con DOCUMENT_DELIVERY el servidor frontal entrega los bytes; Django solo verificó los permisos
+        response = None
+        if delivery_mode() != 'django':
+            response = offloaded_response(watermarked_path(source, user) if stamped else source)
+        if response is None:
+            pdf_file = open_watermarked(source, user) if stamped else open(source, 'rb')
+            # Streaming por bloques con soporte de Range: memoria constante y el visor pide solo las páginas que muestra
+            response = ranged_file_response(request, pdf_file, 'application/pdf')
     except FileNotFoundError:
         raise Http404("Archivo no encontrado")
+    except WatermarkUnavailable:
+        # Sin marca no se entrega: queda para quienes tienen acceso total
+        raise PermissionDenied("El documento está protegido con contraseña y no se puede marcar")
+    if response.status_code == 302:
+        # URL firmada: la entrega (y sus encabezados) quedan a cargo del servidor estático
+        return response
+    
+    # Headers para permitir visualización en iframe
+    response['Content-Disposition'] = 'inline; filename="{}"'.format(document.filename)
+    response['X-Frame-Options'] = 'SAMEORIGIN'
+    # La versión marcada es de un solo usuario: ningún caché compartido debe guardarla
+    response['Cache-Control'] = 'private, max-age=3600' if stamped else 'public, max-age=3600'
+    response['Content-Security-Policy'] = "default-src 'self'"
+    
+    return response
+
+def open_cached(lookup, user, stamped):
+    """Abre el archivo en caché que retorna ``lookup()`` (o su versión marcada); None si no existe.
+
+    Otro proceso puede desalojarlo entre la consulta y la apertura: en ese
+    caso se vuelve a pedir (y a generar) una vez antes de rendirse.
+    """
+    for _ in range(2):
+        path = lookup()
+        if path is None:
+            return None
+        try:
+            return open_watermarked(path, user) if stamped else open(path, 'rb')
+        except FileNotFoundError:
+            continue
+    return None
+
+@login_required
+def document_thumbnail(request, pk):
+    """Miniatura de una página del documento (desde la caché de miniaturas)"""
+    user = request.user
+    document = get_object_or_404(Document.objects.only('id', 'file', 'content_hash', 'created_by_id'), pk=pk)
+    
+    # Verificar permisos
+    if not user.can_view_all_documents():
+        if not (document.assigned_users.filter(id=user.id).exists() or document.created_by_id == user.id):
+            raise Http404("Documento no encontrado")
+    
+    size = request.GET.get('size', 'small')
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        raise Http404("Página no válida")
+    if size not in thumbnail_sizes() or page < 1:
+        raise Http404("Miniatura no disponible")
+    
+    # La vista previa grande es legible: lleva la marca como el PDF
+    stamped = watermark_applies(user, pixels=thumbnail_sizes()[size])
+    try:
+        stream = open_cached(lambda: get_thumbnail(document, page, size), user, stamped)
+    except Exception as e:
+        logger.warning(f"No se pudo generar la miniatura del documento {pk}: {e}")
+        raise Http404("Miniatura no disponible")
+    if stream is None:
+        raise Http404("Miniatura no disponible")
+    
+    response = FileResponse(stream, content_type=CONTENT_TYPES.get(thumbnail_format(), 'image/jpeg'))
+    # La clave incluye el hash de contenido: la miniatura no cambia mientras exista el documento
+    # (la versión marcada lleva la fecha del día)
+    response['Cache-Control'] = 'private, max-age=3600' if stamped else 'private, max-age=86400'
+    return response
+
+@login_required
+def document_page(request, pk, page):
+    """Una sola página del documento como PDF o imagen (desde la caché de páginas)"""
+    user = request.user
+    document = get_object_or_404(
+        Document.objects.only('id', 'title', 'file', 'content_hash', 'created_by_id', 'page_count'), pk=pk
+    )
+    
+    # Verificar permisos
+    if not user.can_view_all_documents():
+        if not (document.assigned_users.filter(id=user.id).exists() or document.created_by_id == user.id):
+            raise Http404("Documento no encontrado")
+    
+    fmt = request.GET.get('format', 'pdf').lower()
+    if fmt not in PAGE_FORMATS or page < 1 or (document.page_count and page > document.page_count):
+        raise Http404("Página no disponible")
+    
+    stamped = watermark_applies(user)
+    try:
+        stream = open_cached(lambda: get_page(document, page, fmt), user, stamped)
+    except Exception as e:
+        logger.warning(f"No se pudo extraer la página {page} del documento {pk}: {e}")
+        raise Http404("Página no disponible")
+    if stream is None:
+        raise Http404("Página no disponible")
+    
+    response = FileResponse(stream, content_type=PAGE_FORMATS[fmt])
+    if fmt == 'pdf':
+        response['Content-Disposition'] = 'inline; filename="{}_p{}.pdf"'.format(Path(document.filename).stem, page)
+        response['X-Frame-Options'] = 'SAMEORIGIN'
+    # La clave incluye el hash de contenido: la página no cambia mientras exista el documento
+    # (la versión marcada lleva la fecha del día)
+    response['Cache-Control'] = 'private, max-age=3600' if stamped else 'private, max-age=86400'
+    return response
+
+@login_required
+def ingestion_job_status(request, pk):
+    """Progreso de una importación asíncrona (para sondeo desde la interfaz)"""
+    job = get_object_or_404(IngestionJob, pk=pk)
+    
+    # Verificar permisos
+    if not request.user.can_view_all_documents() and job.created_by_id != request.user.id:
+        return JsonResponse({'error': 'Sin permisos'}, status=403)
+    
+    return JsonResponse(job.as_dict())
@@ -0,0 +1,224 @@
+"""Detección de PDFs nuevos en la carpeta de monitoreo.
+
+En Linux se usa inotify (vía ctypes, sin dependencias externas) para
+enterarse de cada archivo en cuanto termina de escribirse. En otros
+sistemas, o si inotify no está disponible, se recurre a un sondeo ligero
+del directorio con ``os.scandir``.
+
+Con ``recursive`` (``MONITORED_FOLDER_RECURSIVE``) también se vigilan las
+subcarpetas, incluidas las que se crean después (p. ej. una por día), con
+los mismos filtros ``include``/``exclude`` que el escáner.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+from .scanner import iter_pdfs, scanned_dir, scanned_file
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_CREATE solo interesa para subcarpetas nuevas: un archivo recién creado aún no tiene contenido
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class PollingWatcher:
+    """Detecta PDFs nuevos o modificados comparando listados sucesivos"""
+
+    name = 'polling'
+
+    def __init__(self, folder, interval=2.0, recursive=False, include=('*.pdf',), exclude=()):
+        self.folder = Path(folder)
+        self.interval = interval
+        self.options = {'recursive': recursive, 'include': include, 'exclude': exclude}
+        self._known = {}
+
+    def _snapshot(self):
+        snapshot = {}
+        for path in iter_pdfs(self.folder, **self.options):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout=None):
+        """Espera hasta ``timeout`` segundos y retorna los PDFs nuevos o cambiados"""
+        time.sleep(min(self.interval, timeout) if timeout is not None else self.interval)
+        snapshot = self._snapshot()
+        changed = [
+            path
+            for path, signature in snapshot.items()
+            if self._known.get(path) != signature
+        ]
+        self._known = snapshot
+        return changed
+
+    def take_closed(self):
+        """El sondeo no sabe si un archivo terminó de escribirse"""
+        return []
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Recibe eventos IN_CLOSE_WRITE / IN_MOVED_TO del kernel para la carpeta (y sus subcarpetas)"""
+
+    name = 'inotify'
+
+    def __init__(self, folder, recursive=False, include=('*.pdf',), exclude=()):
+        self.folder = Path(folder)
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.overflowed = False
+        # Descriptor de cada watch → carpeta vigilada
+        self._watches = {}
+        self._closed = []
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError('libc no disponible')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify no disponible en este sistema')
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        try:
+            self._add_watch(self.folder)
+        except OSError:
+            os.close(self._fd)
+            raise
+        if recursive:
+            self._watch_subdirs(self.folder, collect=False)
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.folder).replace(os.sep, '/')
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(path)), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        self._watches[wd] = Path(path)
+
+    def _watch_subdirs(self, folder, collect=True):
+        """Vigila las subcarpetas de ``folder`` y retorna los PDFs que ya contienen.
+
+        Lo que se escribió en una carpeta nueva antes de vigilarla no genera
+        eventos: se recoge aquí (sin marcarlo como cerrado).
+        """
+        found = []
+        pending = [Path(folder)]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                relative = self._relative(entry.path)
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir:
+                    if not scanned_dir(entry.name, relative, self.exclude):
+                        continue
+                    try:
+                        self._add_watch(entry.path)
+                    except OSError:
+                        # Carpeta ya borrada o sin watches libres (max_user_watches): la cubre el re-escaneo
+                        continue
+                    pending.append(Path(entry.path))
+                elif collect and scanned_file(entry.name, relative, self.include, self.exclude):
+                    found.append(Path(entry.path))
+        return found
+
+    def wait(self, timeout=None):
+        """Bloquea hasta que llegue un evento (o venza ``timeout``) y retorna los PDFs listos"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        paths = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Se perdieron eventos: quien llama debe hacer un re-escaneo completo
+                    self.overflowed = True
+                    continue
+                if mask & IN_IGNORED:
+                    # La carpeta vigilada se borró o se desmontó
+                    self._watches.pop(wd, None)
+                    continue
+                parent = self._watches.get(wd)
+                if parent is None or not name:
+                    continue
+                path = parent / name
+                relative = self._relative(path)
+                if mask & IN_ISDIR:
+                    if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and scanned_dir(name, relative, self.exclude):
+                        try:
+                            self._add_watch(path)
+                        except OSError:
+                            continue
+                        paths.extend(self._watch_subdirs(path))
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and scanned_file(name, relative, self.include, self.exclude):
+                    paths.append(path)
+                    self._closed.append(path)
+        return paths
+
+    def take_closed(self):
+        """PDFs que el kernel reportó como cerrados tras escribirse desde la última llamada"""
+        closed, self._closed = self._closed, []
+        return closed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def create_watcher(folder, interval=2.0, force_polling=False, recursive=False, include=('*.pdf',), exclude=()):
+    """Retorna un watcher inotify si es posible, o uno de sondeo en su defecto"""
+    options = {'recursive': recursive, 'include': include, 'exclude': exclude}
+    if not force_polling:
+        try:
+            return InotifyWatcher(folder, **options)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(folder, interval=interval, **options)
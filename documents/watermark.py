@@ -0,0 +1,184 @@
+"""PDFs con marca de agua para los usuarios que no son administradores.
+
+Cumplimiento pide que cada PDF entregado a un usuario sin acceso total
+lleve su nombre de usuario y la fecha. Estampar con reportlab en cada
+``serve_document`` sería demasiado lento para PDFs grandes, así que la
+versión marcada se genera una sola vez por (archivo, usuario, día) y se
+guarda en una caché LRU acotada; las visitas siguientes del mismo día la
+leen de disco. Las entradas de días anteriores simplemente dejan de
+pedirse y el desalojo las borra.
+
+La clave incluye ruta, tamaño y fecha de modificación del archivo de
+origen: si se regenera el derivado optimizado, la versión marcada se
+vuelve a generar. La marca se dibuja con reportlab una vez por tamaño de
+página y se superpone con pikepdf, sin rasterizar ni recomprimir nada.
+
+Las páginas como imagen y las miniaturas grandes también se marcan (con
+Pillow, sobre la imagen ya rasterizada) y se guardan en la misma caché;
+las miniaturas menores que ``WATERMARK_MIN_IMAGE_SIZE`` son ilegibles y
+se entregan tal cual.
+
+Un PDF cifrado solo con contraseña de propietario se marca y conserva su
+cifrado; uno con contraseña de apertura no se puede marcar
+(``WatermarkUnavailable``) y no se entrega a quien debe recibir la marca.
+"""
+import hashlib
+import io
+import math
+from pathlib import Path
+
+import pikepdf
+from django.conf import settings
+from django.utils.timezone import localdate
+
+from .cache import BoundedFileCache
+
+_cache = None
+
+
+class WatermarkUnavailable(RuntimeError):
+    """El archivo no se puede marcar (PDF protegido con contraseña de apertura)"""
+
+
+def watermark_cache():
+    """Caché compartida del proceso (se recrea si cambia la configuración)"""
+    global _cache
+    root = Path(getattr(settings, 'WATERMARK_CACHE_DIR', settings.BASE_DIR / 'cache' / 'watermarked'))
+    max_bytes = getattr(settings, 'WATERMARK_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024)
+    if _cache is None or _cache.root != root or _cache.max_bytes != max_bytes:
+        _cache = BoundedFileCache(root, max_bytes)
+    return _cache
+
+
+def watermark_applies(user, pixels=None):
+    """Solo los usuarios sin acceso a todos los documentos reciben la versión marcada.
+
+    ``pixels`` es el lado mayor de una imagen: por debajo de ``WATERMARK_MIN_IMAGE_SIZE`` no se marca.
+    """
+    if pixels is not None and pixels < getattr(settings, 'WATERMARK_MIN_IMAGE_SIZE', 400):
+        return False
+    return getattr(settings, 'WATERMARK_PDFS', False) and not user.can_view_all_documents()
+
+
+def watermark_text(user, day):
+    template = getattr(settings, 'WATERMARK_TEXT', '{username} · {date}')
+    username = user.get_username()
+    return template.format(username=username, name=user.get_full_name() or username, date=day.strftime('%d/%m/%Y'))
+
+
+def watermark_key(source, user, day):
+    """Clave de caché: identidad del archivo de origen, usuario y día"""
+    stat = Path(source).stat()
+    identity = hashlib.blake2b(f'{source}:{stat.st_size}:{stat.st_mtime_ns}'.encode(), digest_size=8).hexdigest()
+    return f'{identity}_u{user.pk}_{day:%Y%m%d}{Path(source).suffix.lower()}'
+
+
+def _overlay(width, height, text):
+    """PDF de una página con la marca: el texto en diagonal y, abajo, en letra pequeña"""
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(width, height), invariant=1)
+    pdf.saveState()
+    pdf.setFillColorRGB(0.5, 0.5, 0.5, alpha=0.2)
+    pdf.setFont('Helvetica-Bold', max(min(width, height) / 16, 12))
+    pdf.translate(width / 2, height / 2)
+    pdf.rotate(math.degrees(math.atan2(height, width)))
+    pdf.drawCentredString(0, 0, text)
+    pdf.restoreState()
+    pdf.setFillColorRGB(0.4, 0.4, 0.4, alpha=0.6)
+    pdf.setFont('Helvetica', 7)
+    pdf.drawRightString(width - 18, 10, text)
+    pdf.showPage()
+    pdf.save()
+    return pikepdf.open(io.BytesIO(buffer.getvalue()))
+
+
+def stamp_pdf(source, text):
+    """Bytes del PDF ``source`` con ``text`` superpuesto en cada página"""
+    overlays = {}
+    try:
+        pdf = pikepdf.open(source)
+    except pikepdf.PasswordError:
+        raise WatermarkUnavailable(f'{Path(source).name} está protegido con contraseña de apertura')
+    with pdf:
+        for page in pdf.pages:
+            box = page.mediabox
+            size = (round(float(box[2]) - float(box[0]), 1), round(float(box[3]) - float(box[1]), 1))
+            if size not in overlays:
+                overlays[size] = _overlay(*size, text)
+            page.add_overlay(overlays[size].pages[0])
+        buffer = io.BytesIO()
+        # Se conserva la linealización del derivado optimizado (primera página sin esperar el resto)
+        # y el cifrado del original (permisos de impresión, copia...)
+        pdf.save(buffer, linearize=True, encryption=pdf.is_encrypted)
+    for overlay in overlays.values():
+        overlay.close()
+    return buffer.getvalue()
+
+
+def _font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, ImportError):
+        # Pillow sin FreeType: fuente de mapa de bits de tamaño fijo
+        return ImageFont.load_default()
+
+
+def stamp_image(source, text, quality=85):
+    """Bytes de la imagen ``source`` (PNG, JPEG o WebP) con ``text`` en diagonal y, abajo, en letra pequeña"""
+    from PIL import Image, ImageDraw
+
+    with Image.open(source) as image:
+        fmt = image.format
+        base = image.convert('RGBA')
+    width, height = base.size
+
+    font = _font(max(min(width, height) // 16, 12))
+    left, top, right, bottom = font.getbbox(text)
+    label = Image.new('RGBA', (right - left, bottom - top))
+    ImageDraw.Draw(label).text((-left, -top), text, font=font, fill=(128, 128, 128, 51))
+    label = label.rotate(math.degrees(math.atan2(height, width)), expand=True, resample=Image.BICUBIC)
+    overlay = Image.new('RGBA', base.size)
+    overlay.paste(label, ((width - label.width) // 2, (height - label.height) // 2), label)
+    ImageDraw.Draw(overlay).text(
+        (width - 18, height - 10), text, font=_font(max(height // 110, 10)), fill=(102, 102, 102, 153), anchor='rb'
+    )
+
+    stamped = Image.alpha_composite(base, overlay)
+    if fmt == 'JPEG':
+        stamped = stamped.convert('RGB')
+    buffer = io.BytesIO()
+    stamped.save(buffer, format=fmt, quality=quality)
+    return buffer.getvalue()
+
+
+def _stamp(source, text):
+    if Path(source).suffix.lower() == '.pdf':
+        return stamp_pdf(source, text)
+    return stamp_image(source, text, quality=getattr(settings, 'PAGE_IMAGE_QUALITY', 85))
+
+
+def watermarked_path(source, user):
+    """Ruta en caché de la versión de ``source`` (PDF o imagen) marcada para ``user`` hoy (se genera si no existe)"""
+    day = localdate()
+    cache = watermark_cache()
+    key = watermark_key(source, user, day)
+    path = cache.get(key)
+    if path is None:
+        path = cache.put(key, _stamp(source, watermark_text(user, day)))
+    return path
+
+
+def open_watermarked(source, user):
+    """Abre la versión de ``source`` marcada para ``user`` hoy, generándola si no está en caché.
+
+    Si la caché la desaloja apenas guardada (una entrada mayor que la caché,
+    o escrituras concurrentes), se entrega desde memoria.
+    """
+    try:
+        return open(watermarked_path(source, user), 'rb')
+    except FileNotFoundError:
+        return io.BytesIO(_stamp(source, watermark_text(user, localdate())))
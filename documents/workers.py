@@ -0,0 +1,140 @@
+"""Funciones para pools de procesos.
+
+No importan modelos ni configuración de Django: con el método ``spawn``
+(el predeterminado en macOS y Windows) cada proceso hijo importa el módulo
+de la función que ejecuta, y hacerlo sin ``django.setup()`` fallaría.
+"""
+import os
+import random
+from datetime import date, timedelta
+
+from .dates import SCAN_CHARS, extract_dates as extract_text_dates
+from .near_duplicates import signature as minhash
+from .ocr import iter_ocr_pages
+from .optimize import optimize_pdf as write_optimized_pdf, remove_blank_pages as write_without_blank_pages
+from .pdf_tools import extract_text as extract_pdf_text, normalize_text, read_metadata as read_pdf_metadata
+from .splitting import find_segments as find_pdf_segments
+
+SAMPLE_WORDS = (
+    'factura recibo estado cuenta pago total subtotal impuesto servicio cliente '
+    'contrato vencimiento fecha monto balance referencia invoice amount due date '
+    'electricidad agua teléfono seguro banco hipoteca renta mantenimiento'
+).split()
+
+
+def extract_text(item):
+    """``(id, ruta, máx. caracteres)`` → ``(id, texto, páginas)``, o ``(id, None, error)``"""
+    document_id, path, max_chars = item
+    try:
+        text, pages = extract_pdf_text(path, max_chars=max_chars)
+    except Exception as e:
+        return document_id, None, str(e)
+    return document_id, normalize_text(text), pages
+
+
+def read_metadata(item):
+    """``(id, ruta)`` → ``(id, metadatos, None)``, o ``(id, None, error)``"""
+    document_id, path = item
+    try:
+        return document_id, read_pdf_metadata(path), None
+    except Exception as e:
+        return document_id, None, str(e)
+
+
+def extract_dates(item):
+    """``(id, texto o None, ruta, día primero, hoy)`` → ``(id, fechas, None)``, o ``(id, None, error)``.
+
+    Si el documento aún no tiene texto guardado se lee del PDF.
+    """
+    document_id, text, path, day_first, today = item
+    try:
+        if text is None:
+            text, _ = extract_pdf_text(path, max_chars=SCAN_CHARS)
+        return document_id, extract_text_dates(text, day_first=day_first, today=today), None
+    except Exception as e:
+        return document_id, None, str(e)
+
+
+def minhash_signature(item):
+    """``(id, texto)`` → ``(id, firma MinHash o None, trigramas)``"""
+    document_id, text = item
+    return (document_id, *minhash(text))
+
+
+def optimize_pdf(item):
+    """``(id, origen, destino, calidad, dpi máx.)`` → ``(id, resultado, None)``, o ``(id, None, error)``"""
+    document_id, source, destination, quality, max_dpi = item
+    try:
+        return document_id, write_optimized_pdf(source, destination, quality=quality, max_dpi=max_dpi), None
+    except Exception as e:
+        return document_id, None, str(e)
+
+
+def find_segments(item):
+    """``(id, ruta, opciones de división)`` → ``(id, segmentos, None)``, o ``(id, None, error)``"""
+    document_id, path, options = item
+    try:
+        return document_id, find_pdf_segments(path, **options), None
+    except Exception as e:
+        return document_id, None, str(e)
+
+
+def remove_blank_pages(item):
+    """``(id, origen, destino, umbral)`` → ``(id, resultado o None, None)``, o ``(id, None, error)``"""
+    document_id, source, destination, blank_threshold = item
+    try:
+        return document_id, write_without_blank_pages(source, destination, blank_threshold), None
+    except Exception as e:
+        return document_id, None, str(e)
+
+
+def lower_priority(niceness):
+    """Inicializador del pool: baja la prioridad del proceso (tesseract la hereda)"""
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+def ocr_pages(item):
+    """``(id, ruta, páginas, opciones de OCR)`` → ``(id, [(página, texto, origen)], error o None)``.
+
+    Si falla a mitad se retornan también las páginas ya reconocidas, para
+    guardarlas y no repetirlas en la siguiente corrida.
+    """
+    document_id, path, pages, options = item
+    results = []
+    try:
+        for result in iter_ocr_pages(path, pages, **options):
+            results.append(result)
+    except Exception as e:
+        return document_id, results, str(e)
+    return document_id, results, None
+
+
+def generate_sample_pdf(args):
+    """Genera un PDF sintético tipo factura o escaneo para pruebas de rendimiento"""
+    path, pages, image_pages, seed = args
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(seed)
+    pdf = canvas.Canvas(str(path), pagesize=letter)
+    width, height = letter
+    for page in range(pages):
+        if image_pages:
+            from PIL import Image
+            from reportlab.lib.utils import ImageReader
+
+            # Ruido en escala de grises para simular el peso de una página escaneada
+            image = Image.frombytes('L', (400, 520), rng.randbytes(400 * 520))
+            pdf.drawImage(ImageReader(image), 36, 36, width - 72, height - 72)
+        else:
+            text = pdf.beginText(50, height - 60)
+            issued = date(2020, 1, 1) + timedelta(days=rng.randrange(2000))
+            text.textLine(f'Fecha: {issued.strftime("%d/%m/%Y")}   Página {page + 1} de {pages}')
+            for _ in range(40):
+                text.textLine(' '.join(rng.choice(SAMPLE_WORDS) for _ in range(12)))
+            text.textLine(f'Total: ${rng.randrange(10, 5000)}.{rng.randrange(100):02d}')
+            pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+    return path.stat().st_size
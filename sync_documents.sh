@@ -13,4 +13,7 @@ cd "$PROJECT_PATH"
 echo "$(date): Iniciando sincronización de documentos..."
 $VENV_PATH manage.py sync_documents
 
+# Etapas posteriores (miniaturas, texto...) en un proceso aparte, después de importar
+$VENV_PATH manage.py process_pipeline --once
+
 echo "$(date): Sincronización completada."
\ No newline at end of file
@@ -7,6 +7,7 @@ PROJECT_PATH="/Users/ricardovazquez/Documents/GitHub/DocTrac"
 VENV_PATH="$PROJECT_PATH/.venv/bin/python"
 LOG_FILE="/tmp/doctrac_sync.log"
 WORK_FOLDER="$HOME/Documents/Main/WorkFolder"
+SYNC_WORKERS=4  # Hilos para mover/copiar archivos en paralelo
 
 # Función para logging con timestamp
 log() {
@@ -31,7 +32,7 @@ else
     log "📄 Encontrados $PDF_COUNT documentos para procesar"
     
     # Ejecutar la sincronización y capturar la salida
-    SYNC_OUTPUT=$($VENV_PATH manage.py sync_documents 2>&1)
+    SYNC_OUTPUT=$($VENV_PATH manage.py sync_documents --workers "$SYNC_WORKERS" 2>&1)
     SYNC_EXIT_CODE=$?
     
     if [ $SYNC_EXIT_CODE -eq 0 ]; then